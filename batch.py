@@ -0,0 +1,367 @@
+# -------------------------------
+# Name: Tetris batch simulator
+# Author: Jasper Keijzer
+# Language: Python 3.6.9
+#
+# Plays many games in lockstep by holding all boards in NumPy arrays.
+# Every board is a row of integer bitmasks, exactly like the BitBoard of
+# the engine, and every rule of TetrisEngine (collisions, rotations with
+# kicks, hover, spin, settling, clearing, scoring and levelling up) is
+# applied to all boards at once. Lost games are recorded and restarted
+# without stalling the other boards
+# -------------------------------
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+    print('The numpy module cannot be found or is not installed\nThe batch simulator will not work')
+from engine import ACTIONS, LEVEL_TICKRATES, LINE_SCORES
+from pieces import ORIENTATIONS
+
+# The piece names, the index of a piece in this string is used as its number
+KEYS = 'SZJLOIT'
+# The action numbers accepted by BatchTetris.step(), 0 means do nothing
+BATCH_ACTIONS = (None,) + ACTIONS
+LEFT, RIGHT, DOWN, ROTATE_LEFT, ROTATE_RIGHT, SNAP_LEFT, SNAP_RIGHT, SNAP_DOWN = range(1, 9)
+# Hover and spin both last 500 milliseconds, like in Shape
+HOVER_TIME = SPIN_TIME = 500
+
+def build_tables():
+    '''
+    Returns a dict of NumPy lookup tables made from the piece orientations,
+    indexed by [piece number, orientation index, ...]
+    '''
+    masks = np.zeros((7, 4, 4), dtype=np.int64)
+    widths = np.zeros((7, 4), dtype=np.int64)
+    heights = np.zeros((7, 4), dtype=np.int64)
+    spawn_rows = np.zeros((7, 4), dtype=np.int64)
+    spawn_rotation_indices = np.zeros((7, 4), dtype=np.int64)
+    rotates = np.zeros(7, dtype=bool)
+    # [direction (0 is left, 1 is right), piece, orientation, rotation index, ...]
+    next_orientations = np.zeros((2, 7, 4, 4), dtype=np.int64)
+    next_rotation_indices = np.zeros((2, 7, 4, 4), dtype=np.int64)
+    offsets = np.zeros((2, 7, 4, 4, 9, 2), dtype=np.int64)
+    for number, key in enumerate(KEYS):
+        rotates[number] = bool(ORIENTATIONS[key][0].right)
+        for orientation in ORIENTATIONS[key]:
+            index = orientation.index
+            masks[number, index, :orientation.height] = orientation.masks
+            widths[number, index] = orientation.width
+            heights[number, index] = orientation.height
+            spawn_rows[number, index] = orientation.spawn_row
+            spawn_rotation_indices[number, index] = orientation.spawn_rotation_index
+            for direction, rotations in enumerate((orientation.left, orientation.right)):
+                for rotation_index, (new, new_index, new_offsets) in enumerate(rotations):
+                    next_orientations[direction, number, index, rotation_index] = new.index
+                    next_rotation_indices[direction, number, index, rotation_index] = new_index
+                    offsets[direction, number, index, rotation_index] = new_offsets
+    return {'masks':masks, 'widths':widths, 'heights':heights,
+            'spawn_rows':spawn_rows, 'spawn_rotation_indices':spawn_rotation_indices,
+            'rotates':rotates, 'next_orientations':next_orientations,
+            'next_rotation_indices':next_rotation_indices, 'offsets':offsets}
+
+class BatchTetris():
+    def __init__(self, boards, random_mode=False, spin=False, hover=True,
+                 seed=None, auto_reset=True, board_width=10, board_height=24, spawn_rows=4):
+        '''
+        Parameters:
+            boards (int): the number of games to play at once
+            random_mode (bool): pick pieces completely random instead of from a bag of 7
+            spin (bool): hold the piece in place while it is spinning
+            hover (bool): allow the piece to hover a while before it settles
+            seed: seed for the random number generator, None for a random seed
+            auto_reset (bool): record and restart lost games at the end of every call
+            board_width (int): the number of columns, at most 62
+            board_height (int): the number of rows
+            spawn_rows (int): the number of rows at the top of the board the pieces spawn in,
+                the game is lost when a piece settles in them
+        '''
+        if np is None:
+            raise ImportError('BatchTetris needs the numpy module')
+        if board_width > 62: # every row is an int64 bitmask, which keeps clear of the sign bit
+            raise ValueError('the batch simulator holds at most 62 columns, not {}'.format(board_width))
+        self.boards = boards
+        self.random = random_mode
+        self.spin = spin
+        self.hover = hover
+        self.auto_reset = auto_reset
+        self.board_width = board_width
+        self.board_height = board_height
+        self.spawn_rows = spawn_rows
+        self.full = (1 << board_width) - 1 # the bitmask of a full row
+        self.rng = np.random.default_rng(seed)
+        self.tables = build_tables()
+        self.level_tickrates = np.array(LEVEL_TICKRATES, dtype=np.int64)
+        self.line_scores = np.array((0,) + LINE_SCORES, dtype=np.int64)
+        # Summaries of finished games as tuples of (score, lines, level, pieces)
+        self.results = []
+        self.rows = np.zeros((boards, board_height), dtype=np.int64)
+        for name in ('score', 'cleared_lines', 'level', 'levelup', 'tickrate', 'pieces',
+                     'now', 'hover_time', 'spin_time', 'preview_time',
+                     'key', 'orientation', 'rotation_index', 'row', 'column',
+                     'preview_key', 'preview_orientation', 'bag_size'):
+            setattr(self, name, np.zeros(boards, dtype=np.int64))
+        self.bag = np.zeros((boards, 7), dtype=np.int64)
+        self.piece_is_active = np.zeros(boards, dtype=bool)
+        self.game_over = np.zeros(boards, dtype=bool)
+        self.new_game(np.ones(boards, dtype=bool))
+
+    def new_game(self, mask):
+        '''
+        Resets the boards, scores and levels and picks the first pieces
+        Parameter:
+            mask (array): boolean array, True for every board to reset
+        '''
+        self.rows[mask] = 0
+        for name in ('score', 'cleared_lines', 'level', 'levelup', 'pieces', 'bag_size'):
+            getattr(self, name)[mask] = 0
+        self.tickrate[mask] = self.level_tickrates[0]
+        self.piece_is_active[mask] = False
+        self.game_over[mask] = False
+        self.preview(np.flatnonzero(mask))
+
+    def reset_lost(self):
+        '''
+        Record the results of all lost games and start new games on their boards
+        '''
+        lost = np.flatnonzero(self.game_over)
+        if len(lost):
+            self.results.extend(zip(self.score[lost].tolist(), self.cleared_lines[lost].tolist(),
+                                    self.level[lost].tolist(), self.pieces[lost].tolist()))
+            self.new_game(self.game_over.copy())
+
+    def preview(self, idx):
+        '''
+        Picks the next piece of the given boards
+        Parameter:
+            idx (array): indices of the boards
+        '''
+        if self.random: # randomly pick a piece
+            keys = self.rng.integers(0, 7, len(idx))
+        else: # pick a piece from a bag of 7 WITHOUT replacement
+            empty = idx[self.bag_size[idx] == 0]
+            if len(empty): # Put the 7 pieces in random order
+                self.bag[empty] = self.rng.random((len(empty), 7)).argsort(axis=1)
+                self.bag_size[empty] = 7
+            self.bag_size[idx] -= 1
+            keys = self.bag[idx, self.bag_size[idx]]
+        self.preview_key[idx] = keys
+        self.preview_orientation[idx] = self.rng.integers(0, 4, len(idx)) # randomly rotate the shape
+        self.preview_time[idx] = self.now[idx]
+
+    def collides(self, idx, key, orientation, row, column):
+        '''
+        Returns a boolean array, True where a piece at the given position is (partly)
+        off the board or overlaps a settled square
+        Parameters:
+            idx (array): indices of the boards
+            key, orientation, row, column (array): the piece number, orientation and position per board
+        '''
+        tables = self.tables
+        masks = tables['masks'][key, orientation]
+        off_board = ((row < 0) | (column < 0)
+                     | (row + tables['heights'][key, orientation] > self.board_height)
+                     | (column + tables['widths'][key, orientation] > self.board_width))
+        # Rows of the piece that are off the board are clipped, they have already been caught above
+        rows = np.clip(row[:, None] + np.arange(4), 0, self.board_height-1)
+        shifted = masks << np.clip(column, 0, self.board_width)[:, None]
+        return off_board | (self.rows[idx[:, None], rows] & shifted).any(axis=1)
+
+    def move(self, idx, orientation, row, column):
+        '''
+        Move the pieces of the given boards, restarting the hover timer if the row changed
+        Parameters:
+            idx (array): indices of the boards
+            orientation, row, column (array): the new orientation and position per board
+        '''
+        self.hover_time[idx] = np.where(row != self.row[idx], self.now[idx], self.hover_time[idx])
+        self.orientation[idx] = orientation
+        self.row[idx] = row
+        self.column[idx] = column
+
+    def step(self, actions):
+        '''
+        Perform one action on every board
+        Parameter:
+            actions (array): an action number from BATCH_ACTIONS for every board
+        '''
+        actions = np.asarray(actions)
+        active = self.piece_is_active
+        for direction, action in ((-1, LEFT), (1, RIGHT)):
+            self.shift(np.flatnonzero(active & (actions == action)), 0, direction)
+        self.shift(np.flatnonzero(active & (actions == DOWN)), 1, 0)
+        for direction, action in ((0, ROTATE_LEFT), (1, ROTATE_RIGHT)):
+            self.rotate(np.flatnonzero(active & (actions == action)), direction)
+        for direction, action in ((-1, SNAP_LEFT), (1, SNAP_RIGHT)):
+            self.snap(np.flatnonzero(active & (actions == action)), 0, direction)
+        self.snap(np.flatnonzero(active & (actions == SNAP_DOWN)), 1, 0)
+        if self.auto_reset:
+            self.reset_lost()
+
+    def tick(self):
+        '''
+        Advance every board by its own tickrate: spawn a piece where there is none,
+        otherwise shift the active piece down one row
+        '''
+        self.now += self.tickrate
+        idle = ~self.piece_is_active & ~self.game_over
+        falling = self.piece_is_active.copy()
+        if self.spin: # hold pieces in place while they are spinning
+            falling &= self.now - self.spin_time >= SPIN_TIME
+        self.spawn(np.flatnonzero(idle))
+        self.shift(np.flatnonzero(falling), 1, 0)
+        if self.auto_reset:
+            self.reset_lost()
+
+    def shift(self, idx, down, sideways):
+        '''
+        Shift the active pieces of the given boards one square
+        and settle pieces that could not move down
+        Parameters:
+            idx (array): indices of the boards
+            down (int): 1 to move down, otherwise 0
+            sideways (int): -1 to move left, 1 to move right, otherwise 0
+        '''
+        if not len(idx):
+            return
+        key = self.key[idx]
+        orientation = self.orientation[idx]
+        row = self.row[idx] + down
+        column = self.column[idx] + sideways
+        blocked = self.collides(idx, key, orientation, row, column)
+        moved = idx[~blocked]
+        self.move(moved, orientation[~blocked], row[~blocked], column[~blocked])
+        if down:
+            # settle pieces that are blocked and NOT(the feature is on and they are hovering)
+            stuck = idx[blocked]
+            if self.hover:
+                stuck = stuck[self.now[stuck] - self.hover_time[stuck] >= HOVER_TIME]
+            self.settle(stuck)
+
+    def rotate(self, idx, direction):
+        '''
+        Rotates the active pieces of the given boards 90 degrees, trying every kick in order
+        Parameters:
+            idx (array): indices of the boards
+            direction (int): 0 for anticlockwise or 1 for clockwise
+        '''
+        tables = self.tables
+        key = self.key[idx]
+        # Squares don't rotate, but still restart the spin timer for the easyspin delay mechanic
+        self.spin_time[idx[~tables['rotates'][key]]] = self.now[idx[~tables['rotates'][key]]]
+        idx = idx[tables['rotates'][key]]
+        if not len(idx):
+            return
+        key = self.key[idx]
+        orientation = self.orientation[idx]
+        rotation_index = self.rotation_index[idx]
+        new_orientation = tables['next_orientations'][direction, key, orientation, rotation_index]
+        new_rotation_index = tables['next_rotation_indices'][direction, key, orientation, rotation_index]
+        offsets = tables['offsets'][direction, key, orientation, rotation_index]
+        pending = np.ones(len(idx), dtype=bool)
+        for attempt in range(offsets.shape[1]):
+            todo = np.flatnonzero(pending)
+            if not len(todo):
+                break
+            row = self.row[idx[todo]] + offsets[todo, attempt, 0]
+            column = self.column[idx[todo]] + offsets[todo, attempt, 1]
+            fits = ~self.collides(idx[todo], key[todo], new_orientation[todo], row, column)
+            done = todo[fits]
+            self.move(idx[done], new_orientation[done], row[fits], column[fits])
+            self.rotation_index[idx[done]] = new_rotation_index[done]
+            self.spin_time[idx[done]] = self.now[idx[done]]
+            pending[done] = False
+
+    def snap(self, idx, down, sideways):
+        '''
+        Move the pieces of the given boards as far down, left or right as possible
+        and settle them if they were snapped down
+        Parameters:
+            idx (array): indices of the boards
+            down (int): 1 to move down, otherwise 0
+            sideways (int): -1 to move left, 1 to move right, otherwise 0
+        '''
+        if not len(idx):
+            return
+        key = self.key[idx]
+        orientation = self.orientation[idx]
+        row = self.row[idx].copy()
+        column = self.column[idx].copy()
+        moving = np.arange(len(idx))
+        while len(moving):
+            blocked = self.collides(idx[moving], key[moving], orientation[moving],
+                                    row[moving] + down, column[moving] + sideways)
+            moving = moving[~blocked]
+            row[moving] += down
+            column[moving] += sideways
+        self.move(idx, orientation, row, column)
+        if down:
+            self.settle(idx)
+
+    def settle(self, idx):
+        '''
+        Settle the active pieces of the given boards, clear full rows, update the
+        scores and levels and end the games that reached the top 4 rows
+        Parameter:
+            idx (array): indices of the boards
+        '''
+        if not len(idx):
+            return
+        tables = self.tables
+        self.piece_is_active[idx] = False
+        key = self.key[idx]
+        orientation = self.orientation[idx]
+        masks = tables['masks'][key, orientation] << self.column[idx][:, None]
+        for y in range(4):
+            has_row = y < tables['heights'][key, orientation]
+            self.rows[idx[has_row], self.row[idx[has_row]] + y] |= masks[has_row, y]
+        full = self.rows[idx] == self.full
+        lines = full.sum(axis=1)
+        cleared = lines > 0
+        if cleared.any():
+            clear_idx = idx[cleared]
+            full = full[cleared]
+            lines = lines[cleared]
+            # Move the full rows to the top while keeping the order of the other rows,
+            # then empty them
+            order = np.argsort(~full, axis=1, kind='stable')
+            rows = np.take_along_axis(self.rows[clear_idx], order, axis=1)
+            rows[np.arange(self.board_height) < lines[:, None]] = 0
+            self.rows[clear_idx] = rows
+            self.cleared_lines[clear_idx] += lines
+            self.levelup[clear_idx] += lines
+            levelled = clear_idx[self.levelup[clear_idx] >= 10]
+            # level up for every 10 lines cleared
+            self.level[levelled] = self.cleared_lines[levelled]//10
+            self.levelup[levelled] -= 10
+            # Don't increase tickrate past level 30
+            capped = levelled[self.level[levelled] <= 30]
+            self.tickrate[capped] = self.level_tickrates[self.level[capped]]
+            # Update the score, +1 because we start at level 0
+            multiplier = self.level[clear_idx] + 1
+            self.score[clear_idx] += self.line_scores[lines]*multiplier
+            # give a bonus score for clearing the board
+            self.score[clear_idx] += 1200*multiplier*~self.rows[clear_idx].any(axis=1)
+        # Lose if there is any square in the spawn rows
+        self.game_over[idx] = self.rows[idx, :self.spawn_rows].any(axis=1)
+
+    def spawn(self, idx):
+        '''
+        Spawn the preview pieces in the given boards and pick new preview pieces
+        Parameter:
+            idx (array): indices of the boards
+        '''
+        if not len(idx):
+            return
+        tables = self.tables
+        key = self.key[idx] = self.preview_key[idx]
+        orientation = self.orientation[idx] = self.preview_orientation[idx]
+        self.row[idx] = tables['spawn_rows'][key, orientation]
+        # start the shape in the middle of the board
+        self.column[idx] = (self.board_width - tables['widths'][key, orientation])//2
+        self.rotation_index[idx] = tables['spawn_rotation_indices'][key, orientation]
+        self.hover_time[idx] = self.spin_time[idx] = self.preview_time[idx]
+        self.piece_is_active[idx] = True
+        self.pieces[idx] += 1
+        self.preview(idx)
@@ -0,0 +1,360 @@
+# -------------------------------
+# Name: Tetris benchmarks
+# Author: Jasper Keijzer
+# Language: Python 3.6.9
+#
+# Times the rotation of 2D arrays, the engine primitives on fixed boards
+# and whole scripted games, all headless and with fixed seeds. Results
+# can be saved as JSON and compared against a saved baseline, failing
+# when any benchmark became slower than the allowed factor.
+# bench_baseline.json holds reference results, see the README
+# Usage: python bench.py [--save results.json] [--baseline bench_baseline.json]
+# -------------------------------
+
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import timeit
+from engine import Shape, TetrisEngine
+import matrix_rotation
+from matrix_rotation import rotate_array, rotate_array_cached, rotate_arrays
+from pieces import ORIENTATIONS, SHAPES
+from policies import flat_policy
+from randomizers import deal, make_randomizer
+from sweep import play_game
+from terminal import TerminalView
+
+# Benchmark functions by name. Each one sets up its fixture and
+# returns the function to time, see benchmark()
+BENCHMARKS = {}
+# The seed of every game that is played
+SEED = 0
+
+# Fixture boards, from the top down to the bottom row. Rows that are not given are empty
+MESSY = ['..........',
+         '...x......',
+         '..xx.....x',
+         'x.xxx...xx',
+         'xx.xxx.xxx',
+         'xxxxx.xxxx',
+         'xxx.xxxxxx',
+         'xxxxxxx.xx']
+WELL = ['.xxxxxxxxx'] # a full row except for the first column, repeated
+# Size of the large board, on which the primitives should cost about as much as on the normal one
+LARGE_WIDTH = 100
+LARGE_HEIGHT = 400
+
+def benchmark(name):
+    '''
+    Returns a decorator that adds a function to BENCHMARKS
+    Parameter:
+        name (str): the name of the benchmark
+    '''
+    def register(function):
+        BENCHMARKS[name] = function
+        return function
+    return register
+
+def make_engine(board=(), board_width=10, board_height=24):
+    '''
+    Returns a TetrisEngine with a fixed seed and clock, with the given settled squares
+    Parameters:
+        board (list): strings with an 'x' for every settled square, see MESSY.
+            Columns that are not given are empty
+        board_width (int): the number of columns of the board
+        board_height (int): the number of rows of the board
+    '''
+    engine = TetrisEngine(seed=SEED, clock=lambda: 0.0,
+                          board_width=board_width, board_height=board_height)
+    rows = engine.bitboard.rows
+    offset = engine.board_height - len(board)
+    for y, line in enumerate(board):
+        rows[offset + y] = sum(1 << x for x, cell in enumerate(line) if cell == 'x')
+    engine.bitboard.recompute_tops()
+    return engine
+
+def set_piece(engine, key, index, row, column):
+    '''
+    Make a piece the active piece of an engine
+    Parameters:
+        engine (TetrisEngine): the engine
+        key (str): the name of the piece
+        index (int): the number of clockwise quarter turns of the piece
+        row (int): the row of the piece
+        column (int): the column of the piece
+    '''
+    orientation = ORIENTATIONS[key][index]
+    piece = Shape(orientation, row, column, engine.clock)
+    piece.rotation_index = orientation.spawn_rotation_index
+    engine.active_piece = piece
+    engine.piece_is_active = True
+    return piece
+
+@benchmark('rotate_array_square')
+def bench_rotate_square():
+    array = [[1, 2, 3, 4], [5, 6, 7, 8], [9, 10, 11, 12], [13, 14, 15, 16]]
+    return lambda: (rotate_array(array, 90), rotate_array(array, 180), rotate_array(array, 270))
+
+@benchmark('rotate_array_rect')
+def bench_rotate_rect():
+    array = SHAPES['L']
+    return lambda: (rotate_array(array, 90), rotate_array(array, 180), rotate_array(array, 270))
+
+@benchmark('rotate_array_diamond')
+def bench_rotate_diamond():
+    array = [[1], [2, 3], [4, 5, 6], [7, 8], [9]]
+    return lambda: (rotate_array(array, 45), rotate_array(array, 90), rotate_array(array, 135))
+
+@benchmark('rotate_array_cached')
+def bench_rotate_cached():
+    array = tuple(map(tuple, SHAPES['L']))
+    return lambda: (rotate_array_cached(array, 90), rotate_array_cached(array, 180),
+                    rotate_array_cached(array, 270))
+
+@benchmark('rotate_arrays')
+def bench_rotate_batch():
+    arrays = [tuple(map(tuple, shape)) for shape in SHAPES.values()]
+    return lambda: rotate_arrays(arrays, 90)
+
+try:
+    import numpy
+except ImportError:
+    numpy = None # the NumPy views are not timed
+
+if numpy is not None:
+    @benchmark('rotate_view')
+    def bench_rotate_view():
+        array = numpy.arange(64*64).reshape(64, 64)
+        return lambda: (matrix_rotation.rotate_view(array, 90), matrix_rotation.rotate_view(array, 180),
+                        matrix_rotation.rotate_view(array, 270))
+
+@benchmark('check')
+def bench_check():
+    engine = make_engine(MESSY)
+    orientation = ORIENTATIONS['T'][0]
+    return lambda: (engine.check(orientation, 14, 3), engine.check(orientation, 18, 3))
+
+@benchmark('move')
+def bench_move():
+    engine = make_engine(MESSY)
+    piece = set_piece(engine, 'T', 0, 4, 3)
+    orientation = piece.orientation
+    return lambda: (engine.move(orientation, 5, 4), engine.move(orientation, 4, 3))
+
+@benchmark('rotate_kick')
+def bench_rotate_kick():
+    # A vertical I piece next to the left wall, which only fits horizontally when kicked
+    engine = make_engine(MESSY)
+    def rotate():
+        set_piece(engine, 'I', 0, 4, 1)
+        engine.rotate('right')
+    return rotate
+
+@benchmark('snap_sideways')
+def bench_snap():
+    engine = make_engine(MESSY)
+    set_piece(engine, 'T', 0, 4, 3)
+    return lambda: (engine.snap('left'), engine.snap('right'))
+
+def bench_settle(lines, board_width=10, board_height=24):
+    '''
+    Returns a function that drops a vertical I piece in a well of the given depth and settles it
+    Parameters:
+        lines (int): the number of lines the piece clears
+        board_width (int): the number of columns of the board
+        board_height (int): the number of rows of the board
+    '''
+    board = (['.x.' + 'x'*(board_width - 3)] * (4 - lines)
+                + ['.' + 'x'*(board_width - 1)] * lines)
+    engine = make_engine(board, board_width, board_height)
+    fixture = engine.bitboard
+    row = engine.board_height - 4
+    def settle():
+        engine.bitboard = fixture.copy()
+        set_piece(engine, 'I', 0, row, 0)
+        engine.settle()
+    return settle
+
+for lines in range(1, 5):
+    benchmark('settle_{}'.format(lines))(lambda lines=lines: bench_settle(lines))
+benchmark('settle_4_large')(lambda: bench_settle(4, LARGE_WIDTH, LARGE_HEIGHT))
+
+@benchmark('terminal_frame')
+def bench_terminal_frame():
+    # Two frames of a piece snapping from wall to wall, drawn for a terminal that discards them
+    engine = make_engine(MESSY)
+    view = TerminalView(engine, open(os.devnull, 'w', encoding='utf-8'))
+    view.frame()
+    set_piece(engine, 'T', 0, 4, 3)
+    def frames():
+        engine.snap('left')
+        view.frame()
+        engine.snap('right')
+        view.frame()
+    return frames
+
+@benchmark('placements')
+def bench_placements():
+    engine = make_engine(MESSY)
+    set_piece(engine, 'T', 0, 0, 3)
+    return engine.placements
+
+@benchmark('placements_large')
+def bench_placements_large():
+    engine = make_engine(MESSY, LARGE_WIDTH, LARGE_HEIGHT)
+    set_piece(engine, 'T', 0, 0, (LARGE_WIDTH - 3)//2)
+    return engine.placements
+
+@benchmark('placements_game')
+def bench_placements_game():
+    # The boards the active piece spawns on in the first 100 pieces of a game, which are
+    # more typical than MESSY. Where this was written, a call took 0.35 ms in the median,
+    # 0.54 ms at the 90th percentile and 0.76 ms at most on these boards, and bumpier
+    # stacks cost more. That is not well under a millisecond on slower machines
+    engines = []
+    engine = TetrisEngine(seed=SEED, clock=lambda: 0.0)
+    rng = random.Random(SEED)
+    while engine.pieces < 100 and not engine.game_over:
+        engine.tick() # spawns the next piece
+        engines.append(engine.fork())
+        for action in flat_policy(engine, rng):
+            engine.step(action)
+            if not engine.piece_is_active:
+                break
+    return lambda: [engine.placements() for engine in engines]
+
+@benchmark('snapshot')
+def bench_snapshot():
+    engine = make_engine(MESSY)
+    set_piece(engine, 'T', 0, 4, 3)
+    return engine.snapshot
+
+@benchmark('restore')
+def bench_restore():
+    engine = make_engine(MESSY)
+    set_piece(engine, 'T', 0, 4, 3)
+    snapshot = engine.snapshot()
+    return lambda: engine.restore(snapshot)
+
+@benchmark('fork')
+def bench_fork():
+    engine = make_engine(MESSY)
+    set_piece(engine, 'T', 0, 4, 3)
+    return engine.fork
+
+def bench_deal(name):
+    '''
+    Returns a function that deals 1000 pieces from a randomizer
+    Parameter:
+        name (str): the name of the randomizer
+    '''
+    randomizer = make_randomizer(name, random.Random(SEED))
+    return lambda: deal(randomizer, 1000)
+
+for name in ('bag', 'random', 'history'):
+    benchmark('deal_{}'.format(name))(lambda name=name: bench_deal(name))
+
+@benchmark('game_flat')
+def bench_game_flat():
+    return lambda: play_game(SEED, 'flat', max_pieces=200)
+
+@benchmark('game_flat_large')
+def bench_game_flat_large():
+    return lambda: play_game(SEED, 'flat', max_pieces=20,
+                             board_width=LARGE_WIDTH, board_height=LARGE_HEIGHT)
+
+@benchmark('game_random')
+def bench_game_random():
+    return lambda: play_game(SEED, 'random')
+
+@benchmark('import_tetris')
+def bench_import():
+    # A fresh interpreter that imports the game without starting it, which
+    # must not pull in tkinter or pygame. Includes the interpreter startup
+    command = [sys.executable, '-c',
+               'import sys, tetris; sys.exit("tkinter" in sys.modules or "pygame" in sys.modules)']
+    directory = os.path.dirname(os.path.abspath(__file__))
+    return lambda: subprocess.run(command, cwd=directory, check=True)
+
+def run(names=None, repeat=5):
+    '''
+    Runs benchmarks and returns a dict with the results of each: the fastest and the median
+    time per call in microseconds and the number of calls per measurement
+    Parameters:
+        names (list): the names of the benchmarks to run, None for all of them
+        repeat (int): the number of measurements per benchmark
+    '''
+    results = {}
+    for name in names or BENCHMARKS:
+        timer = timeit.Timer(BENCHMARKS[name]())
+        number, _ = timer.autorange() # enough calls to take at least 0.2 seconds
+        times = sorted(timer.repeat(repeat, number))
+        results[name] = {'best_us':times[0]/number*1000000,
+                         'median_us':times[len(times)//2]/number*1000000,
+                         'number':number}
+    return results
+
+def compare(results, baseline, max_slowdown):
+    '''
+    Returns a list of (name, slowdown) for every benchmark that is more than
+    max_slowdown times slower than in the baseline, comparing the best times
+    Parameters:
+        results (dict): the results of run()
+        baseline (dict): results of an earlier run
+        max_slowdown (float): the allowed factor, e.g. 1.5 for 50% slower
+    '''
+    regressions = []
+    for name, result in results.items():
+        if name in baseline:
+            slowdown = result['best_us']/baseline[name]['best_us']
+            if slowdown > max_slowdown:
+                regressions.append((name, slowdown))
+    return regressions
+
+def main(argv=None):
+    '''
+    Runs the benchmarks from the command line, returns the exit code
+    Parameter:
+        argv (list): the command line arguments, defaulting to sys.argv[1:]
+    '''
+    parser = argparse.ArgumentParser(description='Benchmark the Tetris engine headless')
+    parser.add_argument('names', nargs='*',
+                        help='benchmarks to run, out of {}'.format(', '.join(BENCHMARKS)))
+    parser.add_argument('--repeat', type=int, default=5, help='measurements per benchmark')
+    parser.add_argument('--save', help='write the results to this JSON file')
+    parser.add_argument('--baseline', help='compare the results to this JSON file')
+    parser.add_argument('--max-slowdown', type=float, default=1.5,
+                        help='fail if a benchmark is this many times slower than the baseline')
+    args = parser.parse_args(argv)
+    for name in args.names:
+        if name not in BENCHMARKS:
+            parser.error('unknown benchmark: {}'.format(name))
+    results = run(args.names, args.repeat)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)['results']
+    for name, result in results.items():
+        line = '{:<22}{:>14.2f} us'.format(name, result['best_us'])
+        if baseline and name in baseline:
+            line += '{:>8.2f}x'.format(result['best_us']/baseline[name]['best_us'])
+        print(line)
+    if args.save:
+        with open(args.save, 'w') as file:
+            json.dump({'python':platform.python_version(),
+                       'machine':platform.machine(),
+                       'results':results}, file, indent=2)
+    if baseline:
+        regressions = compare(results, baseline, args.max_slowdown)
+        for name, slowdown in regressions:
+            print('{} is {:.2f} times slower than the baseline'.format(name, slowdown))
+        if regressions:
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,260 @@
+# -------------------------------
+# Name: Tetris bitboard
+# Author: Jasper Keijzer
+# Language: Python 3.6.9
+#
+# Stores every row of the board as an integer bitmask, where bit x
+# is set if column x of the row is occupied by a settled square.
+# Collisions become a few ANDs, a full row is a single equality test
+# and clearing lines is a matter of list slices. Apart from the tops of
+# the columns, nothing looks at more rows than the piece or the cleared
+# lines touch, so the cost does not grow with the height of the board
+# -------------------------------
+
+# Cache of row bitmasks for every 2D array shape that has been seen
+_masks = {}
+
+def shape_masks(shape):
+    '''
+    Returns a tuple with a bitmask for each row of a shape, where bit x
+    is set if column x of that row is filled
+    Parameter:
+        shape (2D list): the 2D array representation of a piece
+    '''
+    key = tuple(map(tuple, shape))
+    masks = _masks.get(key)
+    if masks is None:
+        masks = _masks[key] = tuple(sum(1 << x for x, cell in enumerate(row) if cell)
+                                    for row in shape)
+    return masks
+
+class BitBoard():
+    def __init__(self, width, height):
+        '''
+        width is the number of columns of the board
+        height is the number of rows of the board
+        '''
+        self.width = width
+        self.height = height
+        self.full = (1 << width) - 1 # the bitmask of a full row
+        self.rows = [0] * height
+        # tops holds the index of the highest settled square in each column,
+        # or height if the column is empty. It is kept up to date by place() and clear()
+        self.tops = [height] * width
+
+    def copy(self):
+        '''
+        Returns a new BitBoard with the same settled squares
+        '''
+        board = BitBoard.__new__(BitBoard)
+        board.width = self.width
+        board.height = self.height
+        board.full = self.full
+        board.rows = self.rows[:]
+        board.tops = self.tops[:]
+        return board
+
+    def collides(self, masks, row, column, width):
+        '''
+        Return True if a shape placed at the given position is (partly) off the board
+        or overlaps a settled square
+        Parameters:
+            masks (tuple): the row bitmasks of the shape
+            row (int): the row of the shape
+            column (int): the column of the shape
+            width (int): the (horizontal) width of the shape
+        '''
+        if (row < 0 or column < 0 or row + len(masks) > self.height
+            or column + width > self.width):
+            return True
+        rows = self.rows
+        for mask in masks:
+            if rows[row] & (mask << column):
+                return True
+            row += 1
+        return False
+
+    def place(self, masks, row, column):
+        '''
+        Settle a shape on the board and return the indices of any full rows
+        it completed, in ascending order
+        Parameters:
+            masks (tuple): the row bitmasks of the shape
+            row (int): the row of the shape
+            column (int): the column of the shape
+        '''
+        rows = self.rows
+        tops = self.tops
+        full = self.full
+        line_numbers = []
+        for idx, mask in enumerate(masks, start=row):
+            rows[idx] |= mask << column
+            if rows[idx] == full:
+                line_numbers.append(idx)
+            # Lower the top of every column this row of the shape covers
+            x = column
+            while mask:
+                if mask & 1 and idx < tops[x]:
+                    tops[x] = idx
+                mask >>= 1
+                x += 1
+        return line_numbers
+
+    def clear(self, line_numbers):
+        '''
+        Remove the given rows and add as many empty rows on top
+        Parameter:
+            line_numbers (list): int indices of full rows in ascending order
+        '''
+        rows = self.rows
+        tops = self.tops
+        # Only the rows from the highest settled square down to the last cleared row change,
+        # the empty rows above them and the rows below them stay where they are
+        highest = min(tops)
+        kept = []
+        start = highest
+        for idx in line_numbers:
+            kept += rows[start:idx]
+            start = idx + 1
+        cleared = len(line_numbers)
+        rows[highest:start] = [0] * cleared + kept
+        # Full rows are full in every column, so the top of every column lies above the
+        # first cleared row or on it. Tops above it move down with the rows, tops on it have
+        # to be looked up again below the empty rows that moved down
+        first = line_numbers[0]
+        for x, top in enumerate(tops):
+            if top < first:
+                tops[x] = top + cleared
+            else:
+                top = first + cleared
+                while top < self.height and not rows[top] >> x & 1:
+                    top += 1
+                tops[x] = top
+
+    def add_garbage(self, lines, hole):
+        '''
+        Push every row up and add rows at the bottom that are full except for one column.
+        Squares pushed off the top of the board are lost
+        Parameters:
+            lines (int): the number of rows to add
+            hole (int): the column that is open in the added rows
+        '''
+        rows = self.rows
+        tops = self.tops
+        height = self.height
+        highest = min(tops)
+        # Rows above the highest settled square are empty, so only the rows from there on move
+        start = max(0, highest - lines)
+        rows[start:] = rows[start+lines:] + [self.full & ~(1 << hole)] * lines
+        if highest < lines: # squares were pushed off the top
+            self.recompute_tops()
+            return
+        for x, top in enumerate(tops):
+            if top < height:
+                tops[x] = top - lines
+            elif x != hole:
+                tops[x] = height - lines
+
+    def recompute_tops(self):
+        '''
+        Look up the top of every column again, needed after changing rows directly.
+        Goes down the rows until every column has been seen
+        '''
+        tops = self.tops
+        tops[:] = [self.height] * self.width
+        seen = 0
+        for row, mask in enumerate(self.rows):
+            new = mask & ~seen
+            if new:
+                seen |= new
+                while new: # the columns that have their top in this row
+                    low = new & -new
+                    tops[low.bit_length() - 1] = row
+                    new ^= low
+                if seen == self.full:
+                    break
+
+    def heights(self):
+        '''
+        Returns the height of the stack in each column, 0 for an empty column
+        '''
+        return [self.height - top for top in self.tops]
+
+    def drop_distance(self, orientation, row, column):
+        '''
+        Returns how many rows a shape can move down from a position it fits in before
+        it hits the floor or a settled square. Uses the tops of the columns, only falling
+        back to checking row by row when the shape is tucked below the top of a column
+        Parameters:
+            orientation (Orientation): the orientation of the shape
+            row (int): the row of the shape
+            column (int): the column of the shape
+        '''
+        tops = self.tops
+        distance = self.height
+        for x, bottom in enumerate(orientation.bottoms, start=column):
+            gap = tops[x] - row - bottom - 1
+            if gap < 0: # below the top of this column, so the top tells us nothing
+                distance = 0
+                while not self.collides(orientation.masks, row+distance+1, column, orientation.width):
+                    distance += 1
+                return distance
+            if gap < distance:
+                distance = gap
+        return distance
+
+    def slide_distance(self, orientation, row, column, direction):
+        '''
+        Returns how many columns a shape can move left or right from a position it fits in
+        before it hits a wall or a settled square
+        Parameters:
+            orientation (Orientation): the orientation of the shape
+            row (int): the row of the shape
+            column (int): the column of the shape
+            direction (int): -1 for left or 1 for right
+        '''
+        rows = self.rows
+        distance = self.width
+        if direction < 0:
+            for y, left in enumerate(orientation.lefts, start=row):
+                edge = column + left
+                # the squares left of the leftmost square of the shape in this row,
+                # the highest one of them is the closest
+                blockers = rows[y] & ((1 << edge) - 1)
+                distance = min(distance, edge - blockers.bit_length())
+        else:
+            for y, right in enumerate(orientation.rights, start=row):
+                edge = column + right
+                blockers = rows[y] >> (edge + 1)
+                if blockers: # the lowest square right of the shape is the closest
+                    distance = min(distance, (blockers & -blockers).bit_length() - 1)
+                else:
+                    distance = min(distance, self.width - edge - 1)
+        return distance
+
+    def is_empty(self):
+        '''
+        Return True if there are no settled squares on the board
+        '''
+        return min(self.tops) == self.height # every column is empty
+
+    def any_filled(self, rows):
+        '''
+        Return True if any of the first given number of rows holds a settled square
+        Parameter:
+            rows (int): the number of rows from the top to check
+        '''
+        return any(self.rows[:rows])
+
+    def as_strings(self, cells=()):
+        '''
+        Returns the board as a 2D list with 'x' for settled squares, '*' for the
+        squares of the active piece and '' for open spaces
+        Parameter:
+            cells (iterable): (row, column) tuples of the squares of the active piece
+        '''
+        board = [['x' if bits >> column & 1 else '' for column in range(self.width)]
+                    for bits in self.rows]
+        for row, column in cells:
+            board[row][column] = '*'
+        return board
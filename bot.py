@@ -0,0 +1,303 @@
+# -------------------------------
+# Name: Tetris beam search bot
+# Author: Jasper Keijzer
+# Language: Python 3.6.9
+#
+# Plays the active piece by looking a few pieces ahead: the pieces in the
+# queue are known, the pieces after them are one of the pieces left in the bag.
+# At every piece only the best few boards are searched further, boards
+# that were already valued are looked up in a cache, and the candidates
+# for the active piece can be spread over a pool of processes. The search
+# goes one piece deeper at a time until it runs out of time
+# -------------------------------
+
+import multiprocessing
+import time
+from bitboard import BitBoard
+from movegen import placements, spawn_state
+from pieces import ORIENTATIONS
+
+KEYS = 'SZJLOIT'
+# The value of a board on which the game is lost
+LOST = -1e9
+# Number of rows at the top of the board that end the game when filled by default,
+# see TetrisEngine.spawn_rows
+TOP_ROWS = 4
+# Number of boards the cache may hold before it is emptied
+CACHE_SIZE = 200000
+# Seconds before the budget of a decision runs out at which the search stops, which leaves
+# time to finish the step it is in, as long as a placements() call on a bumpy board
+MARGIN = 0.0015
+
+# Cache of search_value() results, by the settings of the search, the board, lines and plies
+_cache = {}
+
+class SearchTimeout(Exception):
+    '''
+    Raised when a search runs past its deadline
+    '''
+
+class Heuristic():
+    '''
+    Values a board as a weighted sum of the aggregate height of the columns, the number
+    of lines cleared to get there, the number of holes and the bumpiness (the sum of the
+    height differences between neighbouring columns). Higher is better
+    '''
+    def __init__(self, height=-0.510066, lines=0.760666, holes=-0.35663, bumpiness=-0.184483):
+        self.height = height
+        self.lines = lines
+        self.holes = holes
+        self.bumpiness = bumpiness
+
+    def weights(self):
+        '''
+        Returns the weights as a tuple
+        '''
+        return (self.height, self.lines, self.holes, self.bumpiness)
+
+    # Heuristics with the same weights value boards the same, also when one was copied
+    # to a worker process, so they share their entries in the cache
+    def __eq__(self, other):
+        return isinstance(other, Heuristic) and self.weights() == other.weights()
+
+    def __hash__(self):
+        return hash(self.weights())
+
+    def __call__(self, bitboard, lines):
+        '''
+        Returns the value of a board
+        Parameters:
+            bitboard (BitBoard): the board
+            lines (int): the number of lines cleared to get to this board
+        '''
+        heights = bitboard.heights()
+        rows = bitboard.rows
+        # An open space is a hole if any square above it is settled. Walk down from
+        # the highest square, keeping a mask of the columns that are covered
+        holes = 0
+        covered = 0
+        for row in rows[min(bitboard.tops):]:
+            holes += bin(covered & ~row).count('1')
+            covered |= row
+        bumpiness = sum(abs(left - right) for left, right in zip(heights, heights[1:]))
+        return (self.height*sum(heights) + self.lines*lines
+                + self.holes*holes + self.bumpiness*bumpiness)
+
+def child_boards(bitboard, state, lines, heuristic, top_rows=TOP_ROWS, deadline=None):
+    '''
+    Yields (value, board, lines, placement) for every board a piece can leave behind.
+    The first one is always yielded, the deadline is checked after each one
+    Parameters:
+        bitboard (BitBoard): the board before the piece is placed
+        state (tuple): the (orientation, row, column, rotation_index) of the piece
+        lines (int): the number of lines cleared before the piece is placed
+        heuristic (function): called as heuristic(bitboard, lines) to value a board
+        top_rows (int): the number of rows at the top that lose the game when filled
+        deadline (float): time.monotonic() time at which SearchTimeout is raised, None for no limit
+    '''
+    orientation, row, column, rotation_index = state
+    for placement in placements(bitboard, orientation, row, column, rotation_index):
+        board = bitboard.copy()
+        line_numbers = board.place(placement.orientation.masks, placement.row, placement.column)
+        if line_numbers:
+            board.clear(line_numbers)
+        total = lines + len(line_numbers)
+        value = LOST if board.any_filled(top_rows) else heuristic(board, total)
+        yield value, board, total, placement
+        if deadline is not None and time.monotonic() > deadline:
+            raise SearchTimeout
+
+def children(bitboard, state, lines, heuristic, beam_width=None, top_rows=TOP_ROWS, deadline=None):
+    '''
+    Returns a list of (value, board, lines, placement) for the best boards a piece can
+    leave behind, best first
+    Parameters:
+        bitboard (BitBoard): the board before the piece is placed
+        state (tuple): the (orientation, row, column, rotation_index) of the piece
+        lines (int): the number of lines cleared before the piece is placed
+        heuristic (function): called as heuristic(bitboard, lines) to value a board
+        beam_width (int): the number of boards to return, None for all of them
+        top_rows (int): the number of rows at the top that lose the game when filled
+        deadline (float): time.monotonic() time at which SearchTimeout is raised, None for no limit
+    '''
+    result = list(child_boards(bitboard, state, lines, heuristic, top_rows, deadline))
+    result.sort(key=lambda child: -child[0])
+    return result[:beam_width]
+
+def ply_states(ply, board_width):
+    '''
+    Returns the possible (orientation, row, column, rotation_index) states of the piece of a ply
+    Parameters:
+        ply: the (key, index, row, column, rotation_index) of a known piece,
+            or a string with the keys of the pieces that may come
+        board_width (int): the number of columns of the board
+    '''
+    if isinstance(ply, str):
+        # The orientation of an unknown piece is unknown too, so take the base shape
+        return [spawn_state(ORIENTATIONS[key][0], board_width) for key in ply]
+    key, index, row, column, rotation_index = ply
+    return [(ORIENTATIONS[key][index], row, column, rotation_index)]
+
+def search_value(bitboard, lines, plies, heuristic, beam_width, deadline=None, top_rows=TOP_ROWS):
+    '''
+    Returns the value of a board given the pieces that still have to be placed: the best
+    value that can be reached for a known piece, or the average over the pieces that may come
+    Parameters:
+        bitboard (BitBoard): the board
+        lines (int): the number of lines cleared to get to this board
+        plies (tuple): the pieces to place, see ply_states()
+        heuristic (function): called as heuristic(bitboard, lines) to value a board
+        beam_width (int): the number of best boards searched further after every piece
+        deadline (float): time.monotonic() time at which SearchTimeout is raised, None for no limit
+        top_rows (int): the number of rows at the top that lose the game when filled
+    '''
+    if not plies:
+        return heuristic(bitboard, lines)
+    if deadline is not None and time.monotonic() > deadline:
+        raise SearchTimeout
+    # Bots with other settings value the same board differently, so those are in the key too
+    key = (heuristic, beam_width, bitboard.width, bitboard.height, top_rows,
+           tuple(bitboard.rows), lines, plies)
+    value = _cache.get(key)
+    if value is not None:
+        return value
+    states = ply_states(plies[0], bitboard.width)
+    last = len(plies) == 1
+    total = 0
+    for state in states:
+        best = LOST
+        for child_value, board, child_lines, placement in children(bitboard, state, lines,
+                                                                   heuristic, beam_width,
+                                                                   top_rows, deadline):
+            if child_value > LOST:
+                # The value of a board with no pieces left to place is the heuristic,
+                # which children() already worked out
+                best = max(best, child_value if last else
+                           search_value(board, child_lines, plies[1:], heuristic,
+                                        beam_width, deadline, top_rows))
+        total += best
+    value = total/len(states)
+    if len(_cache) >= CACHE_SIZE:
+        _cache.clear()
+    _cache[key] = value
+    return value
+
+def search_job(job):
+    '''
+    Calls search_value in a worker process, returns None if the deadline passed
+    Parameter:
+        job (tuple): (board width, board height, rows, lines, plies, heuristic,
+            beam width, deadline, top rows)
+    '''
+    width, height, rows, lines, plies, heuristic, beam_width, deadline, top_rows = job
+    bitboard = BitBoard(width, height)
+    bitboard.rows[:] = rows
+    bitboard.recompute_tops()
+    try:
+        return search_value(bitboard, lines, plies, heuristic, beam_width, deadline, top_rows)
+    except SearchTimeout:
+        return None
+
+class BeamBot():
+    def __init__(self, heuristic=None, depth=3, beam_width=6, processes=0):
+        '''
+        heuristic is a function called as heuristic(bitboard, lines) to value a board,
+            higher is better. It defaults to Heuristic(). It must be picklable to use processes
+        depth is the highest number of pieces to look at, including the active piece
+        beam_width is the number of best boards searched further after every piece
+        processes is the number of worker processes, 0 to search in this process
+        '''
+        self.heuristic = heuristic or Heuristic()
+        self.depth = depth
+        self.beam_width = beam_width
+        self.pool = multiprocessing.Pool(processes) if processes else None
+        self.depth_reached = 0 # the number of pieces the last decision looked at
+
+    def plies(self, engine):
+        '''
+        Returns the plies after the active piece: the known pieces in the queue followed by
+        the pieces that may come after them, see ply_states()
+        Parameter:
+            engine (TetrisEngine): the game
+        '''
+        plies = []
+        for piece in list(engine.queue)[:self.depth - 1]:
+            orientation, row, column, rotation_index = spawn_state(piece.orientation,
+                                                                   engine.board_width)
+            plies.append((orientation.key, orientation.index, row, column, rotation_index))
+        # The next pieces come out of what is left in the bag, although in an unknown order.
+        # Once the bag is empty, any piece can come
+        left = ''.join(sorted(set(engine.bag)))
+        for ply in range(self.depth - 1 - len(plies)):
+            plies.append(left if len(engine.bag) > ply else KEYS)
+        return tuple(plies)
+
+    def evaluate(self, candidates, plies, deadline, top_rows=TOP_ROWS):
+        '''
+        Returns a list with the value of each candidate board, or None if the deadline passed
+        Parameters:
+            candidates (list): (value, board, lines, placement) tuples returned by children()
+            plies (tuple): the pieces to place after the candidates
+            deadline (float): time.monotonic() time to give up at, None for no limit
+            top_rows (int): the number of rows at the top that lose the game when filled
+        '''
+        if self.pool:
+            jobs = [(board.width, board.height, board.rows, lines, plies,
+                     self.heuristic, self.beam_width, deadline, top_rows)
+                        for value, board, lines, placement in candidates]
+            values = self.pool.map(search_job, jobs)
+            return None if None in values else values
+        try:
+            return [search_value(board, lines, plies, self.heuristic, self.beam_width,
+                                 deadline, top_rows)
+                        for value, board, lines, placement in candidates]
+        except SearchTimeout:
+            return None
+
+    def decide(self, engine, budget=None):
+        '''
+        Returns the movegen.Placement the active piece should go to, or None if there is no
+        active piece. Looks one piece further ahead at a time, up to depth pieces, and keeps
+        the decision of the deepest search that finished within the budget. When the budget
+        runs out before every placement of the active piece was valued, the best one so far
+        is taken
+        Parameters:
+            engine (TetrisEngine): the game
+            budget (float): the number of seconds the decision may take, None for no limit
+        '''
+        if not engine.piece_is_active:
+            return None
+        deadline = None if budget is None else time.monotonic() + budget - MARGIN
+        piece = engine.active_piece
+        root = []
+        try:
+            for child in child_boards(engine.bitboard, (piece.orientation, piece.row,
+                                                        piece.column, piece.rotation_index),
+                                      0, self.heuristic, engine.spawn_rows, deadline):
+                root.append(child)
+        except SearchTimeout: # out of time, pick from the placements valued so far
+            pass
+        if not root:
+            return None
+        root.sort(key=lambda child: -child[0])
+        best = root[0][3]
+        self.depth_reached = 1
+        candidates = [child for child in root[:self.beam_width] if child[0] > LOST]
+        if not candidates: # every placement loses the game
+            return best
+        plies = self.plies(engine)
+        for depth in range(2, self.depth + 1):
+            values = self.evaluate(candidates, plies[:depth-1], deadline, engine.spawn_rows)
+            if values is None: # out of time, keep the decision of the shallower search
+                break
+            best = candidates[values.index(max(values))][3]
+            self.depth_reached = depth
+        return best
+
+    def close(self):
+        '''
+        Stop the worker processes
+        '''
+        if self.pool:
+            self.pool.terminate()
+            self.pool = None
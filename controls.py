@@ -0,0 +1,125 @@
+# -------------------------------
+# Name: Tetris controls
+# Author: Jasper Keijzer
+# Language: Python 3.6.9
+#
+# Keeps shifting the piece while an arrow key is held down, with a delayed
+# auto shift (DAS) before the first repeat and an auto repeat rate (ARR)
+# after it, instead of relying on the key repeat of the operating system.
+# Keys are tracked through their press and release events, and the
+# repeats that are due are made once per frame as a single move, so
+# however fast the operating system repeats the keys, the moves never
+# queue up behind each other
+# -------------------------------
+
+import collections
+import math
+
+# Time in milliseconds a key is held before the piece starts shifting again, and between two
+# shifts after that. With an ARR of 0 the piece shifts as far as it can at once
+DAS = 133
+ARR = 33
+# Time in milliseconds between two looks at the held keys
+INPUT_FRAME = 16
+# The actions that can be held, the last one pressed of left and right wins
+HELD_ACTIONS = ('left', 'right', 'down')
+
+class Controls():
+    def __init__(self, loop, move, das=DAS, arr=ARR, frame=INPUT_FRAME):
+        '''
+        loop is the GameLoop that runs the frames
+        move is called as move(action, count) to shift the piece, where action is one of
+            HELD_ACTIONS and count the number of times, which is math.inf for as far as it can
+        das is the time in milliseconds a key is held before it repeats
+        arr is the time in milliseconds between two repeats, 0 to shift as far as the piece can
+        frame is the time in milliseconds between two looks at the held keys
+        '''
+        self.loop = loop
+        self.move = move
+        self.das = das
+        self.arr = arr
+        self.frame_time = frame
+        # The time in milliseconds each held action was pressed, in the order they were pressed,
+        # and the number of times it repeated since
+        self.held = collections.OrderedDict()
+        self.repeats = {}
+        # The actions whose key was released since the last frame. Some systems repeat a key
+        # with a release and a press, so a release only counts when no press follows it
+        self.released = set()
+        self.framing = None
+
+    def press(self, action):
+        '''
+        Shift the piece right away when a key is pressed, and keep shifting it while it is held
+        Parameter:
+            action (str): one of HELD_ACTIONS
+        '''
+        if action in self.released: # pressed again within a frame, the key repeats
+            self.released.discard(action)
+            return
+        if action in self.held: # the key repeats without releases
+            return
+        self.held[action] = self.loop.now()
+        self.repeats[action] = 0
+        self.move(action, 1)
+        if self.framing is None:
+            self.framing = self.loop.after(self.frame_time, self.frame)
+
+    def release(self, action):
+        '''
+        Stop shifting the piece when a key is released, at the next frame
+        Parameter:
+            action (str): one of HELD_ACTIONS
+        '''
+        if action in self.held:
+            self.released.add(action)
+
+    def release_all(self):
+        '''
+        Release every key, e.g. when the window loses the focus and will not hear the releases
+        '''
+        self.released.update(self.held)
+
+    def frame(self):
+        '''
+        Forget the released keys and make the repeats of the held keys that are due, each as a
+        single move. Calls itself after the frame time while any key is held
+        '''
+        self.framing = None
+        now = self.loop.now()
+        held = self.held
+        shifting = self.shifting()
+        for action in self.released:
+            del held[action]
+            del self.repeats[action]
+        self.released.clear()
+        if not held:
+            return
+        sideways = self.shifting()
+        if sideways and sideways != shifting: # the other direction is still held, it starts over
+            held[sideways] = now
+            self.repeats[sideways] = 0
+        for action in (sideways, 'down' if 'down' in held else None):
+            if action is None:
+                continue
+            elapsed = now - held[action] - self.das
+            if elapsed < 0:
+                continue
+            if not self.arr:
+                self.move(action, math.inf)
+                continue
+            due = 1 + int(elapsed//self.arr)
+            if due > self.repeats[action]:
+                count = due - self.repeats[action]
+                self.repeats[action] = due
+                self.move(action, count)
+        self.framing = self.loop.after(self.frame_time, self.frame)
+
+    def shifting(self):
+        '''
+        Returns the held sideways action that shifts the piece, the last one pressed, or None
+        '''
+        for action in reversed(self.held):
+            if action != 'down':
+                return action
+        return None
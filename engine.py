@@ -0,0 +1,652 @@
+# -------------------------------
+# Name: Tetris engine
+# Author: Jasper Keijzer
+# Language: Python 3.6.9
+#
+# The rules of the game without any tkinter or pygame dependency.
+# The Tetris class in tetris.py is a view over this engine, but the
+# engine can just as well be driven headless, e.g. for simulations
+# -------------------------------
+
+import collections
+import random
+import time
+from bitboard import BitBoard
+from movegen import placements
+from pieces import ORIENTATIONS
+from randomizers import RECENT, make_randomizer
+from snapshot import Snapshot
+
+# List of tickrates per level, based on the NES Tetris tickrates
+LEVEL_TICKRATES = [800, 700, 600, 500, 400,
+                   300, 250, 200, 150, 100,
+                   80,  80,  80,  65,   65,
+                   65,  50,  50,  50,   30,
+                   30,  30,  30,  30,   30,
+                   30,  30,  30,  30,   30,
+                   15]
+# Score for clearing 1, 2, 3 or 4 lines at once, multiplied by level+1
+LINE_SCORES = (40, 100, 300, 1200)
+# Garbage lines sent to the opponent in versus mode for clearing 1, 2, 3 or 4 lines at once
+GARBAGE_LINES = (0, 1, 2, 4)
+# The actions accepted by TetrisEngine.step()
+ACTIONS = ('left', 'right', 'down',
+           'rotate_left', 'rotate_right',
+           'snap_left', 'snap_right', 'snap_down')
+
+class Shape():
+    def __init__(self, orientation, row, column, clock=time.perf_counter):
+        '''
+        orientation is the current Orientation of the shape, shared by all shapes of its kind
+        row is the current row of the object
+        column is the current column of the object
+        clock is a function returning the current time in seconds
+        '''
+        self.orientation = orientation
+        self._row = row
+        self.column = column
+        self.clock = clock
+        self._rotation_index = 0
+        self.hover_time = self.spin_time = clock()
+    @property
+    def key(self):
+        return self.orientation.key
+    @property
+    def shape(self):
+        return self.orientation.shape
+    @property
+    def row(self):
+        return self._row
+    @row.setter
+    def row(self, newrow):
+        if newrow != self._row:
+            self._row = newrow
+            self.hover_time = self.clock()
+    @property
+    def rotation_index(self):
+        return self._rotation_index
+    @rotation_index.setter
+    def rotation_index(self, newvalue):
+        self._rotation_index = newvalue
+        self.spin_time = self.clock()
+    @property
+    def hover(self):
+        # 0.5 is a magic number, hover for max 0.5 second
+        return self.clock() - self.hover_time < 0.5
+    @property
+    def spin(self):
+        # 0.5 is a magic number, spin for max 0.5 second
+        return self.clock() - self.spin_time < 0.5
+    def cells(self):
+        '''
+        Yields the (row, column) board position of each square of the shape
+        '''
+        row = self._row
+        column = self.column
+        for y, x in self.orientation.cells:
+            yield row + y, column + x
+
+class TetrisEngine():
+    def __init__(self, random_mode=False, spin=False, hover=True,
+                 seed=None, clock=time.perf_counter, listener=None,
+                 board_width=10, board_height=24, spawn_rows=4, randomizer=None, preview_size=1):
+        '''
+        Parameters:
+            random_mode (bool): pick pieces completely random instead of from a bag of 7
+            spin (bool): hold the piece in place while it is spinning
+            hover (bool): allow the piece to hover a while before it settles
+            seed: seed for the random number generator, None for a random seed
+            clock (function): returns the current time in seconds, used for hover and spin
+            listener (function): called as listener(event, *args) on every game event
+            board_width (int): the number of columns of the board
+            board_height (int): the number of rows of the board
+            spawn_rows (int): the number of rows at the top of the board the pieces spawn in,
+                the game is lost when a piece settles in them
+            randomizer (str): how the pieces are picked, see randomizers.make_randomizer().
+                None for random or bag, depending on random_mode
+            preview_size (int): the number of upcoming pieces that are known
+        '''
+        self.random = random_mode or randomizer == 'random'
+        self.randomizer = randomizer
+        self.preview_size = preview_size
+        self.spin = spin
+        self.hover = hover
+        self.rng = random.Random(seed)
+        self.clock = clock
+        # Functions called as listener(event, *args). The events are:
+        # 'preview' (piece, added to the end of the queue), 'spawn' (piece), 'move' (piece), 'lock' (piece),
+        # 'levelup' (level), 'clear' (line_numbers), 'attack' (lines), 'garbage' (lines, hole),
+        # 'settle' (line_numbers), 'lose' () and 'restore' (snapshot), after restore() brought
+        # back a whole other state. 'attack' and 'garbage' only matter in versus mode
+        self.listeners = [listener] if listener else []
+        self.board_width = board_width # Initialize board width and height in number of squares
+        self.board_height = board_height
+        self.spawn_rows = spawn_rows
+        self.high_score = 0
+        self.high_level = 0
+        self.actions = self.make_actions()
+        self.new_game()
+
+    def make_actions(self):
+        '''
+        Returns the function that performs each action, see step()
+        '''
+        return {'left':lambda: self.shift('left'),
+                'right':lambda: self.shift('right'),
+                'down':lambda: self.shift('down'),
+                'rotate_left':lambda: self.rotate('left'),
+                'rotate_right':lambda: self.rotate('right'),
+                'snap_left':lambda: self.snap('left'),
+                'snap_right':lambda: self.snap('right'),
+                'snap_down':lambda: self.snap('down')}
+
+    def emit(self, event, *args):
+        '''
+        Notify all listeners of a game event
+        Parameters:
+            event (str): the name of the event
+            args: the arguments belonging to the event
+        '''
+        for listener in self.listeners:
+            listener(event, *args)
+
+    def new_game(self, seed=None):
+        '''
+        Resets the board, score and level and picks the first piece
+        Parameter:
+            seed: seed the random number generator again first, e.g. to record a replay,
+                None to keep drawing from it
+        '''
+        if seed is not None:
+            self.rng.seed(seed)
+        # The state of the random number generator as of the last piece that was dealt,
+        # only looked up when a snapshot needs it, see snapshot()
+        self.rng_state = None
+        # Make an empty board, holding the settled squares as one bitmask per row
+        self.bitboard = BitBoard(self.board_width, self.board_height)
+        self.score = 0
+        self.cleared_lines = 0 # number of cleared lines
+        self.level = 0 # the current level
+        self.levelup = 0 # variable to keep track of when to level up
+        # tickrate is the amount of time in milliseconds before the piece shifts down one row
+        self.tickrate = LEVEL_TICKRATES[self.level]
+        self.pieces = 0 # number of spawned pieces
+        self.piece_is_active = False
+        self.game_over = False
+        self.active_piece = None
+        # The pieces come from a randomizer, which keeps bag up to date with the pieces
+        # that are left in its bag when it uses one
+        self.bag = []
+        self.dealer = make_randomizer(self.randomizer or ('random' if self.random else 'bag'),
+                                      self.rng, self.bag)
+        # The upcoming pieces, the next one first, and the keys of the last RECENT pieces that
+        # were dealt, which a randomizer needs to go on where this one is, see restore()
+        self.queue = collections.deque()
+        self.recent = ''
+        # Garbage the opponent sent in versus mode that did not rise yet,
+        # as [lines, hole column, due time] lists, oldest first
+        self.garbage = []
+        for piece in range(self.preview_size):
+            self.preview()
+
+    def step(self, action):
+        '''
+        Perform a player action on the active piece and
+        return whether the piece could be moved
+        Parameter:
+            action (str): one of ACTIONS
+        '''
+        return self.actions[action]()
+
+    def tick(self):
+        '''
+        Advance the game by one tick: spawn a piece if there is none,
+        otherwise shift the active piece down one row
+        '''
+        if self.game_over:
+            return
+        if not self.piece_is_active:
+            self.spawn()
+        # If NOT(the spin feature is active and the piece is currently spinning)
+        elif not (self.spin and self.active_piece.spin):
+            self.shift('down')
+
+    @property
+    def board(self):
+        '''
+        The board as a 2D list with 'x' for settled squares, '*' for the squares
+        of the active piece and '' for open spaces
+        '''
+        return self.bitboard.as_strings(self.active_piece.cells() if self.piece_is_active else ())
+
+    def column_heights(self):
+        '''
+        Returns the height of the stack in each column, e.g. for bots
+        '''
+        return self.bitboard.heights()
+
+    def landing_row(self):
+        '''
+        Returns the row the active piece would land on if it was dropped now,
+        e.g. to draw a ghost piece, or None if there is no active piece
+        '''
+        if not self.piece_is_active:
+            return None
+        piece = self.active_piece
+        return piece.row + self.bitboard.drop_distance(piece.orientation, piece.row, piece.column)
+
+    def placements(self):
+        '''
+        Returns a list of movegen.Placement for every distinct position the active piece
+        can come to rest in, each with the shortest list of actions that gets it there.
+        Searches a copy of the state, so the game itself is left untouched
+        '''
+        if not self.piece_is_active:
+            return []
+        piece = self.active_piece
+        return placements(self.bitboard, piece.orientation, piece.row,
+                          piece.column, piece.rotation_index)
+
+    def print_board(self):
+        '''
+        Prints the board to the console for debugging purposes
+        '''
+        for row in self.board:
+            print(*(cell or ' ' for cell in row), sep='')
+
+    def check(self, orientation, row, column):
+        '''
+        Check wheter we may rotate or move a piece or if the space is already occupied
+        or the intented space is off the board. Return True if the move is allowed
+        Parameters:
+            orientation (Orientation): the orientation of the current piece
+            row (int): the row of the shape
+            column (int): the column of the shape
+        '''
+        return not self.bitboard.collides(orientation.masks, row, column, orientation.width)
+
+    def move(self, orientation, row, column):
+        '''
+        Move the piece to a given position
+        Parameters:
+            orientation (Orientation): the orientation of the current piece
+            row (int): the row the piece should move to
+            column (int): the column the piece should move to
+        '''
+        # Settled squares are the only ones stored on the board,
+        # so only the properties of active_piece have to be updated
+        self.active_piece.row = row
+        self.active_piece.column = column
+        self.active_piece.orientation = orientation
+        self.emit('move', self.active_piece)
+        return True
+
+    def check_and_move(self, orientation, row, column):
+        '''
+        Checks whether the piece can move to the intended position,
+        moves there if it can and returns True if both check and move succeeded
+        Parameters:
+            orientation (Orientation): the orientation of the current piece
+            row (int): the row the piece should move to
+            column (int): the column the piece should move to
+        '''
+        # If self.check is false, the function will return false without
+        # checking (and executing) self.move
+        return self.check(orientation, row, column
+            ) and self.move(orientation, row, column)
+
+    def rotate(self, direction):
+        '''
+        Rotates the active piece 90 degrees and returns True if it succeeded
+        Parameter:
+            direction (str): 'left' for anticlockwise or 'right' for clockwise
+        '''
+        # Don't rotate inactive pieces
+        if not self.piece_is_active:
+            return
+        piece = self.active_piece
+        rotations = piece.orientation.left if direction == 'left' else piece.orientation.right
+        # Don't rotate squares
+        if not rotations:
+            # Notify the piece that it has 'rotated', used for easyspin delay mechanic
+            piece.rotation_index = piece.rotation_index
+            return
+        # Look up the new orientation, the rotation index for the next x,y correction and the
+        # offsets to try: first the corrected rotation around the center, then the kicks
+        orientation, rotation_index, offsets = rotations[piece.rotation_index]
+        row = piece.row
+        column = piece.column
+        for y, x in offsets:
+            # call check_and_move to see if the rotation is allowed, and execute it if it is
+            if self.check_and_move(orientation, row+y, column+x):
+                piece.rotation_index = rotation_index
+                return True
+
+    def shift(self, direction='down'):
+        '''
+        Shift the active piece down, left or right and return True if it moved
+        Parameter:
+            direction (str): 'down', 'left' or 'right', defaulting to 'down'
+        '''
+        if not self.piece_is_active:        # We do not want to move settled pieces
+            return
+        # Retrieve information about the active piece
+        row = self.active_piece.row
+        column = self.active_piece.column
+        if direction == 'down':
+            row += 1
+        elif direction == 'left':
+            column -= 1
+        elif direction == 'right':
+            column += 1
+
+        success = self.check_and_move(self.active_piece.orientation, row, column)
+
+        # If we're moving down and the piece is blocked by something on the row below
+        # and NOT(the feature is on and we're hovering), then settle
+        if direction == 'down' and not success and not (self.hover and self.active_piece.hover):
+            self.settle()
+        return success
+
+    def shift_distance(self, direction):
+        '''
+        Returns the number of rows or columns the active piece can shift down, left or right
+        Parameter:
+            direction (str): 'down', 'left' or 'right'
+        '''
+        if not self.piece_is_active:
+            return 0
+        piece = self.active_piece
+        if direction == 'down':
+            return self.bitboard.drop_distance(piece.orientation, piece.row, piece.column)
+        return self.bitboard.slide_distance(piece.orientation, piece.row, piece.column,
+                                            -1 if direction == 'left' else 1)
+
+    def shift_by(self, direction, count):
+        '''
+        Shift the active piece down, left or right count times as a single move, e.g. while a
+        key is held, and return the number of rows or columns it moved. Ends up the same as
+        count calls of shift(), settling the piece if it hits the stack and does not hover
+        Parameters:
+            direction (str): 'down', 'left' or 'right'
+            count (int): the number of shifts
+        '''
+        distance = min(count, self.shift_distance(direction))
+        if distance:
+            piece = self.active_piece
+            if direction == 'down':
+                self.move(piece.orientation, piece.row + distance, piece.column)
+            else:
+                self.move(piece.orientation, piece.row,
+                          piece.column + (-distance if direction == 'left' else distance))
+        if direction == 'down' and count > distance:
+            self.shift('down') # blocked, settles unless it hovers
+        return distance
+
+    def snap(self, direction):
+        '''
+        Move the piece as far down, left or right as possible
+        Parameter:
+            direction (str): 'down', 'left' or 'right'
+        '''
+        if not self.piece_is_active: # We do not want to move settled pieces
+            return
+        # Retrieve information about the active piece
+        orientation = self.active_piece.orientation
+        row = self.active_piece.row
+        column = self.active_piece.column
+        # The tops of the columns and the outline of the piece tell us
+        # how far the piece can go without checking every position
+        if direction == 'down':
+            row += self.bitboard.drop_distance(orientation, row, column)
+        elif direction == 'left':
+            column -= self.bitboard.slide_distance(orientation, row, column, -1)
+        elif direction == 'right':
+            column += self.bitboard.slide_distance(orientation, row, column, 1)
+        # Move to the last checked position
+        self.move(orientation, row, column)
+        if direction == 'down': # Settle the piece if the user snapped down
+            self.settle()
+        return True
+
+    def settle(self):
+        '''
+        Settles the current active_piece and returns the indices of the cleared lines
+        '''
+        self.piece_is_active = False
+        # Put the previously active piece on the board to denote that it has now settled,
+        # line_numbers is a list of indices of any rows the piece completed
+        piece = self.active_piece
+        line_numbers = self.bitboard.place(piece.orientation.masks, piece.row, piece.column)
+        self.emit('lock', piece)
+        if line_numbers: # if any lines are full
+            self.cleared_lines += len(line_numbers)
+            self.levelup += len(line_numbers)
+            if self.levelup >= 10:
+                self.level = self.cleared_lines//10 # level up for every 10 lines cleared
+                self.high_level = max(self.level, self.high_level)
+                self.levelup -= 10
+                if self.level <= 30: # Don't increase tickrate past level 30
+                    self.tickrate = LEVEL_TICKRATES[self.level]
+                self.emit('levelup', self.level)
+            self.clear(line_numbers) # clear the lines
+            # Update the score, +1 because we start at level 0
+            self.score += LINE_SCORES[len(line_numbers)-1]*(self.level+1)
+            if self.bitboard.is_empty(): # If the board is empty now,
+                self.score += 1200*(self.level+1) # give a bonus score for clearing the board
+            self.high_score = max(self.score, self.high_score)
+            self.emit('clear', line_numbers)
+            # The cleared lines first cancel garbage that did not rise yet, the rest is sent
+            attack = self.cancel_garbage(GARBAGE_LINES[len(line_numbers)-1])
+            if attack:
+                self.emit('attack', attack)
+        elif self.garbage:
+            self.rise_garbage()
+        # Lose if there is any square in the spawn rows when this function is called
+        if self.bitboard.any_filled(self.spawn_rows):
+            self.lose()
+            return line_numbers
+        self.emit('settle', line_numbers)
+        return line_numbers
+
+    def receive_garbage(self, lines, hole, due=0):
+        '''
+        Queue garbage lines the opponent sent in versus mode. They rise from the bottom when a
+        piece settles without clearing lines at or after the due time, unless lines cleared
+        before that cancel them
+        Parameters:
+            lines (int): the number of garbage lines
+            hole (int): the column that is open in every garbage line
+            due (float): the clock time in seconds from which on the lines may rise
+        '''
+        self.garbage.append([lines, hole, due])
+
+    def cancel_garbage(self, lines):
+        '''
+        Cancel up to the given number of queued garbage lines, oldest first,
+        and return the number of lines that were left over
+        Parameter:
+            lines (int): the number of lines to cancel
+        '''
+        garbage = self.garbage
+        while lines and garbage:
+            cancelled = min(lines, garbage[0][0])
+            garbage[0][0] -= cancelled
+            lines -= cancelled
+            if not garbage[0][0]:
+                garbage.pop(0)
+        return lines
+
+    def rise_garbage(self):
+        '''
+        Push the rows up by the queued garbage lines that are due and add them at the bottom
+        '''
+        now = self.clock()
+        while self.garbage and self.garbage[0][2] <= now:
+            lines, hole, due = self.garbage.pop(0)
+            self.bitboard.add_garbage(lines, hole)
+            self.emit('garbage', lines, hole)
+
+    def preview(self):
+        '''
+        Picks a piece and adds it to the end of the queue of pieces that will be spawned
+        '''
+        key, rotation = next(self.dealer)
+        self.rng_state = None
+        self.recent = (self.recent + key)[-RECENT:]
+        piece = self.queued_piece(ORIENTATIONS[key][rotation])
+        self.queue.append(piece)
+        self.preview_piece = self.queue[0] # the next piece
+        self.emit('preview', piece)
+
+    def queued_piece(self, orientation):
+        '''
+        Returns a new piece as it waits in the queue, in its spawn position
+        Parameter:
+            orientation (Orientation): the orientation it spawns in
+        '''
+        piece = Shape(orientation, orientation.spawn_row, 0, self.clock)
+        piece.rotation_index = orientation.spawn_rotation_index
+        return piece
+
+    def spawn(self):
+        '''
+        Spawn the next piece in the board and add a new piece to the queue
+        '''
+        self.piece_is_active = True
+        self.pieces += 1
+        self.active_piece = self.queue.popleft()
+        width = self.active_piece.orientation.width # width of the shape
+        start_column = (self.board_width-width)//2 # start the shape in the middle of the board
+        self.active_piece.column = start_column
+        self.preview()
+        self.emit('spawn', self.active_piece)
+
+    def lose(self):
+        '''
+        Ends the current game
+        '''
+        self.piece_is_active = False
+        self.game_over = True
+        self.emit('lose')
+
+    def clear(self, line_numbers):
+        '''
+        Clear the given lines
+        Parameter:
+            line_numbers (list): a list of int indices of full rows
+        '''
+        # Remove the full rows from the board and create empty ones on top
+        self.bitboard.clear(line_numbers)
+
+    def snapshot(self, colors=None):
+        '''
+        Returns the state of the game as an immutable Snapshot, see snapshot.py. The rows of the
+        board are ints, so the board is not copied but shared with the snapshot. Times are kept
+        relative to the clock, so restore() can bring the snapshot back at any time
+        Parameter:
+            colors (tuple): the key of the piece each square came from, see Snapshot,
+                the engine itself does not keep track of them
+        '''
+        now = self.clock()
+        if self.rng_state is None: # the dealer is the only one drawing numbers from rng
+            self.rng_state = self.rng.getstate()
+        active = None
+        if self.piece_is_active:
+            piece = self.active_piece
+            active = (piece.key, piece.orientation.index, piece.row, piece.column,
+                      piece.rotation_index, now - piece.hover_time, now - piece.spin_time)
+        return Snapshot(self.board_width, self.board_height, self.spawn_rows, self.random,
+                        self.spin, self.hover, self.randomizer, self.preview_size,
+                        tuple(self.bitboard.rows), tuple(self.bitboard.tops), self.score,
+                        self.cleared_lines, self.level, self.levelup, self.tickrate, self.pieces,
+                        self.piece_is_active, self.game_over, active,
+                        tuple((piece.key, piece.orientation.index, now - piece.hover_time,
+                               now - piece.spin_time) for piece in self.queue),
+                        ''.join(self.bag), self.recent, self.rng_state,
+                        tuple((lines, hole, due - now) for lines, hole, due in self.garbage),
+                        colors)
+
+    def restore(self, snapshot):
+        '''
+        Bring back the state of a game from a snapshot, settings included. The random number
+        generator and the randomizer go on where they were, so the same pieces come next
+        Parameter:
+            snapshot (Snapshot): the state, see snapshot()
+        '''
+        now = self.clock()
+        self.board_width = snapshot.board_width
+        self.board_height = snapshot.board_height
+        self.spawn_rows = snapshot.spawn_rows
+        self.random = snapshot.random
+        self.spin = snapshot.spin
+        self.hover = snapshot.hover
+        self.randomizer = snapshot.randomizer
+        self.preview_size = snapshot.preview_size
+        self.bitboard = BitBoard(self.board_width, self.board_height)
+        self.bitboard.rows[:] = snapshot.rows
+        self.bitboard.tops[:] = snapshot.tops
+        self.score = snapshot.score
+        self.cleared_lines = snapshot.cleared_lines
+        self.level = snapshot.level
+        self.levelup = snapshot.levelup
+        self.tickrate = snapshot.tickrate
+        self.pieces = snapshot.pieces
+        self.piece_is_active = snapshot.piece_is_active
+        self.game_over = snapshot.game_over
+        self.high_score = max(self.score, self.high_score)
+        self.high_level = max(self.level, self.high_level)
+        self.active_piece = None
+        if snapshot.active:
+            key, index, row, column, rotation_index, hover_age, spin_age = snapshot.active
+            piece = Shape(ORIENTATIONS[key][index], row, column, self.clock)
+            piece.rotation_index = rotation_index
+            piece.hover_time = now - hover_age
+            piece.spin_time = now - spin_age
+            self.active_piece = piece
+        self.queue = collections.deque()
+        # The pieces in the queue got their times when they were dealt, which spin needs
+        for key, index, hover_age, spin_age in snapshot.queue:
+            piece = self.queued_piece(ORIENTATIONS[key][index])
+            piece.hover_time = now - hover_age
+            piece.spin_time = now - spin_age
+            self.queue.append(piece)
+        self.preview_piece = self.queue[0]
+        self.recent = snapshot.recent
+        self.rng.setstate(snapshot.rng)
+        self.rng_state = snapshot.rng
+        self.bag = list(snapshot.bag)
+        self.dealer = make_randomizer(self.randomizer or ('random' if self.random else 'bag'),
+                                      self.rng, self.bag, self.pieces + len(self.queue),
+                                      self.recent)
+        self.garbage = [[lines, hole, now + due_in] for lines, hole, due_in in snapshot.garbage]
+        self.emit('restore', snapshot)
+
+    def fork(self):
+        '''
+        Returns a new engine that goes on from the current state of this one, e.g. to see what
+        would happen after some moves without changing the game. It shares the clock of this
+        engine, but none of its listeners
+        '''
+        return TetrisEngine.from_snapshot(self.snapshot(), self.clock, self.high_score,
+                                          self.high_level)
+
+    @classmethod
+    def from_snapshot(cls, snapshot, clock=time.perf_counter, high_score=0, high_level=0):
+        '''
+        Returns a new engine with the state of a snapshot, see restore()
+        Parameters:
+            snapshot (Snapshot): the state, see snapshot()
+            clock (function): returns the current time in seconds
+            high_score (int): the high score so far
+            high_level (int): the highest level so far
+        '''
+        engine = cls.__new__(cls)
+        engine.rng = random.Random.__new__(random.Random) # unseeded, restore() sets its state
+        engine.clock = clock
+        engine.listeners = []
+        engine.high_score = high_score
+        engine.high_level = high_level
+        engine.actions = engine.make_actions()
+        engine.restore(snapshot)
+        return engine
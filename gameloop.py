@@ -0,0 +1,139 @@
+# -------------------------------
+# Name: Tetris game loop
+# Author: Jasper Keijzer
+# Language: Python 3.6.9
+#
+# One scheduler for everything that happens over time: gravity, spawning,
+# animations and the bot. Timers are kept in game time, which follows a
+# monotonic clock, and a timer that is started from a running timer counts
+# from the time it was due rather than from when it actually ran. Late
+# timers therefore never push back the ones after them, and missed
+# ticks are caught up on in order. Tk is only asked to wake the loop up
+# when the next timer is due, and the loop measures how late it was
+# -------------------------------
+
+import heapq
+import itertools
+import math
+import time
+
+# Lag in milliseconds beyond which the loop stops catching up and skips ahead,
+# e.g. after the window has been dragged around or the computer was suspended
+MAX_CATCH_UP = 250
+
+class GameLoop():
+    def __init__(self, parent, clock=time.perf_counter):
+        '''
+        parent is the tkinter widget to schedule the wakeups with
+        clock returns the current time in seconds, it must never go backwards
+        '''
+        self.parent = parent
+        self.source = clock
+        self.origin = clock()
+        self.time = 0 # the game time in milliseconds, only moves forward
+        self.due = None # the due time of the timer that is running, None outside timers
+        self.timers = [] # heap of [due time, number, callback, args]
+        self.count = itertools.count() # keeps timers with the same due time in order
+        self.wakeup = None # the tkinter after() id of the next wakeup
+        self.wakeup_time = None # the game time the next wakeup is scheduled for
+        # Lateness of the wakeups in milliseconds
+        self.frames = 0
+        self.lateness = 0 # of the last wakeup
+        self.total_lateness = 0
+        self.max_lateness = 0
+
+    def now(self):
+        '''
+        Returns the current time in milliseconds since the loop was made
+        '''
+        return (self.source() - self.origin)*1000
+
+    def clock(self):
+        '''
+        Returns the game time in seconds, to be used as the clock of the engine. Inside a timer
+        this is the time the timer was due, unless an earlier timer ran later than that
+        '''
+        if self.due is None:
+            self.time = max(self.time, self.now())
+        return self.time/1000
+
+    def after(self, delay, callback, *args):
+        '''
+        Call a function after a delay and return a timer that can be cancelled.
+        Inside a timer the delay counts from the time that timer was due
+        Parameters:
+            delay (int): the delay in milliseconds
+            callback (function): the function to call
+            args: the arguments to call it with
+        '''
+        if self.due is None:
+            self.clock()
+            start = self.time
+        else:
+            start = self.due
+        timer = [start + delay, next(self.count), callback, args]
+        heapq.heappush(self.timers, timer)
+        if self.due is None:
+            self.schedule()
+        return timer
+
+    def cancel(self, timer):
+        '''
+        Cancel a timer returned by after(), if it did not run yet
+        Parameter:
+            timer (list): the timer, None is ignored
+        '''
+        if timer:
+            timer[2] = None
+
+    def schedule(self):
+        '''
+        Ask tkinter to wake the loop up when the next timer is due
+        '''
+        timers = self.timers
+        while timers and timers[0][2] is None: # drop cancelled timers
+            heapq.heappop(timers)
+        if not timers:
+            return
+        due = timers[0][0]
+        if self.wakeup is not None:
+            if due >= self.wakeup_time:
+                return
+            self.parent.after_cancel(self.wakeup)
+        self.wakeup_time = due
+        self.wakeup = self.parent.after(max(0, math.ceil(due - self.now())), self.run)
+
+    def run(self):
+        '''
+        Run every timer that is due, in order of their due time
+        '''
+        self.wakeup = None
+        now = self.now()
+        lateness = max(0, now - self.wakeup_time)
+        if lateness > MAX_CATCH_UP: # skip ahead instead of catching up
+            self.origin += (lateness - MAX_CATCH_UP)/1000
+            now = self.now()
+        self.frames += 1
+        self.lateness = lateness
+        self.total_lateness += lateness
+        self.max_lateness = max(self.max_lateness, lateness)
+        timers = self.timers
+        while timers and timers[0][0] <= now:
+            due, number, callback, args = heapq.heappop(timers)
+            if callback is None: # cancelled
+                continue
+            self.due = due
+            self.time = max(self.time, due)
+            try:
+                callback(*args)
+            finally:
+                self.due = None
+        self.schedule()
+
+    def report(self):
+        '''
+        Returns the number of wakeups and their mean and highest lateness in milliseconds
+        '''
+        return {'frames':self.frames,
+                'mean_lateness':self.total_lateness/self.frames if self.frames else 0,
+                'max_lateness':self.max_lateness}
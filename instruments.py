@@ -0,0 +1,150 @@
+# -------------------------------
+# Name: Tetris instrumentation
+# Author: Jasper Keijzer
+# Language: Python 3.6.9
+#
+# Measures how long functions take by wrapping them, so a game without
+# the profile flag runs the functions as they are and pays nothing.
+# Every wrapped function gets a histogram with power of 2 buckets of
+# microseconds, and key handlers also measure how long their key press
+# waited in the Tk event queue
+# -------------------------------
+
+import csv
+import json
+import time
+
+# Number of histogram buckets, the last one holds everything from 2**30 microseconds on
+BUCKETS = 32
+
+class Histogram():
+    __slots__ = ('count', 'total', 'max', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0 # in microseconds
+        self.max = 0
+        # buckets[i] counts the durations of at least 2**(i-1) and less than 2**i microseconds
+        self.buckets = [0] * BUCKETS
+
+    def add(self, microseconds):
+        '''
+        Count a duration
+        Parameter:
+            microseconds (int): the duration
+        '''
+        self.count += 1
+        self.total += microseconds
+        if microseconds > self.max:
+            self.max = microseconds
+        self.buckets[min(microseconds.bit_length(), BUCKETS - 1)] += 1
+
+    def percentile(self, percent):
+        '''
+        Returns the upper bound in microseconds of the bucket that holds the given percentile
+        Parameter:
+            percent (float): the percentile, e.g. 50 for the median
+        '''
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if seen*100 >= self.count*percent:
+                return min(1 << index, self.max)
+        return self.max
+
+    def summary(self):
+        '''
+        Returns the count and the mean, median, 99th percentile and highest duration in milliseconds
+        '''
+        return {'count':self.count,
+                'mean_ms':self.total/self.count/1000 if self.count else 0,
+                'p50_ms':self.percentile(50)/1000,
+                'p99_ms':self.percentile(99)/1000,
+                'max_ms':self.max/1000}
+
+class Instruments():
+    def __init__(self, clock=time.perf_counter):
+        '''
+        clock returns the current time in seconds
+        '''
+        self.clock = clock
+        self.histograms = {} # by name
+        # Time between a key press and its handler running. Tk gives the time of a key press in
+        # milliseconds since an unknown moment, so the lag is measured against the smallest
+        # difference seen between that time and the clock
+        self.lag = Histogram()
+        self.lag_offset = None
+
+    def wrap(self, name, function, events=False):
+        '''
+        Returns a function that calls the given function and adds its duration to a histogram
+        Parameters:
+            name (str): the name of the histogram
+            function (function): the function to measure
+            events (bool): whether the function is a key handler, called with a tkinter event,
+                for which the time spent in the event queue is measured as well
+        '''
+        histogram = self.histograms.setdefault(name, Histogram())
+        clock = self.clock
+        def timed(*args, **kwargs):
+            start = clock()
+            if events and args:
+                self.queued(args[0], start)
+            try:
+                return function(*args, **kwargs)
+            finally:
+                histogram.add(int((clock() - start)*1000000))
+        return timed
+
+    def queued(self, event, now):
+        '''
+        Adds the time a key press spent in the Tk event queue to the lag histogram
+        Parameters:
+            event (event): the key press event
+            now (float): the time the handler started
+        '''
+        offset = int(now*1000) - event.time
+        if self.lag_offset is None or offset < self.lag_offset:
+            self.lag_offset = offset
+        self.lag.add((offset - self.lag_offset)*1000)
+
+    def summary(self):
+        '''
+        Returns the summary of every histogram by name, with the event queue lag as 'lag'
+        '''
+        summary = {name:histogram.summary() for name, histogram in self.histograms.items()
+                        if histogram.count}
+        if self.lag.count:
+            summary['lag'] = self.lag.summary()
+        return summary
+
+    def text(self):
+        '''
+        Returns the summary as a small table, one line per histogram
+        '''
+        lines = ['{:<10}{:>6}{:>7}{:>7}{:>7}'.format('ms', 'n', 'p50', 'p99', 'max')]
+        for name, summary in sorted(self.summary().items()):
+            lines.append('{:<10}{count:>6}{p50_ms:>7.2f}{p99_ms:>7.2f}{max_ms:>7.2f}'.format(
+                            name, **summary))
+        return '\n'.join(lines)
+
+    def dump(self, path):
+        '''
+        Write the summary and the histograms to a file, as CSV if its name ends with
+        .csv and as JSON otherwise
+        Parameter:
+            path (str): the name of the file
+        '''
+        histograms = dict(self.histograms, lag=self.lag)
+        with open(path, 'w', newline='') as file:
+            if path.endswith('.csv'):
+                writer = csv.writer(file)
+                writer.writerow(['name', 'count', 'mean_ms', 'p50_ms', 'p99_ms', 'max_ms']
+                                + ['<{}us'.format(1 << index) for index in range(BUCKETS)])
+                for name, histogram in sorted(histograms.items()):
+                    summary = histogram.summary()
+                    writer.writerow([name, summary['count'], summary['mean_ms'], summary['p50_ms'],
+                                     summary['p99_ms'], summary['max_ms']] + histogram.buckets)
+            else:
+                json.dump({name:dict(histogram.summary(), buckets=histogram.buckets)
+                                for name, histogram in histograms.items()}, file, indent=2)
@@ -1,3 +1,5 @@
+import functools
+
 def rotate_array(array, angle, wide=False):
     '''
     Rotates a rectangular or diamond 2D array in increments of 45 degrees.
@@ -13,7 +15,7 @@ def rotate_array(array, angle, wide=False):
     lengths = list(map(len, array))
     rect = len(set(lengths)) == 1
     width = max(lengths)
-    height = sum(lengths)/width
+    height = sum(lengths)//width
     if wide:
         width, height = height, width
     if not rect:
@@ -39,4 +41,60 @@ def rotate_array(array, angle, wide=False):
                                             range(ab*(not tall)+row, len(array[0])+(not tall)))
                 ] for row in range((not tall), m)
            ]
-    return array
\ No newline at end of file
+    return array
+
+@functools.lru_cache(maxsize=1024)
+def _rotate_tuples(array, angle, wide):
+    return tuple(map(tuple, rotate_array(array, angle, wide)))
+
+def rotate_array_cached(array, angle, wide=False):
+    '''
+    Same as rotate_array, but remembers the results of the last 1024 different calls.
+    Returns a tuple of tuples, which is shared between calls and can not be changed.
+    Parameters:
+        array (list): a list containing sequences of hashable items
+        angle (int): a positive angle for rotation, in 45-degree increments.
+        wide (bool): see rotate_array
+    '''
+    if type(array) is not tuple or any(type(row) is not tuple for row in array):
+        array = tuple(map(tuple, array))
+    return _rotate_tuples(array, angle%360, wide)
+
+def rotate_arrays(arrays, angle, wide=False):
+    '''
+    Rotates every array in a sequence of arrays by the same angle, using the cache
+    of rotate_array_cached. Returns a list of tuples of tuples.
+    Parameters:
+        arrays (list): a sequence of arrays, see rotate_array_cached
+        angle (int): a positive angle for rotation, in 45-degree increments.
+        wide (bool): see rotate_array
+    '''
+    return [rotate_array_cached(array, angle, wide) for array in arrays]
+
+def rotate_view(array, angle):
+    '''
+    Rotates a 2D NumPy array clockwise in increments of 90 degrees without copying it.
+    Returns a strided view on the same data, so changes to one show in the other.
+    Parameters:
+        array (numpy.ndarray): a 2D array
+        angle (int): a positive angle for rotation, in 90-degree increments.
+    '''
+    return rotate_views(array, angle, axes=(0, 1))
+
+def rotate_views(arrays, angle, axes=(1, 2)):
+    '''
+    Rotates a stack of equally shaped 2D NumPy arrays clockwise in increments of 90 degrees
+    in one call, without copying them. Returns a strided view on the same data.
+    Parameters:
+        arrays (numpy.ndarray): a 3D array, with the 2D arrays along the first axis
+        angle (int): a positive angle for rotation, in 90-degree increments.
+        axes (tuple): the axes of the rows and columns of the 2D arrays
+    '''
+    try:
+        import numpy # imported here, it takes longer to import than the rest of the game
+    except ImportError:
+        raise ImportError('rotate_view and rotate_views require numpy')
+    nineties, more = divmod(angle%360, 90)
+    if more:
+        raise ValueError('NumPy arrays can only be rotated in 90-degree increments')
+    return numpy.rot90(arrays, -nineties, axes)
@@ -0,0 +1,263 @@
+# -------------------------------
+# Name: Tetris move generation
+# Author: Jasper Keijzer
+# Language: Python 3.6.9
+#
+# Finds every distinct position a piece can come to rest in, including
+# positions that can only be reached by kicking the piece or by sliding it
+# under an overhang, together with the shortest list of engine actions
+# that brings the piece there. Works on a BitBoard, so it never touches
+# a running game
+# -------------------------------
+
+import collections
+from bitboard import BitBoard
+
+# A final resting position of a piece and the engine actions that lead to it.
+# The actions always end with 'snap_down', which settles the piece
+Placement = collections.namedtuple('Placement', 'orientation row column actions')
+
+# Cache of the states a piece can reach from a start state without moving down,
+# on a board without any settled squares. See open_air()
+_open_air = {}
+
+def spawn_state(orientation, board_width):
+    '''
+    Returns the (orientation, row, column, rotation_index) state of a piece
+    that has just been spawned with the given orientation
+    Parameters:
+        orientation (Orientation): the orientation the piece spawns with
+        board_width (int): the number of columns of the board
+    '''
+    return (orientation, orientation.spawn_row,
+            (board_width - orientation.width)//2, orientation.spawn_rotation_index)
+
+def search(bitboard, start, layer=None, descend=True):
+    '''
+    Breadth-first search over (orientation, rotation index, row, column) states.
+    Returns a dict mapping every reached state to (previous state, actions from there, cost),
+    the states in the order they were reached and a dict mapping the (masks, row, column)
+    of every resting position to (state to snap down from, cost)
+    Parameters:
+        bitboard (BitBoard): the board with the settled squares
+        start (tuple): the state of the piece
+        layer (tuple): (parents, order) of states above every column that are known to be
+            fully explored except for moving down, see open_air()
+        descend (bool): whether the piece may move down
+    '''
+    collides = bitboard.collides
+    drop_distance = bitboard.drop_distance
+    slide_distance = bitboard.slide_distance
+    highest_top = min(bitboard.tops)
+    width = bitboard.width
+    if layer:
+        parents = dict(layer[0])
+        order = list(layer[1])
+    else:
+        parents = {start:(None, (), 0)}
+        order = []
+    # buckets[cost] holds the states that are reached with that many actions
+    buckets = [[]]
+    found = {}
+    # With a layer, the (row, landing row, cost minus row) of the layer state that is the
+    # cheapest to drop straight down from, by (orientation, rotation index, column)
+    drops = {}
+
+    def visit(state, new_state, actions, new_cost):
+        '''
+        Remember how to reach a state, unless it was already reached as cheaply
+        or the piece can drop into it straight from the layer
+        '''
+        if drops:
+            orientation, rotation_index, row, column = new_state
+            drop = drops.get((orientation, rotation_index, column))
+            # Dropping there is as cheap, and everything that can be done from there
+            # is also found from the states the piece passes on its way down
+            if drop is not None and drop[0] <= row <= drop[1] and drop[2] + row <= new_cost:
+                return
+        old = parents.get(new_state)
+        if old is None or old[2] > new_cost:
+            parents[new_state] = (state, actions, new_cost)
+            while len(buckets) <= new_cost:
+                buckets.append([])
+            buckets[new_cost].append(new_state)
+
+    def expand(state, cost, sideways=True):
+        '''
+        Find the resting position below a state and visit the states one action away
+        '''
+        orientation, rotation_index, row, column = state
+        if descend:
+            # Snapping down settles the piece, which gives a placement
+            landing = row + drop_distance(orientation, row, column)
+            key = (orientation.masks, landing, column)
+            if key not in found or found[key][1] > cost + 1:
+                found[key] = (state, cost + 1)
+            if landing > row:
+                # While the piece is above every column nothing can block it, so moving down
+                # through that open air is a single step costing as many actions as rows
+                open_air = highest_top - orientation.height
+                if row < open_air - 1:
+                    visit(state, (orientation, rotation_index, open_air, column),
+                          ('down',) * (open_air - row), cost + open_air - row)
+                else:
+                    visit(state, (orientation, rotation_index, row+1, column), ('down',), cost + 1)
+        if sideways:
+            shift(state, cost)
+
+    def shift(state, cost, left=True, right=True, rotate_left=True, rotate_right=True):
+        '''
+        Visit the states one shift or rotation away, or only those of the moves that are True
+        '''
+        orientation, rotation_index, row, column = state
+        # A slide distance of 1 or more allows a shift,
+        # 2 or more makes snapping to the wall a different move.
+        # Above every column only the walls can stop the piece
+        above = row + orientation.height <= highest_top
+        if left:
+            left = column if above else slide_distance(orientation, row, column, -1)
+            if left:
+                visit(state, (orientation, rotation_index, row, column-1), ('left',), cost + 1)
+                if left > 1:
+                    visit(state, (orientation, rotation_index, row, column-left), ('snap_left',), cost + 1)
+        if right:
+            right = (width - column - orientation.width if above
+                     else slide_distance(orientation, row, column, 1))
+            if right:
+                visit(state, (orientation, rotation_index, row, column+1), ('right',), cost + 1)
+                if right > 1:
+                    visit(state, (orientation, rotation_index, row, column+right), ('snap_right',), cost + 1)
+        if orientation.right:
+            for rotations, action, wanted in ((orientation.left, ('rotate_left',), rotate_left),
+                                              (orientation.right, ('rotate_right',), rotate_right)):
+                if not wanted:
+                    continue
+                new, new_rotation_index, offsets = rotations[rotation_index]
+                for y, x in offsets:
+                    new_row = row + y
+                    new_column = column + x
+                    if above and new_row + new.height <= highest_top:
+                        blocked = new_row < 0 or new_column < 0 or new_column + new.width > width
+                    else:
+                        blocked = collides(new.masks, new_row, new_column, new.width)
+                    if not blocked:
+                        visit(state, (new, new_rotation_index, new_row, new_column), action, cost + 1)
+                        break
+
+    if layer and descend:
+        # The states of the layer can already reach each other, they only need to move down.
+        # Every one of them drops straight onto the stack, so the states on the way down are
+        # not searched one row at a time. Only the moves from there that end up below the
+        # surface, where the piece can not drop into, start a search: the tucks and kicks
+        starts = {} # the layer state that is the cheapest to drop from, by the same keys
+        for state in order:
+            orientation, rotation_index, row, column = state
+            cost = parents[state][2]
+            landing = row + drop_distance(orientation, row, column)
+            key = (orientation.masks, landing, column)
+            if key not in found or found[key][1] > cost + 1:
+                found[key] = (state, cost + 1)
+            key = (orientation, rotation_index, column)
+            drop = drops.get(key)
+            if drop is None or drop[2] > cost - row:
+                drops[key] = (row, landing, cost - row)
+                starts[key] = state
+        # The landing row in every column of every (orientation, rotation index), -1 where
+        # it can not be dropped from the layer, which never rules out searching there
+        landings = {}
+        for (orientation, rotation_index, column), (row, landing, offset) in drops.items():
+            key = (orientation, rotation_index)
+            if key not in landings:
+                landings[key] = [-1] * (width - orientation.width + 1)
+            landings[key][column] = landing
+        infinity = bitboard.height
+        for key, state in starts.items():
+            orientation, rotation_index, row, column = state
+            row, landing, offset = drops[key]
+            # Down to the highest landing row of any column to a side, shifting to that side
+            # only leads to where the piece drops anyway. So does rotating down to where the
+            # rotated piece lands, as long as it kicks like it does above the stack. Only the
+            # rows below those have moves that need searching
+            columns = landings[orientation, rotation_index]
+            first_left = min(columns[:column], default=infinity)
+            first_right = min(columns[column+1:], default=infinity)
+            first_turns = [infinity, infinity]
+            if orientation.right:
+                for turn, rotations in enumerate((orientation.left, orientation.right)):
+                    new, new_rotation_index, offsets = rotations[rotation_index]
+                    for y, x in offsets:
+                        if column + x >= 0 and column + x + new.width <= width:
+                            drop = drops.get((new, new_rotation_index, column + x))
+                            # Where it kicks to must be as cheap to drop into
+                            if drop and drop[2] + y <= offset + 1:
+                                first_turns[turn] = drop[1] - y
+                            else:
+                                first_turns[turn] = -1
+                            break
+            first_turn_left, first_turn_right = first_turns
+            cost = parents[state][2]
+            first = min(first_left, first_right, first_turn_left, first_turn_right)
+            for below in range(max(row, first + 1), landing + 1):
+                tucked = (orientation, rotation_index, below, column)
+                if below > row and tucked not in parents:
+                    parents[tucked] = (state, ('down',) * (below - row), cost + below - row)
+                shift(tucked, cost + below - row, below > first_left, below > first_right,
+                      below > first_turn_left, below > first_turn_right)
+    else:
+        # The states of the layer can already reach each other, they only need to move down
+        for state in order:
+            expand(state, parents[state][2], sideways=False)
+        if not layer:
+            buckets[0].append(start)
+    cost = 0
+    while cost < len(buckets):
+        for state in buckets[cost]:
+            if parents[state][2] == cost: # skip states that were reached more cheaply later on
+                order.append(state)
+                expand(state, cost)
+        cost += 1
+    return parents, order, found
+
+def open_air(start, board_width):
+    '''
+    Returns (parents, order, lowest row) of every state a piece can reach from its start
+    state by shifting and rotating, as long as it stays above every column. These only
+    depend on the start state and the board width, so they are only searched once
+    Parameters:
+        start (tuple): the state of the piece
+        board_width (int): the number of columns of the board
+    '''
+    key = (start, board_width)
+    layer = _open_air.get(key)
+    if layer is None:
+        # An empty board that is deep enough below the piece for it to never reach the floor
+        parents, order, found = search(BitBoard(board_width, start[2] + 64), start, descend=False)
+        lowest = max(row + orientation.height for orientation, rotation_index, row, column in order)
+        layer = _open_air[key] = (parents, order, lowest)
+    return layer
+
+def placements(bitboard, orientation, row, column, rotation_index):
+    '''
+    Returns a list with a Placement for every distinct resting position of a piece,
+    each with the shortest list of actions that gets it there
+    Parameters:
+        bitboard (BitBoard): the board with the settled squares
+        orientation (Orientation): the current orientation of the piece
+        row (int): the current row of the piece
+        column (int): the current column of the piece
+        rotation_index (int): the current rotation index of the piece
+    '''
+    start = (orientation, rotation_index, row, column)
+    parents, order, lowest = open_air(start, bitboard.width)
+    # Skip shifting and rotating in the open air if the stack is low enough
+    layer = (parents, order) if lowest <= min(bitboard.tops) else None
+    parents, order, found = search(bitboard, start, layer)
+    result = []
+    for (masks, landing, column), (state, cost) in found.items():
+        orientation = state[0]
+        actions = ['snap_down']
+        while state is not None:
+            state, path, _ = parents[state]
+            actions[:0] = path
+        result.append(Placement(orientation, landing, column, actions))
+    return result
@@ -0,0 +1,137 @@
+# -------------------------------
+# Name: Tetris pieces
+# Author: Jasper Keijzer
+# Language: Python 3.6.9
+#
+# The 4 orientations of every piece are built once when this module is
+# imported, together with their bitmasks and the position corrections and
+# kicks that belong to each rotation. Rotating a piece is a table lookup
+# -------------------------------
+
+try:
+    from matrix_rotation import rotate_array as rot_arr
+except ImportError:
+    print('The matrix_rotation module cannot be found or is not installed'\
+        'The original code can be found on https://github.com/TigerhawkT3/matrix_rotation')
+from bitboard import shape_masks
+
+# Defining the 7 shapes as 2D arrays. Empty strings mean open spaces, non-empty strings
+# are where the squares of the shape are
+SHAPES = {'S':[['*', ''],
+               ['*', '*'],
+               ['', '*']],
+          'Z':[['', '*'],
+               ['*', '*'],
+               ['*', '']],
+          'J':[['', '*'],
+               ['', '*'],
+               ['*', '*']],
+          'L':[['*', ''],
+               ['*', ''],
+               ['*', '*']],
+          'O':[['*', '*'],
+               ['*', '*']],
+          'I':[['*'],
+               ['*'],
+               ['*'],
+               ['*']],
+          'T':[['*', '*', '*'] ,
+               ['', '*', '']]}
+# (y, x) offsets to try when a rotation is blocked, in order of preference
+KICKS = tuple(zip(( 0, 0,-1, 0, 0,-2, -1,-1),
+                  (-1, 1, 0,-2, 2, 0, -1, 1)))
+# cycle of (x, y) coordinates to move the piece slightly each time it rotates
+# to make the rotation feel more natural, indexed by the rotation index
+CORRECTIONS = {3:((0,0), (1, 0), (-1, 1), (0, -1)), # 2x3 or 3x2 shape
+               4:((1,-1), (0, 1), (0,0), (-1, 0))} # I shape
+
+class Orientation():
+    '''
+    One of the 4 orientations of a piece. Orientations are immutable and
+    shared by every piece of the same kind
+    '''
+    __slots__ = ('key', 'index', 'shape', 'masks', 'cells', 'width', 'height',
+                 'bottoms', 'lefts', 'rights', 'spawn_row', 'spawn_rotation_index',
+                 'left', 'right')
+
+    def __init__(self, key, index, shape):
+        '''
+        key is the name of the piece
+        index is the number of clockwise quarter turns from the base shape
+        shape is the 2D array representation of this orientation
+        '''
+        set_slot = object.__setattr__
+        set_slot(self, 'key', key)
+        set_slot(self, 'index', index)
+        set_slot(self, 'shape', tuple(map(tuple, shape)))
+        set_slot(self, 'masks', shape_masks(shape)) # row bitmasks
+        # (row, column) offsets of the squares, in reading order
+        set_slot(self, 'cells', tuple((y, x) for y, row in enumerate(shape)
+                                                for x, cell in enumerate(row) if cell))
+        set_slot(self, 'height', len(shape))
+        set_slot(self, 'width', len(shape[0]))
+        # The row offset of the lowest square in each column, and the column
+        # offsets of the leftmost and rightmost square in each row
+        set_slot(self, 'bottoms', tuple(max(y for y, x in self.cells if x == column)
+                                            for column in range(self.width)))
+        set_slot(self, 'lefts', tuple(min(x for y, x in self.cells if y == row)
+                                          for row in range(self.height)))
+        set_slot(self, 'rights', tuple(max(x for y, x in self.cells if y == row)
+                                           for row in range(self.height)))
+        # Wide pieces start with rotation index 1, and the horizontal I piece one row lower
+        wide = self.height < self.width
+        set_slot(self, 'spawn_rotation_index', int(wide))
+        set_slot(self, 'spawn_row', int(wide and self.width == 4))
+        # left and right are indexed by the rotation index of the piece and hold tuples of
+        # (new orientation, new rotation index, ((row, column) offset to try, ...))
+        set_slot(self, 'left', ())
+        set_slot(self, 'right', ())
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Orientation objects are immutable')
+
+    def __repr__(self):
+        return 'Orientation({!r}, {})'.format(self.key, self.index)
+
+def rotation(old, new, correction):
+    '''
+    Returns the (row, column) offsets to try when rotating from one orientation to another:
+    the offset that keeps the center of the piece in place, followed by the kicks
+    Parameters:
+        old (Orientation): the orientation before the rotation
+        new (Orientation): the orientation after the rotation
+        correction (tuple): (x, y) correction to make the rotation feel more natural
+    '''
+    x_correction, y_correction = correction
+    row = old.height//2 - new.height//2 + y_correction
+    column = old.width//2 - new.width//2 + x_correction
+    return ((row, column),) + tuple((row+y, column+x) for y, x in KICKS)
+
+def build_orientations(key):
+    '''
+    Returns a tuple of the 4 orientations of a piece, linked by their rotations
+    Parameter:
+        key (str): the name of the piece
+    '''
+    # 4 is a magic number, number of sides on a rectangle
+    orientations = tuple(Orientation(key, index, rot_arr(SHAPES[key], 90*index))
+                            for index in range(4))
+    corrections = CORRECTIONS.get(max(len(SHAPES[key]), len(SHAPES[key][0])))
+    if corrections is None: # Don't rotate squares
+        return orientations
+    for orientation in orientations:
+        clockwise = orientations[(orientation.index + 1) % 4]
+        anticlockwise = orientations[(orientation.index - 1) % 4]
+        right = tuple((clockwise, (index + 1) % 4,
+                       rotation(orientation, clockwise, corrections[index]))
+                            for index in range(4))
+        left = tuple((anticlockwise, (index - 1) % 4,
+                      rotation(orientation, anticlockwise,
+                               tuple(-offset for offset in corrections[(index - 1) % 4])))
+                            for index in range(4))
+        object.__setattr__(orientation, 'right', right)
+        object.__setattr__(orientation, 'left', left)
+    return orientations
+
+# The 4 orientations of every piece, indexed by piece name and number of clockwise quarter turns
+ORIENTATIONS = {key:build_orientations(key) for key in SHAPES}
@@ -0,0 +1,135 @@
+# -------------------------------
+# Name: Tetris placement policies
+# Author: Jasper Keijzer
+# Language: Python 3.6.9
+#
+# A policy decides where the active piece of a TetrisEngine should go.
+# It is called as policy(engine, rng) when a piece has spawned and returns
+# the list of engine actions that bring the piece there, ending with
+# 'snap_down'. Policies are used to play headless games, e.g. by sweep.py
+# -------------------------------
+
+from bot import BeamBot
+from pieces import ORIENTATIONS
+
+def plan_actions(engine, index, column):
+    '''
+    Returns the actions that rotate the active piece clockwise until it has the given
+    orientation and then shift it towards the given column, followed by 'snap_down'.
+    Rotations and shifts that would be blocked are left out
+    Parameters:
+        engine (TetrisEngine): the engine with the active piece
+        index (int): the index of the target orientation
+        column (int): the target column
+    '''
+    bitboard = engine.bitboard
+    piece = engine.active_piece
+    orientation = piece.orientation
+    rotation_index = piece.rotation_index
+    row = piece.row
+    current = piece.column
+    actions = []
+    # 4 is a magic number, number of sides on a rectangle
+    for turn in range(4):
+        if orientation.index == index or not orientation.right:
+            break
+        new, new_rotation_index, offsets = orientation.right[rotation_index]
+        for y, x in offsets:
+            if not bitboard.collides(new.masks, row+y, current+x, new.width):
+                orientation, rotation_index = new, new_rotation_index
+                row += y
+                current += x
+                actions.append('rotate_right')
+                break
+        else: # the rotation is blocked
+            break
+    step = 1 if column > current else -1
+    while current != column and not bitboard.collides(orientation.masks, row,
+                                                      current+step, orientation.width):
+        current += step
+        actions.append('right' if step == 1 else 'left')
+    actions.append('snap_down')
+    return actions
+
+def random_policy(engine, rng):
+    '''
+    Drops the piece with a random orientation in a random column
+    Parameters:
+        engine (TetrisEngine): the engine with the active piece
+        rng (random.Random): the random number generator of the policy
+    '''
+    # 4 is a magic number, number of sides on a rectangle
+    return plan_actions(engine, rng.randrange(4), rng.randrange(engine.board_width))
+
+def drop_row(bitboard, orientation, row, column):
+    '''
+    Returns the row a piece would land on when dropped straight down, or None
+    if it does not fit at the given position at all
+    Parameters:
+        bitboard (BitBoard): the board
+        orientation (Orientation): the orientation of the piece
+        row (int): the row the piece starts from
+        column (int): the column of the piece
+    '''
+    if bitboard.collides(orientation.masks, row, column, orientation.width):
+        return None
+    return row + bitboard.drop_distance(orientation, row, column)
+
+def flat_policy(engine, rng):
+    '''
+    Drops the piece where it clears the most lines, then where it covers the fewest
+    open spaces and then where it lands the lowest
+    Parameters:
+        engine (TetrisEngine): the engine with the active piece
+        rng (random.Random): the random number generator of the policy, unused
+    '''
+    bitboard = engine.bitboard
+    rows = bitboard.rows
+    piece = engine.active_piece
+    best = None
+    for orientation in ORIENTATIONS[piece.key]:
+        for column in range(bitboard.width - orientation.width + 1):
+            row = drop_row(bitboard, orientation, piece.row, column)
+            if row is None:
+                continue
+            lines = sum(rows[row+y] | mask << column == bitboard.full
+                            for y, mask in enumerate(orientation.masks))
+            # count the open spaces below the lowest square in every column of the piece
+            holes = 0
+            for x in range(orientation.width):
+                bottom = max(y for y, cell_x in orientation.cells if cell_x == x) + row
+                below = bottom + 1
+                while below < bitboard.height and not rows[below] >> (column+x) & 1:
+                    holes += 1
+                    below += 1
+            key = (-lines, holes, -row - orientation.height)
+            if best is None or key < best[0]:
+                best = (key, orientation.index, column)
+    if best is None: # nowhere to go, drop it where it is
+        return ['snap_down']
+    return plan_actions(engine, best[1], best[2])
+
+# The bot behind beam_policy. It searches in this process, sweeps already use every core,
+# and only looks at the active and the preview piece to keep whole games quick
+_beam_bot = BeamBot(depth=2)
+
+def beam_policy(engine, rng):
+    '''
+    Moves the piece where a beam search over the active and the preview piece puts it,
+    see bot.BeamBot
+    Parameters:
+        engine (TetrisEngine): the engine with the active piece
+        rng (random.Random): the random number generator of the policy, unused
+    '''
+    placement = _beam_bot.decide(engine)
+    if placement is None: # nowhere to go, drop it where it is
+        return ['snap_down']
+    return placement.actions
+
+# Policies by name, for use on the command line
+POLICIES = {'random':random_policy,
+            'flat':flat_policy,
+            'beam':beam_policy}
+# The rng of a policy is seeded with the seed of the game xor this, so the policy draws
+# other numbers than the engine that picks the pieces from the same seed
+POLICY_SEED = 0x9E3779B97F4A7C15
@@ -0,0 +1,162 @@
+# -------------------------------
+# Name: Tetris randomizers
+# Author: Jasper Keijzer
+# Language: Python 3.6.9
+#
+# The ways the next piece is picked, as generators that take a seeded
+# random.Random and endlessly yield (key, rotation) pairs: the name of the
+# piece and the number of clockwise quarter turns it spawns with. The
+# engine keeps a queue of upcoming pieces filled from one of them, and
+# headless simulations can draw from them directly with deal(). A
+# randomizer picks up where another left off when it gets the same random
+# number generator state, bag, number of dealt pieces and recent pieces
+# -------------------------------
+
+import collections
+import itertools
+
+# The names of the pieces, in the order the bag randomizer shuffles them
+KEYS = 'SZJLOIT'
+# TGM style history: the pieces the history starts with, the number of times a piece is
+# picked again while it is in the history, and the pieces the first piece is picked from
+HISTORY = 'ZZZZ'
+HISTORY_ROLLS = 4
+HISTORY_FIRST = 'IJLT'
+# The number of recently dealt pieces a randomizer needs to pick up where another left off
+RECENT = len(HISTORY)
+
+# Pieces and rotations are picked with rng.getrandbits(), drawing again while the number is
+# too large. That gives the same numbers as rng.sample(), rng.choice() and rng.randrange(),
+# at a few times the speed
+
+def bag(rng, left=None, dealt=0, recent=''):
+    '''
+    Deals the 7 pieces in random order, then the 7 pieces in another random order and so on
+    Parameters:
+        rng (random.Random): the random number generator
+        left (list): kept up to date with the pieces that are left in the current bag,
+            which are dealt first
+        dealt (int): unused
+        recent (str): unused
+    '''
+    left = [] if left is None else left
+    getrandbits = rng.getrandbits
+    while True:
+        if not left: # the same shuffle as rng.sample(KEYS, 7)
+            pool = list(KEYS)
+            for n in range(7, 0, -1):
+                bits = n.bit_length()
+                index = getrandbits(bits)
+                while index >= n:
+                    index = getrandbits(bits)
+                left.append(pool[index])
+                pool[index] = pool[n - 1]
+        key = left.pop()
+        rotation = getrandbits(3)
+        while rotation > 3:
+            rotation = getrandbits(3)
+        yield key, rotation
+
+def random_keys(rng, left=None, dealt=0, recent=''):
+    '''
+    Deals every piece with the same chance, whatever came before
+    Parameters:
+        rng (random.Random): the random number generator
+        left (list): unused, every piece can come next
+        dealt (int): unused
+        recent (str): unused
+    '''
+    getrandbits = rng.getrandbits
+    while True:
+        index = getrandbits(3)
+        while index > 6:
+            index = getrandbits(3)
+        rotation = getrandbits(3)
+        while rotation > 3:
+            rotation = getrandbits(3)
+        yield KEYS[index], rotation
+
+def history(rng, left=None, dealt=0, recent='', start=HISTORY, rolls=HISTORY_ROLLS,
+            first=HISTORY_FIRST):
+    '''
+    Deals pieces at random, but picks again up to rolls times when the piece is one of the
+    last len(start) pieces. The first piece is never an S, Z or O
+    Parameters:
+        rng (random.Random): the random number generator
+        left (list): unused, every piece can come next
+        dealt (int): the number of pieces that were dealt before
+        recent (str): the last pieces that were dealt before, the last one last
+        start (str): the history before the first piece
+        rolls (int): the most times a piece is picked
+        first (str): the pieces the first piece is picked from
+    '''
+    recent = collections.deque(start + recent, maxlen=len(start))
+    getrandbits = rng.getrandbits
+    keys = KEYS if dealt else first
+    while True:
+        for roll in range(rolls):
+            index = getrandbits(3)
+            while index >= len(keys):
+                index = getrandbits(3)
+            key = keys[index]
+            if key not in recent:
+                break
+        recent.append(key)
+        keys = KEYS
+        rotation = getrandbits(3)
+        while rotation > 3:
+            rotation = getrandbits(3)
+        yield key, rotation
+
+def sequence(rng, left=None, dealt=0, recent='', keys=KEYS):
+    '''
+    Deals the given pieces in order, over and over again, with random rotations
+    Parameters:
+        rng (random.Random): the random number generator
+        left (list): unused
+        dealt (int): the number of pieces that were dealt before
+        recent (str): unused
+        keys (str): the pieces to deal
+    '''
+    getrandbits = rng.getrandbits
+    for key in itertools.islice(itertools.cycle(keys), dealt % len(keys), None):
+        rotation = getrandbits(3)
+        while rotation > 3:
+            rotation = getrandbits(3)
+        yield key, rotation
+
+# Randomizers by name, see make_randomizer()
+RANDOMIZERS = {'bag':bag,
+               'random':random_keys,
+               'history':history,
+               'sequence':sequence}
+
+def make_randomizer(name, rng, left=None, dealt=0, recent=''):
+    '''
+    Returns the generator of a randomizer
+    Parameters:
+        name (str): one of RANDOMIZERS, or sequence:<keys> to deal the given pieces in order
+        rng (random.Random): the random number generator
+        left (list): kept up to date with the pieces that will come before any piece
+            can come again, when the randomizer knows them
+        dealt (int): the number of pieces that were dealt before, to pick up where
+            another randomizer left off
+        recent (str): the last RECENT pieces that were dealt before, the last one last
+    '''
+    name, _, keys = name.partition(':')
+    if name not in RANDOMIZERS:
+        raise ValueError('unknown randomizer: {}'.format(name))
+    if name == 'sequence':
+        if not keys or any(key not in KEYS for key in keys):
+            raise ValueError('a sequence needs pieces out of {}, e.g. sequence:IOT'.format(KEYS))
+        return sequence(rng, left, dealt, recent, keys)
+    return RANDOMIZERS[name](rng, left, dealt, recent)
+
+def deal(randomizer, count):
+    '''
+    Returns the next count (key, rotation) pairs of a randomizer as a list
+    Parameters:
+        randomizer (generator): the randomizer, see make_randomizer()
+        count (int): the number of pieces
+    '''
+    return list(itertools.islice(randomizer, count))
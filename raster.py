@@ -0,0 +1,197 @@
+# -------------------------------
+# Name: Tetris raster board
+# Author: Jasper Keijzer
+# Language: Python 3.6.9
+#
+# Draws the settled squares into a single tkinter PhotoImage instead of
+# a rectangle item per square. Every color has a sprite of one square,
+# and a row is painted with one put() per run of squares of the same
+# color, which tiles the sprite over the run. Only the rows that changed
+# are painted again, and the active piece is a small image of its own
+# that moves with a single coords() call, so the cost of a redraw does
+# not grow with the stack or with the size of the squares
+# -------------------------------
+
+import tkinter
+from snapshot import EMPTY, GARBAGE
+
+def sprite(color, size, border):
+    '''
+    Returns the PhotoImage data of a square of a color with a black border
+    Parameters:
+        color (str): the fill color, any color tkinter knows
+        size (int): the width and height of the square in pixels
+        border (int): the width of the border in pixels
+    '''
+    edge = '{' + ' '.join(['black']*size) + '}'
+    inner = '{' + ' '.join(['black']*border + [color]*(size - 2*border) + ['black']*border) + '}'
+    return ' '.join([edge]*border + [inner]*(size - 2*border) + [edge]*border)
+
+class RasterBoard():
+    def __init__(self, canvas, board_width, board_height, square_width, colors):
+        '''
+        canvas is the tkinter Canvas to draw on, the board image goes below its other items
+        board_width and board_height are the size of the board in squares
+        square_width is the size of a square in pixels
+        colors is the fill color of the squares by the key of the piece they came from,
+            GARBAGE included
+        '''
+        self.canvas = canvas
+        self.board_width = board_width
+        self.board_height = board_height
+        self.square_width = square_width
+        # 3 pixels on squares of 30, like the outline of the rectangles, none on tiny squares
+        border = min(max(1, square_width//10), (square_width - 1)//2)
+        self.sprites = {key:sprite(color, square_width, border) for key, color in colors.items()}
+        self.empty = '{{{}}}'.format(canvas.cget('background')) # tiled over empty squares
+        self.image = tkinter.PhotoImage(master=canvas, width=board_width*square_width,
+                                        height=board_height*square_width)
+        self.item = canvas.create_image(0, 0, anchor='nw', image=self.image)
+        canvas.tag_lower(self.item)
+        # The active piece is an image of the orientation it is in, made when it is first shown
+        self.piece_images = {}
+        self.piece_item = canvas.create_image(0, 0, anchor='nw', state='hidden')
+        self.shown = None # the orientation of the piece image that is shown
+        # The key of the piece each square came from, None for empty squares
+        self.cells = [[None] * board_width for row in range(board_height)]
+
+    def reset(self):
+        '''
+        Empty the board and hide the active piece, e.g. for a new game
+        '''
+        self.cells = [[None] * self.board_width for row in range(self.board_height)]
+        self.image.blank()
+        self.hide_piece()
+
+    def paint_row(self, row):
+        '''
+        Paint a row of the board, one put() for every run of squares of the same color
+        Parameter:
+            row (int): the row of the board
+        '''
+        cells = self.cells[row]
+        size = self.square_width
+        top = row*size
+        column = 0
+        while column < self.board_width:
+            key = cells[column]
+            end = column + 1
+            while end < self.board_width and cells[end] == key:
+                end += 1
+            self.image.put(self.sprites[key] if key else self.empty,
+                           to=(column*size, top, end*size, top + size))
+            column = end
+
+    def lock(self, piece):
+        '''
+        Paint the squares of a settled piece and hide the active piece
+        Parameter:
+            piece (Shape): the settled piece
+        '''
+        rows = set()
+        for row, column in piece.cells():
+            self.cells[row][column] = piece.key
+            rows.add(row)
+        self.hide_piece()
+        for row in rows:
+            self.paint_row(row)
+
+    def hide(self, line_numbers, first, last):
+        '''
+        Paint a range of columns of rows empty without emptying them, for the line clear animation
+        Parameters:
+            line_numbers (list): the rows
+            first (int): the first column
+            last (int): the column after the last one
+        '''
+        size = self.square_width
+        for row in line_numbers:
+            self.image.put(self.empty, to=(first*size, row*size, last*size, (row+1)*size))
+
+    def clear(self, line_numbers):
+        '''
+        Remove cleared rows, move the rows above them down and paint the rows that changed
+        Parameter:
+            line_numbers (list): the cleared rows, in ascending order
+        '''
+        old = self.cells
+        cleared = set(line_numbers)
+        self.cells = ([[None] * self.board_width for row in line_numbers]
+                        + [cells for row, cells in enumerate(old) if row not in cleared])
+        # The rows below the last cleared row stay where they are, the cleared rows
+        # are painted again as the animation hid their squares
+        for row in range(line_numbers[-1] + 1):
+            if row in cleared or self.cells[row] != old[row]:
+                self.paint_row(row)
+
+    def garbage(self, lines, hole):
+        '''
+        Push the rows up and paint the garbage lines at the bottom
+        Parameters:
+            lines (int): the number of garbage lines
+            hole (int): the column that is open in every garbage line
+        '''
+        old = self.cells
+        garbage = [GARBAGE] * self.board_width
+        garbage[hole] = None
+        self.cells = old[lines:] + [garbage[:] for line in range(lines)]
+        for row in range(self.board_height):
+            if self.cells[row] != old[row]:
+                self.paint_row(row)
+
+    def load(self, snapshot):
+        '''
+        Paint the board of a snapshot, see Snapshot.squares()
+        Parameter:
+            snapshot (Snapshot): the state of the game
+        '''
+        self.reset()
+        rows = set()
+        for row, column, key in snapshot.squares():
+            self.cells[row][column] = key
+            rows.add(row)
+        for row in rows:
+            self.paint_row(row)
+
+    def keys(self):
+        '''
+        Returns the key of the piece each square came from, as the colors of a Snapshot
+        '''
+        return tuple(''.join(key or EMPTY for key in cells) for cells in self.cells)
+
+    def piece_image(self, orientation):
+        '''
+        Returns the image of a piece in an orientation, transparent around its squares
+        Parameter:
+            orientation (Orientation): the orientation of the piece
+        '''
+        image = self.piece_images.get((orientation.key, orientation.index))
+        if image is None:
+            size = self.square_width
+            image = tkinter.PhotoImage(master=self.canvas, width=orientation.width*size,
+                                       height=orientation.height*size)
+            for y, x in orientation.cells:
+                image.put(self.sprites[orientation.key], to=(x*size, y*size))
+            self.piece_images[orientation.key, orientation.index] = image
+        return image
+
+    def show_piece(self, piece):
+        '''
+        Show the active piece at its position, switching images when it rotated
+        Parameter:
+            piece (Shape): the active piece
+        '''
+        if piece.orientation is not self.shown:
+            self.shown = piece.orientation
+            self.canvas.itemconfig(self.piece_item, image=self.piece_image(piece.orientation),
+                                   state='normal')
+        self.canvas.coords(self.piece_item, piece.column*self.square_width,
+                           piece.row*self.square_width)
+
+    def hide_piece(self):
+        '''
+        Hide the active piece
+        '''
+        if self.shown is not None:
+            self.canvas.itemconfig(self.piece_item, state='hidden')
+            self.shown = None
@@ -0,0 +1,225 @@
+# -------------------------------
+# Name: Tetris replays
+# Author: Jasper Keijzer
+# Language: Python 3.6.9
+#
+# A replay is the seed of a game followed by a record for everything that
+# happened to the engine: 3 bytes with the number of milliseconds since the
+# previous record and what happened. The engine reads the time of the
+# current record as its clock, so playing the records back gives the
+# same pieces, rotations, hovers and score as the recorded game
+# Usage: python replay.py game.tetr [game.tetr ...]
+# -------------------------------
+
+import argparse
+import struct
+import sys
+import time
+from engine import ACTIONS, TetrisEngine
+
+# Replays are saved with this extension, tetris.py plays back files with it
+EXTENSION = '.tetr'
+# magic, version, seed, flags (random, spin, hover), board width, board height, spawn rows,
+# preview size, length of the name of the randomizer, which follows the header in ASCII
+HEADER = struct.Struct('<4sBqBHHHHB')
+MAGIC = b'TETR'
+VERSION = 1
+# milliseconds since the previous record, code
+RECORD = struct.Struct('<HB')
+# The codes of the records: the index of an engine action in ACTIONS or one of these
+TICK, SPAWN, PAUSE, RESUME, WAIT = range(len(ACTIONS), len(ACTIONS) + 5)
+CODES = {action:code for code, action in enumerate(ACTIONS)}
+# The longest time between two records, longer waits are split up with WAIT records
+MAX_DELTA = 0xffff
+
+class Recorder():
+    def __init__(self, seed, random_mode=False, spin=False, hover=True,
+                 board_width=10, board_height=24, spawn_rows=4, clock=time.perf_counter,
+                 size=4096, randomizer=None, preview_size=1):
+        '''
+        seed is the seed of the recorded game
+        random_mode, spin, hover, board_width, board_height, spawn_rows, randomizer and
+            preview_size are the settings of the game, see TetrisEngine. The preview size is
+            kept as the pieces get their hover and spin times when they enter the queue
+        clock returns the current time in seconds
+        size is the number of records there is room for initially
+        '''
+        self.seed = seed
+        name = (randomizer or ('random' if random_mode else 'bag')).encode('ascii')
+        self.header = HEADER.pack(MAGIC, VERSION, seed,
+                                  random_mode | spin << 1 | hover << 2,
+                                  board_width, board_height, spawn_rows, preview_size,
+                                  len(name)) + name
+        self.source = clock
+        self.start = clock()
+        self.time = 0 # the time of the last record in milliseconds since the start
+        # The records are packed into a buffer that is only grown when it is full
+        self.buffer = bytearray(RECORD.size * size)
+        self.length = 0 # number of bytes in use
+
+    def clock(self):
+        '''
+        Returns the time of the last record in seconds, to be used as the clock of the engine
+        '''
+        return self.time/1000
+
+    def record(self, code):
+        '''
+        Add a record, call this before the engine does what it describes
+        Parameter:
+            code (int): the index of an engine action in ACTIONS, or TICK, SPAWN, PAUSE or RESUME
+        '''
+        now = int((self.source() - self.start)*1000)
+        delta = now - self.time
+        while delta > MAX_DELTA:
+            self.pack(MAX_DELTA, WAIT)
+            delta -= MAX_DELTA
+        self.pack(delta, code)
+        self.time = now
+
+    def pack(self, delta, code):
+        '''
+        Write a record into the buffer, doubling the buffer if it is full
+        Parameters:
+            delta (int): milliseconds since the previous record
+            code (int): the code of the record
+        '''
+        if self.length == len(self.buffer):
+            self.buffer += bytes(len(self.buffer))
+        RECORD.pack_into(self.buffer, self.length, delta, code)
+        self.length += RECORD.size
+
+    def data(self):
+        '''
+        Returns the replay as bytes
+        '''
+        return self.header + bytes(self.buffer[:self.length])
+
+    def save(self, path):
+        '''
+        Write the replay to a file
+        Parameter:
+            path (str): the name of the file
+        '''
+        with open(path, 'wb') as file:
+            file.write(self.data())
+
+class Replay():
+    def __init__(self, data):
+        '''
+        data is a replay as bytes, see Recorder.data()
+        '''
+        (magic, version, self.seed, flags, self.board_width, self.board_height,
+         self.spawn_rows, self.preview_size, length) = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('Not a version {} Tetris replay'.format(VERSION))
+        self.random_mode = bool(flags & 1)
+        self.spin = bool(flags & 2)
+        self.hover = bool(flags & 4)
+        size = HEADER.size + length
+        self.randomizer = bytes(data[HEADER.size:size]).decode('ascii')
+        self.records = memoryview(data)[size:]
+
+    @classmethod
+    def load(cls, path):
+        '''
+        Returns the Replay in a file
+        Parameter:
+            path (str): the name of the file
+        '''
+        with open(path, 'rb') as file:
+            return cls(file.read())
+
+    def __len__(self):
+        return len(self.records)//RECORD.size
+
+class Player():
+    def __init__(self, replay, engine=None):
+        '''
+        replay is the Replay to play back
+        engine is the TetrisEngine to play it on, e.g. one that is drawn by tetris.py.
+            Its settings and clock are replaced and a new game is started on it.
+            Defaults to a new TetrisEngine
+        '''
+        self.replay = replay
+        self.time = 0 # the time of the last played record in milliseconds
+        if engine is None:
+            engine = TetrisEngine()
+        engine.random = replay.random_mode
+        engine.randomizer = replay.randomizer
+        engine.spin = replay.spin
+        engine.hover = replay.hover
+        engine.board_width = replay.board_width
+        engine.board_height = replay.board_height
+        engine.spawn_rows = replay.spawn_rows
+        engine.preview_size = replay.preview_size
+        engine.clock = self.clock
+        engine.new_game(replay.seed)
+        self.engine = engine
+        self.records = RECORD.iter_unpack(replay.records)
+        self.next = next(self.records, None) # the record that is played next
+        self.paused = False # whether the recorded game was paused at this point
+
+    def clock(self):
+        '''
+        Returns the time of the last played record in seconds, the clock of the engine
+        '''
+        return self.time/1000
+
+    @property
+    def done(self):
+        '''
+        Whether every record has been played
+        '''
+        return self.next is None
+
+    def play(self, until=None):
+        '''
+        Play the records up to the given time, or all of them
+        Parameter:
+            until (int): the time in milliseconds since the start of the replay, None for the end
+        '''
+        engine = self.engine
+        actions = engine.actions
+        record = self.next
+        records = self.records
+        while record is not None:
+            delta, code = record
+            if until is not None and self.time + delta > until:
+                break
+            self.time += delta
+            if code < TICK:
+                actions[ACTIONS[code]]()
+            elif code == TICK:
+                engine.tick()
+            elif code == SPAWN:
+                engine.spawn()
+            elif code == PAUSE:
+                self.paused = True
+            elif code == RESUME:
+                self.paused = False
+            record = next(records, None)
+        self.next = record
+
+def main(argv=None):
+    '''
+    Plays replays headless as fast as possible and prints how each game ended
+    Parameter:
+        argv (list): the command line arguments, defaulting to sys.argv[1:]
+    '''
+    parser = argparse.ArgumentParser(description='Play back Tetris replays headless')
+    parser.add_argument('paths', nargs='+', help='replay files')
+    args = parser.parse_args(argv)
+    for path in args.paths:
+        replay = Replay.load(path)
+        start = time.perf_counter()
+        player = Player(replay)
+        player.play()
+        seconds = time.perf_counter() - start
+        engine = player.engine
+        print('{}: score {}, lines {}, level {}, pieces {}{} ({} records in {:.3f} s)'.format(
+                path, engine.score, engine.cleared_lines, engine.level, engine.pieces,
+                ', lost' if engine.game_over else '', len(replay), seconds))
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,285 @@
+# -------------------------------
+# Name: Tetris score store
+# Author: Jasper Keijzer
+# Language: Python 3.6.9
+#
+# Keeps the result of every game in an SQLite database, so high scores
+# last beyond the session and long headless runs can be queried after
+# the fact. Results are queued and written in batches by a background
+# thread, so finishing a game never waits for the disk
+# Usage: python scores.py [--db scores.db] [--source bot] [--top 10] [--percentiles 50 90 99]
+# -------------------------------
+
+import argparse
+import collections
+import sqlite3
+import sys
+import threading
+import time
+
+# The database that is used when no other is given, in the current directory
+DEFAULT_PATH = 'scores.db'
+# The most results that are written in one transaction
+BATCH_SIZE = 1024
+# The columns of a result, in the order they are stored
+COLUMNS = ('finished', 'score', 'lines', 'level', 'pieces', 'duration', 'random', 'spin',
+           'hover', 'seed', 'board_width', 'board_height', 'source')
+# The columns that games can be ranked by, each of them has an index
+RANKED = ('score', 'lines', 'level', 'pieces', 'duration')
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS games (
+    id INTEGER PRIMARY KEY,
+    finished REAL NOT NULL, -- seconds since the epoch
+    score INTEGER NOT NULL,
+    lines INTEGER NOT NULL,
+    level INTEGER NOT NULL,
+    pieces INTEGER NOT NULL,
+    duration REAL, -- game time in seconds
+    random INTEGER NOT NULL,
+    spin INTEGER NOT NULL,
+    hover INTEGER NOT NULL,
+    seed INTEGER, -- NULL when the game cannot be replayed
+    board_width INTEGER NOT NULL,
+    board_height INTEGER NOT NULL,
+    source TEXT NOT NULL -- who played, e.g. player, bot or sweep:flat
+);
+''' + ''.join('CREATE INDEX IF NOT EXISTS games_{0} ON games ({0});\n'.format(name)
+              for name in RANKED)
+INSERT = 'INSERT INTO games ({}) VALUES ({})'.format(', '.join(COLUMNS),
+                                                     ', '.join('?' for name in COLUMNS))
+
+def connect(path):
+    '''
+    Returns a connection to the database, creating its tables if needed
+    Parameter:
+        path (str): the name of the database file
+    '''
+    connection = sqlite3.connect(path)
+    # Readers do not block the writer and the other way around, and a commit
+    # only waits for the log file instead of the whole database
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute('PRAGMA synchronous=NORMAL')
+    connection.executescript(SCHEMA)
+    connection.row_factory = sqlite3.Row
+    return connection
+
+def game_result(engine, duration=None, seed=None, source='player'):
+    '''
+    Returns the result of the current game of an engine as a dict, see ScoreStore.add()
+    Parameters:
+        engine (TetrisEngine): the engine
+        duration (float): how long the game took in seconds of game time
+        seed (int): the seed the game was played with, None if it cannot be replayed
+        source (str): who played the game
+    '''
+    return {'score':engine.score, 'lines':engine.cleared_lines, 'level':engine.level,
+            'pieces':engine.pieces, 'duration':duration, 'random':engine.random,
+            'spin':engine.spin, 'hover':engine.hover, 'seed':seed,
+            'board_width':engine.board_width, 'board_height':engine.board_height,
+            'source':source}
+
+def where(filters):
+    '''
+    Returns an SQL WHERE clause and its parameters that match every given column to its value
+    Parameter:
+        filters (dict): values by column name, see COLUMNS
+    '''
+    for name in filters:
+        if name not in COLUMNS:
+            raise ValueError('unknown column: {}'.format(name))
+    if not filters:
+        return '', ()
+    return (' WHERE ' + ' AND '.join('{} = ?'.format(name) for name in filters),
+            tuple(filters.values()))
+
+class ScoreStore():
+    def __init__(self, path=DEFAULT_PATH, batch_size=BATCH_SIZE, clock=time.time):
+        '''
+        path is the name of the database file
+        batch_size is the most results that are written in one transaction
+        clock returns the current time in seconds since the epoch, to date the results
+        '''
+        self.path = path
+        self.batch_size = batch_size
+        self.clock = clock
+        # The queries run on this connection, in the thread that made the store.
+        # The writing thread opens one of its own, as sqlite3 connections stay in their thread
+        self.connection = connect(path)
+        self.pending = collections.deque() # rows that are not written yet
+        self.condition = threading.Condition()
+        self.closing = False
+        self.added = 0
+        self.written = 0
+        self.failed = 0 # rows that could not be written
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def add(self, result):
+        '''
+        Queue the result of a game to be written, returns right away
+        Parameter:
+            result (dict): values by column name, see COLUMNS and game_result().
+                The finished time defaults to now
+        '''
+        row = tuple(result.get(name) for name in COLUMNS)
+        if row[0] is None:
+            row = (self.clock(),) + row[1:]
+        with self.condition:
+            self.pending.append(row)
+            self.added += 1
+            self.condition.notify_all()
+
+    def run(self):
+        '''
+        Write the queued results in batches, runs on a thread of its own. Whatever
+        was queued while the last batch was written goes into the next one
+        '''
+        connection = connect(self.path)
+        while True:
+            with self.condition:
+                while not self.pending and not self.closing:
+                    self.condition.wait()
+                if not self.pending: # and closing
+                    break
+                rows = [self.pending.popleft()
+                            for row in range(min(len(self.pending), self.batch_size))]
+            try:
+                with connection: # one transaction
+                    connection.executemany(INSERT, rows)
+            except sqlite3.Error as error:
+                print('Cannot save {} game results: {}'.format(len(rows), error))
+                self.failed += len(rows)
+            with self.condition:
+                self.written += len(rows)
+                self.condition.notify_all()
+        connection.close()
+
+    def flush(self):
+        '''
+        Wait until every queued result is written
+        '''
+        with self.condition:
+            while self.written < self.added:
+                self.condition.wait()
+
+    def close(self):
+        '''
+        Write the queued results and stop the writing thread
+        '''
+        with self.condition:
+            self.closing = True
+            self.condition.notify_all()
+        self.thread.join()
+        self.connection.close()
+
+    def count(self, **filters):
+        '''
+        Returns the number of written games that match the filters
+        Parameter:
+            filters: values by column name, see COLUMNS
+        '''
+        clause, parameters = where(filters)
+        return self.connection.execute('SELECT COUNT(*) FROM games' + clause,
+                                       parameters).fetchone()[0]
+
+    def leaderboard(self, by='score', limit=10, **filters):
+        '''
+        Returns the best written games as a list of dicts, the best first
+        Parameters:
+            by (str): the column to rank by, one of RANKED
+            limit (int): the number of games
+            filters: values by column name, see COLUMNS
+        '''
+        if by not in RANKED:
+            raise ValueError('cannot rank by {}'.format(by))
+        clause, parameters = where(filters)
+        rows = self.connection.execute(
+                    'SELECT * FROM games{} ORDER BY {} DESC, id LIMIT ?'.format(clause, by),
+                    parameters + (limit,))
+        return [dict(row) for row in rows]
+
+    def best(self, **filters):
+        '''
+        Returns the highest score and the highest level of the written games as a (score, level)
+        tuple, zeroes when there are none
+        Parameter:
+            filters: values by column name, see COLUMNS
+        '''
+        clause, parameters = where(filters)
+        score, level = self.connection.execute(
+                            'SELECT MAX(score), MAX(level) FROM games' + clause,
+                            parameters).fetchone()
+        return score or 0, level or 0
+
+    def percentiles(self, column='score', percents=(50, 90, 99), **filters):
+        '''
+        Returns the value of a column at each of the given percentiles of the written
+        games as a dict, using the nearest rank. Empty when there are no games
+        Parameters:
+            column (str): the column, one of RANKED
+            percents (list): the percentiles, e.g. 50 for the median
+            filters: values by column name, see COLUMNS
+        '''
+        if column not in RANKED:
+            raise ValueError('no percentiles of {}'.format(column))
+        clause, parameters = where(filters)
+        clause += (' AND ' if clause else ' WHERE ') + column + ' IS NOT NULL'
+        total = self.connection.execute('SELECT COUNT(*) FROM games' + clause,
+                                        parameters).fetchone()[0]
+        values = {}
+        if total:
+            # Walks the index of the column up to the rank instead of sorting the games
+            query = 'SELECT {0} FROM games{1} ORDER BY {0} LIMIT 1 OFFSET ?'.format(column, clause)
+            for percent in percents:
+                rank = max(0, min(total - 1, int(-(-total*percent//100)) - 1))
+                values[percent] = self.connection.execute(query, parameters + (rank,)).fetchone()[0]
+        return values
+
+def main(argv=None):
+    '''
+    Prints a leaderboard and percentiles of the stored games from the command line
+    Parameter:
+        argv (list): the command line arguments, defaulting to sys.argv[1:]
+    '''
+    parser = argparse.ArgumentParser(description='Show the stored results of Tetris games')
+    parser.add_argument('--db', default=DEFAULT_PATH, help='the database file')
+    parser.add_argument('--source', help='only games played by this, e.g. player, bot or sweep:flat')
+    parser.add_argument('--flags', nargs='*', choices=('random', 'spin', 'nohover'),
+                        help='only games played with exactly these flags')
+    parser.add_argument('--width', type=int, help='only games on boards this many columns wide')
+    parser.add_argument('--height', type=int, help='only games on boards this many rows high')
+    parser.add_argument('--by', default='score', choices=RANKED, help='the column to rank by')
+    parser.add_argument('--top', type=int, default=10, help='the number of games in the leaderboard')
+    parser.add_argument('--percentiles', type=float, nargs='*', default=[50, 90, 99],
+                        help='the percentiles to show of every ranked column')
+    args = parser.parse_args(argv)
+    filters = {}
+    if args.source:
+        filters['source'] = args.source
+    if args.flags is not None:
+        filters['random'] = 'random' in args.flags
+        filters['spin'] = 'spin' in args.flags
+        filters['hover'] = 'nohover' not in args.flags
+    if args.width:
+        filters['board_width'] = args.width
+    if args.height:
+        filters['board_height'] = args.height
+    store = ScoreStore(args.db)
+    print('Games: {}'.format(store.count(**filters)))
+    print('{:>4}{:>10}{:>7}{:>7}{:>8}{:>10}{:>12}  {}'.format('#', 'score', 'lines', 'level',
+                                                             'pieces', 'seconds', 'seed', 'source'))
+    for rank, game in enumerate(store.leaderboard(args.by, args.top, **filters), 1):
+        print('{:>4}{score:>10}{lines:>7}{level:>7}{pieces:>8}{:>10}{:>12}  {source}'.format(
+                rank, '-' if game['duration'] is None else '{:.1f}'.format(game['duration']),
+                '-' if game['seed'] is None else game['seed'], **game))
+    if args.percentiles:
+        print('Percentiles:')
+        for column in RANKED:
+            values = store.percentiles(column, args.percentiles, **filters)
+            if values:
+                print('{:>10}: {}'.format(column, ', '.join('p{:g} {:g}'.format(percent, value)
+                                                            for percent, value in values.items())))
+    store.close()
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
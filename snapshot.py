@@ -0,0 +1,91 @@
+# -------------------------------
+# Name: Tetris snapshots
+# Author: Jasper Keijzer
+# Language: Python 3.6.9
+#
+# The whole state of a game as one immutable value, see
+# TetrisEngine.snapshot(). The rows of the board are ints, so taking a
+# snapshot copies one reference per row, and since nothing in a snapshot
+# ever changes, snapshots are shared instead of copied: keeping one per
+# move for undo, or handing one to every branch of a search, costs
+# nothing more. Snapshots are saved to and loaded from JSON files
+# -------------------------------
+
+import collections
+import json
+
+# Snapshots are saved with this version, see Snapshot.load()
+VERSION = 1
+# The colors of a snapshot hold the key of the piece each square came from, or one of these
+EMPTY = '.'
+GARBAGE = 'g'
+
+_Snapshot = collections.namedtuple('_Snapshot', [
+    # The settings of the game, see TetrisEngine
+    'board_width', 'board_height', 'spawn_rows', 'random', 'spin', 'hover', 'randomizer',
+    'preview_size',
+    # The board as a tuple with the bitmask of every row and one with the top of every column,
+    # see BitBoard, and the counters
+    'rows', 'tops', 'score', 'cleared_lines', 'level', 'levelup', 'tickrate', 'pieces',
+    'piece_is_active', 'game_over',
+    # The active piece as (key, orientation index, row, column, rotation index, seconds since
+    # it last moved down, seconds since it last rotated), and the (key, orientation index,
+    # seconds since it moved down, seconds since it rotated) of each piece in the queue, the
+    # first one next, whose times were set when they were dealt
+    'active', 'queue',
+    # What the randomizer needs to deal the same pieces: the pieces left in its bag, the last
+    # pieces it dealt and the state of the random number generator
+    'bag', 'recent', 'rng',
+    # Garbage that did not rise yet, as (lines, hole column, seconds until it is due)
+    'garbage',
+    # The key of the piece each square of the board came from, one string per row with EMPTY
+    # and GARBAGE for the other squares, or None when nobody kept track of them
+    'colors'])
+
+class Snapshot(_Snapshot):
+    __slots__ = ()
+
+    def squares(self):
+        '''
+        Yields the (row, column, key) of every settled square, where key is the key of the
+        piece the square came from, or GARBAGE for all of them when there are no colors
+        '''
+        for row, mask in enumerate(self.rows):
+            if mask:
+                keys = self.colors[row] if self.colors else None
+                for column in range(self.board_width):
+                    if mask >> column & 1:
+                        yield row, column, keys[column] if keys else GARBAGE
+
+    def save(self, path):
+        '''
+        Write the snapshot to a JSON file
+        Parameter:
+            path (str): the name of the file
+        '''
+        with open(path, 'w') as file:
+            json.dump({'version':VERSION, 'snapshot':self._asdict()}, file)
+
+    @classmethod
+    def load(cls, path):
+        '''
+        Returns the Snapshot in a JSON file
+        Parameter:
+            path (str): the name of the file
+        '''
+        with open(path) as file:
+            data = json.load(file)
+        if data.get('version') != VERSION:
+            raise ValueError('Not a version {} Tetris snapshot'.format(VERSION))
+        fields = data['snapshot']
+        # JSON turns tuples into lists, the snapshot is made of tuples again
+        version, state, gauss = fields['rng']
+        active = fields['active']
+        return cls(**dict(fields,
+                          rows=tuple(fields['rows']),
+                          tops=tuple(fields['tops']),
+                          active=tuple(active) if active else None,
+                          queue=tuple(map(tuple, fields['queue'])),
+                          rng=(version, tuple(state), gauss),
+                          garbage=tuple(map(tuple, fields['garbage'])),
+                          colors=tuple(fields['colors']) if fields['colors'] else None))
@@ -0,0 +1,590 @@
+# -------------------------------
+# Name: Tetris spectating
+# Author: Jasper Keijzer
+# Language: Python 3.6.9
+#
+# Publishes what happens in a game as a stream that spectators can follow
+# without running the engine: a keyframe with the whole board whenever a
+# game starts, then a record of a few bytes per event. Records are
+# batched into chunks, each compressed on its own and prefixed with its
+# length, and written to a file, to a Unix socket a viewer listens on,
+# or to every viewer connected to a broadcast socket. The engine only
+# puts the events in a bounded queue, a background thread encodes and
+# writes them. When the queue is full, moves of the piece replace the
+# move before them and anything else empties the queue, which starts
+# again with a keyframe at the next spawn or at the end of the game
+# Usage: python spectate.py play stream.tets [--policy beam]
+#        python spectate.py watch stream.tets
+# -------------------------------
+
+import argparse
+import collections
+import os
+import random
+import socket
+import struct
+import sys
+import threading
+import time
+import zlib
+from bitboard import BitBoard
+from engine import TetrisEngine
+from pieces import ORIENTATIONS
+from sweep import load_policy
+
+KEYS = 'SZJLOIT'
+# The kinds of records
+KEYFRAME, PREVIEW, SPAWN, MOVE, LOCK, CLEAR, LEVELUP, GARBAGE, LOSE = range(9)
+# board width, board height, score, level, cleared lines, spawned pieces, followed by the rows
+# of the board from the top down, each as (width+7)//8 bytes with bit x set if column x is occupied
+KEYFRAME_HEADER = struct.Struct('<HHQHII')
+RECORDS = {PREVIEW:struct.Struct('<BB'),     # index in KEYS, orientation index
+           SPAWN:struct.Struct('<BBHH'),     # index in KEYS, orientation index, row, column
+           MOVE:struct.Struct('<BBHH'),      # the same, for shifts and rotations
+           LOCK:struct.Struct('<BBHH'),      # the same, for the piece that settled
+           CLEAR:struct.Struct('<QHB'),      # score, first cleared row, bit y set if first+y cleared
+           LEVELUP:struct.Struct('<H'),      # level
+           GARBAGE:struct.Struct('<BH'),     # garbage lines that rose, hole column
+           LOSE:struct.Struct('<')}
+# Length of the compressed records and milliseconds since the stream started
+CHUNK = struct.Struct('<II')
+# Number of events the queue holds before frames are dropped
+QUEUE_SIZE = 256
+# Seconds the writing thread waits for events before it looks for new viewers
+ACCEPT_INTERVAL = 0.05
+# Bytes a broadcast viewer may fall behind before its chunks are dropped
+MAX_BACKLOG = 1 << 16
+
+class Spectator():
+    '''
+    The state of a game as far as a spectator knows it, kept up to date from the records
+    '''
+    def __init__(self):
+        self.board = None # BitBoard, None until the first keyframe
+        self.score = 0
+        self.level = 0
+        self.lines = 0
+        self.pieces = 0
+        self.piece = None # (key index, orientation index, row, column) of the active piece
+        self.preview = None # (key index, orientation index) of the next piece
+        self.lost = False
+
+    def load(self, width, height, score, level, lines, pieces, rows, piece, preview):
+        '''
+        Take over the state of a game
+        Parameters:
+            width (int): the number of columns of the board
+            height (int): the number of rows of the board
+            score (int): the score
+            level (int): the level
+            lines (int): the number of cleared lines
+            pieces (int): the number of spawned pieces
+            rows (list): the rows of the board as bitmasks, see BitBoard
+            piece (tuple): the active piece, see self.piece, or None
+            preview (tuple): the next piece, see self.preview, or None
+        '''
+        self.board = BitBoard(width, height)
+        self.board.rows[:] = rows
+        self.board.recompute_tops()
+        self.score = score
+        self.level = level
+        self.lines = lines
+        self.pieces = pieces
+        self.piece = piece
+        self.preview = preview
+        self.lost = False
+
+    def keyframe(self):
+        '''
+        Returns the records that bring a spectator to the current state
+        '''
+        board = self.board
+        size = (board.width + 7)//8
+        data = [bytes((KEYFRAME,)),
+                KEYFRAME_HEADER.pack(board.width, board.height, self.score, self.level,
+                                     self.lines, self.pieces),
+                b''.join(row.to_bytes(size, 'little') for row in board.rows)]
+        if self.preview:
+            data.append(encode(PREVIEW, self.preview))
+        if self.piece: # a move, as the keyframe already counts its spawn
+            data.append(encode(MOVE, self.piece))
+        return b''.join(data)
+
+    def apply(self, kind, fields):
+        '''
+        Update the state with a record
+        Parameters:
+            kind (int): the kind of record
+            fields (tuple): its fields, for a keyframe the arguments of load()
+        '''
+        if kind == MOVE:
+            self.piece = fields
+        elif kind == SPAWN:
+            self.piece = fields
+            self.pieces += 1
+        elif kind == LOCK: # the rows it completed are cleared by the CLEAR record that follows
+            key, index, row, column = fields
+            self.board.place(ORIENTATIONS[KEYS[key]][index].masks, row, column)
+            self.piece = None
+        elif kind == PREVIEW:
+            self.preview = fields
+        elif kind == CLEAR:
+            self.score, first, cleared = fields
+            line_numbers = [first + y for y in range(8) if cleared >> y & 1]
+            self.board.clear(line_numbers)
+            self.lines += len(line_numbers)
+        elif kind == LEVELUP:
+            self.level = fields[0]
+        elif kind == GARBAGE:
+            self.board.add_garbage(*fields)
+        elif kind == LOSE:
+            self.piece = None
+            self.lost = True
+        elif kind == KEYFRAME:
+            self.load(*fields)
+
+    def text(self):
+        '''
+        Returns the board as text with a line on the score, '#' for settled squares
+        and '*' for the squares of the active piece
+        '''
+        cells = ()
+        if self.piece:
+            key, index, row, column = self.piece
+            piece = ORIENTATIONS[KEYS[key]][index]
+            cells = [(row + y, column + x) for y, x in piece.cells]
+        board = self.board.as_strings(cells)
+        lines = ['Score {}  Level {}  Lines {}  Pieces {}{}'.format(
+                    self.score, self.level, self.lines, self.pieces, '  Lost' if self.lost else '')]
+        lines += ['|' + ''.join({'x':'#', '*':'*'}.get(cell, ' ') for cell in row) + '|'
+                    for row in board]
+        return '\n'.join(lines)
+
+def encode(kind, fields):
+    '''
+    Returns a record as bytes
+    Parameters:
+        kind (int): the kind of record, not KEYFRAME, see Spectator.keyframe()
+        fields (tuple): its fields
+    '''
+    return bytes((kind,)) + RECORDS[kind].pack(*fields)
+
+def decode(data):
+    '''
+    Yields the (kind, fields) of the records in the uncompressed data of a chunk
+    Parameter:
+        data (bytes): the records
+    '''
+    start = 0
+    while start < len(data):
+        kind = data[start]
+        start += 1
+        if kind == KEYFRAME:
+            width, height, score, level, lines, pieces = KEYFRAME_HEADER.unpack_from(data, start)
+            start += KEYFRAME_HEADER.size
+            size = (width + 7)//8
+            rows = [int.from_bytes(data[start + y*size:start + (y+1)*size], 'little')
+                        for y in range(height)]
+            start += height*size
+            yield kind, (width, height, score, level, lines, pieces, rows, None, None)
+        else:
+            record = RECORDS[kind]
+            yield kind, record.unpack_from(data, start)
+            start += record.size
+
+def read_chunks(file):
+    '''
+    Yields the (milliseconds, uncompressed records) of the chunks in a stream until it ends
+    Parameter:
+        file (file): a binary file or socket.makefile('rb') to read from
+    '''
+    while True:
+        header = file.read(CHUNK.size)
+        if len(header) < CHUNK.size:
+            return
+        length, milliseconds = CHUNK.unpack(header)
+        data = file.read(length)
+        if len(data) < length:
+            return
+        yield milliseconds, zlib.decompress(data)
+
+class FileSink():
+    def __init__(self, path):
+        '''
+        path is the name of the file the stream is appended to
+        '''
+        self.file = open(path, 'ab')
+
+    def write(self, chunk):
+        self.file.write(chunk)
+        self.file.flush()
+
+    def service(self, spectator, milliseconds):
+        pass
+
+    def close(self):
+        self.file.close()
+
+class SocketSink():
+    def __init__(self, path):
+        '''
+        path is the name of the Unix socket a viewer listens on
+        '''
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.socket.connect(path)
+
+    def write(self, chunk):
+        # Blocks the writing thread if the viewer falls behind, the queue then drops frames
+        self.socket.sendall(chunk)
+
+    def service(self, spectator, milliseconds):
+        pass
+
+    def close(self):
+        self.socket.close()
+
+class BroadcastSink():
+    def __init__(self, path):
+        '''
+        path is the name of the Unix socket viewers connect to. Every viewer starts with a
+        keyframe, and a viewer that falls more than MAX_BACKLOG bytes behind misses chunks
+        until it caught up and gets a keyframe again
+        '''
+        if os.path.exists(path):
+            os.unlink(path) # left behind by an earlier game
+        self.path = path
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server.bind(path)
+        self.server.listen()
+        self.server.setblocking(False)
+        # The bytes that still have to be sent to each viewer by socket,
+        # and the viewers that missed chunks and need a keyframe
+        self.backlogs = {}
+        self.behind = set()
+
+    def write(self, chunk):
+        for viewer, backlog in self.backlogs.items():
+            if viewer in self.behind:
+                continue
+            if len(backlog) > MAX_BACKLOG:
+                self.behind.add(viewer)
+                continue
+            backlog += chunk
+        self.flush()
+
+    def service(self, spectator, milliseconds):
+        '''
+        Accept new viewers and catch up the viewers that fell behind with a keyframe
+        Parameters:
+            spectator (Spectator): the current state of the game
+            milliseconds (int): the time since the stream started
+        '''
+        while True:
+            try:
+                viewer, address = self.server.accept()
+            except BlockingIOError:
+                break
+            viewer.setblocking(False)
+            self.backlogs[viewer] = bytearray()
+            self.behind.add(viewer)
+        if spectator.board is not None:
+            for viewer in list(self.behind):
+                backlog = self.backlogs[viewer]
+                if not backlog: # the chunks it got so far have been sent
+                    backlog += chunk_bytes(spectator.keyframe(), milliseconds)
+                    self.behind.discard(viewer)
+        self.flush()
+
+    def flush(self):
+        '''
+        Send as much of every backlog as the sockets take without blocking, drop viewers that left
+        '''
+        for viewer, backlog in list(self.backlogs.items()):
+            if not backlog:
+                continue
+            try:
+                sent = viewer.send(backlog)
+            except BlockingIOError:
+                continue
+            except OSError:
+                viewer.close()
+                del self.backlogs[viewer]
+                self.behind.discard(viewer)
+                continue
+            del backlog[:sent]
+
+    def close(self):
+        for viewer in self.backlogs:
+            viewer.close()
+        self.server.close()
+        os.unlink(self.path)
+
+def make_sink(target):
+    '''
+    Returns the sink for a target: 'unix:<path>' to write to a Unix socket a viewer listens on,
+    'broadcast:<path>' to listen on a Unix socket for any number of viewers, or a file name
+    Parameter:
+        target (str): the target
+    '''
+    kind, _, path = target.partition(':')
+    if kind == 'unix':
+        return SocketSink(path)
+    if kind == 'broadcast':
+        return BroadcastSink(path)
+    return FileSink(target)
+
+def chunk_bytes(records, milliseconds):
+    '''
+    Returns a compressed chunk with its header
+    Parameters:
+        records (bytes): the records
+        milliseconds (int): the time since the stream started
+    '''
+    data = zlib.compress(records, 1)
+    return CHUNK.pack(len(data), milliseconds) + data
+
+class Publisher():
+    def __init__(self, engine, target, size=QUEUE_SIZE, clock=time.monotonic):
+        '''
+        engine is the TetrisEngine to publish, the publisher listens to its events
+        target is where the stream goes, see make_sink()
+        size is the number of events the queue holds
+        clock returns the current time in seconds
+        '''
+        self.engine = engine
+        self.sink = make_sink(target)
+        self.size = size
+        self.clock = clock
+        self.start = clock()
+        self.frames = collections.deque()
+        self.condition = threading.Condition()
+        self.closing = False
+        self.dropped = 0 # events that did not make it into the stream
+        # The queue overflowed and events are dropped until the next keyframe, which is taken
+        # at the next spawn, as halfway through a spawn or a lock the engine is not settled
+        self.resync = False
+        self.chunks = 0
+        self.bytes = 0
+        engine.listeners.append(self.on_event)
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def snapshot(self):
+        '''
+        Returns a keyframe of the current state of the engine
+        '''
+        engine = self.engine
+        preview = engine.preview_piece.orientation
+        return (KEYFRAME, (engine.board_width, engine.board_height, engine.score,
+                           engine.level, engine.cleared_lines, engine.pieces,
+                           engine.bitboard.rows[:],
+                           piece_fields(engine.active_piece) if engine.piece_is_active else None,
+                           (KEYS.index(preview.key), preview.index)))
+
+    def on_event(self, event, *args):
+        '''
+        Queue the events that change what a spectator sees
+        Parameters:
+            event (str): the name of the event
+            args: the arguments belonging to the event
+        '''
+        if event == 'move':
+            self.put((MOVE, piece_fields(args[0])))
+        elif event == 'spawn':
+            if self.engine.pieces == 1 or self.resync: # a new game or the queue overflowed
+                self.put(self.snapshot())
+            else:
+                self.put((SPAWN, piece_fields(args[0])))
+        elif event == 'lock':
+            self.put((LOCK, piece_fields(args[0])))
+        elif event == 'preview': # spectators see the next piece, not the whole queue
+            orientation = self.engine.preview_piece.orientation
+            self.put((PREVIEW, (KEYS.index(orientation.key), orientation.index)))
+        elif event == 'clear':
+            line_numbers = args[0]
+            first = line_numbers[0]
+            self.put((CLEAR, (self.engine.score, first,
+                              sum(1 << (line - first) for line in line_numbers))))
+        elif event == 'levelup':
+            self.put((LEVELUP, args))
+        elif event == 'garbage':
+            self.put((GARBAGE, args))
+        elif event == 'lose':
+            if self.resync: # the game ended before the next spawn
+                self.put(self.snapshot())
+            self.put((LOSE, ()))
+        elif event == 'restore': # the whole board changed
+            self.put(self.snapshot())
+
+    def put(self, frame):
+        '''
+        Add a frame to the queue. When the queue is full, a move replaces the move before it,
+        a keyframe or the end of the game start the queue again with a keyframe, and anything
+        else empties the queue, which then waits for the keyframe of the next spawn
+        Parameter:
+            frame (tuple): the (kind, fields) of a record
+        '''
+        with self.condition:
+            frames = self.frames
+            if self.resync:
+                if frame[0] != KEYFRAME:
+                    self.dropped += 1
+                    return
+                self.resync = False
+                frames.append(frame)
+            elif len(frames) >= self.size:
+                self.dropped += 1
+                if frame[0] == MOVE and frames[-1][0] == MOVE:
+                    frames[-1] = frame
+                else:
+                    self.dropped += len(frames)
+                    frames.clear()
+                    if frame[0] == KEYFRAME:
+                        frames.append(frame)
+                    elif frame[0] == LOSE: # the game is over, nothing else changes
+                        frames.extend((self.snapshot(), frame))
+                    else:
+                        self.resync = True
+            else:
+                frames.append(frame)
+            self.condition.notify()
+
+    def run(self):
+        '''
+        Encode the queued frames and write them to the sink, runs on a thread of its own
+        '''
+        spectator = Spectator() # what the viewers know, to make keyframes for new viewers
+        while True:
+            with self.condition:
+                if not self.frames and not self.closing:
+                    self.condition.wait(ACCEPT_INTERVAL)
+                frames = list(self.frames)
+                self.frames.clear()
+                closing = self.closing
+            milliseconds = int((self.clock() - self.start)*1000)
+            records = []
+            for kind, fields in frames:
+                if spectator.board is None and kind != KEYFRAME: # before the first game
+                    continue
+                spectator.apply(kind, fields)
+                records.append(spectator.keyframe() if kind == KEYFRAME else encode(kind, fields))
+            if records:
+                chunk = chunk_bytes(b''.join(records), milliseconds)
+                self.sink.write(chunk)
+                self.chunks += 1
+                self.bytes += len(chunk)
+            self.sink.service(spectator, milliseconds)
+            if closing:
+                self.sink.close()
+                return
+
+    def close(self):
+        '''
+        Write the queued frames and stop the writing thread
+        '''
+        with self.condition:
+            self.closing = True
+            self.condition.notify()
+        self.thread.join()
+
+def piece_fields(piece):
+    '''
+    Returns the (key index, orientation index, row, column) of a piece
+    Parameter:
+        piece (Shape): the piece
+    '''
+    orientation = piece.orientation
+    return (KEYS.index(orientation.key), orientation.index, piece.row, piece.column)
+
+def play(target, policy, games, piece_time):
+    '''
+    Play headless games with a policy in real time and publish them
+    Parameters:
+        target (str): where the stream goes, see make_sink()
+        policy (str): the name of a policy, see sweep.load_policy()
+        games (int): the number of games to play
+        piece_time (float): the number of seconds per piece
+    '''
+    policy_function = load_policy(policy)
+    rng = random.Random()
+    engine = TetrisEngine()
+    publisher = Publisher(engine, target)
+    for game in range(games):
+        engine.new_game()
+        while not engine.game_over:
+            engine.tick() # spawns the next piece
+            for action in policy_function(engine, rng):
+                engine.step(action)
+                if not engine.piece_is_active:
+                    break
+            if engine.piece_is_active:
+                engine.step('snap_down')
+            time.sleep(piece_time)
+        print('Game {}: score {}, lines {}'.format(game + 1, engine.score, engine.cleared_lines))
+    publisher.close()
+    print('{} chunks, {} bytes, {} events dropped'.format(publisher.chunks, publisher.bytes,
+                                                          publisher.dropped))
+
+def watch(target, board=True):
+    '''
+    Follow a stream and print the game after every chunk
+    Parameters:
+        target (str): a file name, 'broadcast:<path>' to connect to a broadcast socket,
+            or 'unix:<path>' to listen on a Unix socket for a publisher
+        board (bool): print the board, otherwise only a line on the score
+    '''
+    kind, _, path = target.partition(':')
+    if kind == 'broadcast':
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        connection.connect(path)
+        file = connection.makefile('rb')
+    elif kind == 'unix':
+        if os.path.exists(path):
+            os.unlink(path)
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(path)
+        server.listen()
+        connection, address = server.accept()
+        file = connection.makefile('rb')
+    else:
+        file = open(target, 'rb')
+    spectator = Spectator()
+    clear = '\x1b[H\x1b[2J' if sys.stdout.isatty() else ''
+    for milliseconds, data in read_chunks(file):
+        for kind, fields in decode(data):
+            spectator.apply(kind, fields)
+        if spectator.board is None:
+            continue
+        if board:
+            print(clear + spectator.text())
+        else:
+            print('{:>8.1f} s  score {}, level {}, lines {}, pieces {}{}'.format(
+                    milliseconds/1000, spectator.score, spectator.level, spectator.lines,
+                    spectator.pieces, ', lost' if spectator.lost else ''))
+    file.close()
+
+def main(argv=None):
+    '''
+    Publishes or watches a stream from the command line
+    Parameter:
+        argv (list): the command line arguments, defaulting to sys.argv[1:]
+    '''
+    parser = argparse.ArgumentParser(description='Publish and watch Tetris games as a stream')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+    publish = commands.add_parser('play', help='play headless games and publish them')
+    publish.add_argument('target', help='a file, unix:<path> or broadcast:<path>')
+    publish.add_argument('--policy', default='flat', help='a policy from policies.py or module:function')
+    publish.add_argument('--games', type=int, default=1, help='number of games to play')
+    publish.add_argument('--piece-ms', type=int, default=100, help='milliseconds per piece')
+    follow = commands.add_parser('watch', help='print the games of a stream')
+    follow.add_argument('target', help='a file, unix:<path> or broadcast:<path>')
+    follow.add_argument('--scores', action='store_true', help='only print the scores')
+    args = parser.parse_args(argv)
+    if args.command == 'play':
+        play(args.target, args.policy, args.games, args.piece_ms/1000)
+    else:
+        watch(args.target, not args.scores)
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,213 @@
+# -------------------------------
+# Name: Tetris seed sweep
+# Author: Jasper Keijzer
+# Language: Python 3.6.9
+#
+# Plays many headless games on all CPU cores and prints aggregated
+# statistics. Every game gets its own seed, so every run is reproducible
+# Usage: python sweep.py --games 1000 --policy flat [--random]
+# -------------------------------
+
+import argparse
+import collections
+import importlib
+import json
+import multiprocessing
+import os
+import random
+import sys
+from engine import TetrisEngine
+from policies import POLICIES, POLICY_SEED
+from randomizers import RANDOMIZERS, make_randomizer
+
+def load_policy(name):
+    '''
+    Returns the policy with the given name, either one of POLICIES
+    or a function given as module:function
+    Parameter:
+        name (str): the name of the policy
+    '''
+    if name in POLICIES:
+        return POLICIES[name]
+    module, _, function = name.partition(':')
+    return getattr(importlib.import_module(module), function)
+
+def play_game(seed, policy='flat', random_mode=False, max_pieces=None,
+              board_width=10, board_height=24, randomizer=None):
+    '''
+    Plays one headless game and returns a summary of it as a dict
+    Parameters:
+        seed (int): seed for the pieces and the policy
+        policy (str): the name of the policy, see load_policy()
+        random_mode (bool): pick pieces completely random instead of from a bag of 7
+        max_pieces (int): stop the game after this many pieces, None to play until lost
+        board_width (int): the number of columns of the board
+        board_height (int): the number of rows of the board
+        randomizer (str): how the pieces are picked, see randomizers.make_randomizer()
+    '''
+    policy_function = load_policy(policy)
+    rng = random.Random(seed ^ POLICY_SEED)
+    now = [0.0]
+    engine = TetrisEngine(random_mode=random_mode, seed=seed, clock=lambda: now[0],
+                          board_width=board_width, board_height=board_height,
+                          randomizer=randomizer)
+    max_level = 0
+    while not engine.game_over and engine.pieces != max_pieces:
+        now[0] += engine.tickrate/1000
+        engine.tick() # spawns the next piece
+        for action in policy_function(engine, rng):
+            engine.step(action)
+            if not engine.piece_is_active:
+                break
+        if engine.piece_is_active:
+            engine.step('snap_down')
+        max_level = max(max_level, engine.level)
+    if engine.game_over:
+        cause = 'topout:' + engine.active_piece.key # the piece that reached the spawn rows
+    else:
+        cause = 'max_pieces'
+    return {'seed':seed, 'score':engine.score, 'lines':engine.cleared_lines,
+            'max_level':max_level, 'pieces':engine.pieces, 'cause':cause,
+            'duration':now[0]} # in seconds of game time
+
+def play_game_args(args):
+    '''
+    Calls play_game with a tuple of arguments, for use with Pool.imap_unordered
+    '''
+    return play_game(*args)
+
+class SweepStats():
+    def __init__(self):
+        self.games = 0
+        self.totals = collections.Counter() # sums of score, lines, max_level and pieces
+        self.best = {} # the summary with the highest value for each of those
+        self.worst = {}
+        self.causes = collections.Counter() # cause of death histogram
+        self.last = None # the summary that was added last
+
+    def add(self, summary):
+        '''
+        Merge the summary of one game into the statistics
+        Parameter:
+            summary (dict): a summary returned by play_game
+        '''
+        self.games += 1
+        self.last = summary
+        for name in ('score', 'lines', 'max_level', 'pieces'):
+            self.totals[name] += summary[name]
+            if name not in self.best or summary[name] > self.best[name][name]:
+                self.best[name] = summary
+            if name not in self.worst or summary[name] < self.worst[name][name]:
+                self.worst[name] = summary
+        self.causes[summary['cause']] += 1
+
+    def report(self):
+        '''
+        Returns the aggregated statistics as a dict
+        '''
+        return {'games':self.games,
+                'mean':{name:total/self.games for name, total in self.totals.items()},
+                'max':{name:summary[name] for name, summary in self.best.items()},
+                'max_seed':{name:summary['seed'] for name, summary in self.best.items()},
+                'min':{name:summary[name] for name, summary in self.worst.items()},
+                'causes':dict(self.causes)}
+
+def sweep(games, policy='flat', seed=0, random_mode=False, max_pieces=None,
+          processes=None, progress=None, board_width=10, board_height=24, randomizer=None):
+    '''
+    Plays games on a pool of processes and returns their SweepStats
+    Parameters:
+        games (int): the number of games to play
+        policy (str): the name of the policy, see load_policy()
+        seed (int): the seed of the first game, the others get the following seeds
+        random_mode (bool): pick pieces completely random instead of from a bag of 7
+        max_pieces (int): stop every game after this many pieces, None to play until lost
+        processes (int): the number of worker processes, defaulting to the number of CPUs
+        progress (function): called with the SweepStats after every finished game
+        board_width (int): the number of columns of the boards
+        board_height (int): the number of rows of the boards
+        randomizer (str): how the pieces are picked, see randomizers.make_randomizer()
+    '''
+    stats = SweepStats()
+    jobs = ((seed + game, policy, random_mode, max_pieces, board_width, board_height, randomizer)
+                for game in range(games))
+    processes = processes or os.cpu_count()
+    with multiprocessing.Pool(processes) as pool:
+        # Results are merged as soon as they come in, in whatever order they finish
+        chunksize = max(1, min(16, games//(processes*8)))
+        for summary in pool.imap_unordered(play_game_args, jobs, chunksize):
+            stats.add(summary)
+            if progress:
+                progress(stats)
+    return stats
+
+def main(argv=None):
+    '''
+    Runs the seed sweep from the command line
+    Parameter:
+        argv (list): the command line arguments, defaulting to sys.argv[1:]
+    '''
+    parser = argparse.ArgumentParser(description='Play headless Tetris games on all CPU cores')
+    parser.add_argument('--games', type=int, default=100, help='number of games to play')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the first game')
+    parser.add_argument('--policy', default='flat',
+                        help='one of {} or module:function'.format(', '.join(POLICIES)))
+    parser.add_argument('--random', action='store_true',
+                        help='pick pieces completely random instead of from a bag of 7')
+    parser.add_argument('--randomizer', metavar='NAME',
+                        help='how the pieces are picked, one of {} or sequence:<pieces>'.format(
+                                ', '.join(RANDOMIZERS)))
+    parser.add_argument('--max-pieces', type=int, default=None,
+                        help='stop every game after this many pieces')
+    parser.add_argument('--width', type=int, default=10, help='number of columns of the board')
+    parser.add_argument('--height', type=int, default=24, help='number of rows of the board')
+    parser.add_argument('--processes', type=int, default=None,
+                        help='number of worker processes, defaulting to the number of CPUs')
+    parser.add_argument('--json', action='store_true', help='print the statistics as JSON')
+    parser.add_argument('--db', help='also store the result of every game in this database, see scores.py')
+    args = parser.parse_args(argv)
+    if args.games < 1:
+        parser.error('at least 1 game is played')
+    if args.randomizer:
+        try:
+            make_randomizer(args.randomizer, random.Random())
+        except ValueError as error:
+            parser.error(str(error))
+    store = None
+    if args.db:
+        from scores import ScoreStore # imported here, it brings in sqlite3 and threads
+        store = ScoreStore(args.db)
+    source = 'sweep:' + args.policy
+
+    def progress(stats):
+        if store:
+            summary = stats.last
+            store.add({'score':summary['score'], 'lines':summary['lines'],
+                       'level':summary['max_level'], 'pieces':summary['pieces'],
+                       'duration':summary['duration'],
+                       'random':args.random or args.randomizer == 'random', 'spin':False,
+                       'hover':True, 'seed':summary['seed'], 'board_width':args.width,
+                       'board_height':args.height, 'source':source})
+        if not args.json and stats.games % max(1, args.games//10) == 0:
+            print('{} games, mean score {:.1f}'.format(stats.games,
+                                                         stats.totals['score']/stats.games))
+
+    stats = sweep(args.games, args.policy, args.seed, args.random, args.max_pieces,
+                  args.processes, progress, args.width, args.height, args.randomizer)
+    if store:
+        store.close()
+    report = stats.report()
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print('Games: {}'.format(report['games']))
+        for name in ('score', 'lines', 'max_level', 'pieces'):
+            print('{:>10}: mean {:.1f}, min {}, max {} (seed {})'.format(name,
+                    report['mean'][name], report['min'][name],
+                    report['max'][name], report['max_seed'][name]))
+        print('Causes of death:')
+        for cause, count in sorted(report['causes'].items(), key=lambda item: -item[1]):
+            print('{:>16}: {}'.format(cause, count))
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,588 @@
+# -------------------------------
+# Name: Tetris in the terminal
+# Author: Jasper Keijzer
+# Language: Python 3.6.9
+#
+# Plays the game in a terminal with the key bindings of the tkinter
+# version, e.g. over SSH without an X server. Two rows of the board share
+# a line of text, drawn with half block characters in 256 colors. The
+# screen remembers what every character on it shows, so a frame only
+# writes the characters that changed, in a single write, and frames are
+# drawn at most every FRAME milliseconds however often the pieces move.
+# The debug flag of tetris.py draws its board with the same view
+# Usage: python terminal.py [random] [nohover] [spin] [--width 10] [--height 24]
+# -------------------------------
+
+import argparse
+import heapq
+import itertools
+import os
+import random
+import select
+import sys
+import time
+from engine import TetrisEngine
+from gameloop import GameLoop
+from randomizers import RANDOMIZERS, make_randomizer
+from tetris import CLEAR_TIME, KEY_ACTIONS
+
+# The flags that can be given on the command line, see main()
+FLAGS = ('random', 'nohover', 'spin')
+# Time in milliseconds between two frames
+FRAME = 16
+# The 256 color palette colors of the pieces, close to the colors of tetris.py, and of garbage
+COLORS = {'S':2, 'Z':11, 'J':14, 'L':208, 'O':12, 'I':9, 'T':13, 'garbage':8}
+# The width in characters of the text next to the board
+INFO_WIDTH = 24
+# Terminal escape sequences
+CLEAR = '\x1b[2J'
+MOVE = '\x1b[{};{}H' # to a line and column, counting from 1
+RESET = '\x1b[0m'
+START = '\x1b[?1049h\x1b[?25l' # switch to the alternate screen and hide the cursor
+STOP = '\x1b[0m\x1b[?25h\x1b[?1049l' # show the cursor and switch back
+# The keys as the terminal sends them, by the names tkinter gives them, see KEY_ACTIONS.
+# A lone escape is the Escape key, an escape followed by more is one of the other keys
+KEY_SEQUENCES = {'\x1b[A':'Up', '\x1b[B':'Down', '\x1b[C':'Right', '\x1b[D':'Left',
+                 '\x1bOA':'Up', '\x1bOB':'Down', '\x1bOC':'Right', '\x1bOD':'Left',
+                 ' ':'space', '\x1b':'Escape', '\x0e':'Control-n', '\x0c':'Control-l'}
+
+# The (style, character) glyph of a character with the given top and bottom color, see glyph()
+GLYPHS = {}
+
+def glyph(top, bottom):
+    '''
+    Returns the (style, character) that shows two squares above each other
+    Parameters:
+        top (int): the color of the top square, None for an empty square
+        bottom (int): the color of the bottom square, None for an empty square
+    '''
+    key = (top, bottom)
+    if key not in GLYPHS:
+        if top is None and bottom is None:
+            GLYPHS[key] = (RESET, ' ')
+        elif top is None:
+            GLYPHS[key] = ('\x1b[0;38;5;{}m'.format(bottom), '▄') # lower half block
+        elif bottom is None:
+            GLYPHS[key] = ('\x1b[0;38;5;{}m'.format(top), '▀') # upper half block
+        else:
+            GLYPHS[key] = ('\x1b[0;38;5;{};48;5;{}m'.format(top, bottom), '▀')
+    return GLYPHS[key]
+
+def text_glyphs(text, width):
+    '''
+    Returns the glyphs of a text in the default colors, padded with spaces to a width
+    Parameters:
+        text (str): the text
+        width (int): the number of glyphs
+    '''
+    return [(RESET, char) for char in text[:width].ljust(width)]
+
+def parse_keys(data):
+    '''
+    Returns the names of the keys in what the terminal sent, see KEY_SEQUENCES
+    Parameter:
+        data (str): the characters read from the terminal
+    '''
+    keys = []
+    start = 0
+    while start < len(data):
+        for length in (3, 1):
+            name = KEY_SEQUENCES.get(data[start:start+length])
+            if name:
+                break
+        else:
+            name, length = data[start], 1
+        keys.append(name)
+        start += length
+    return keys
+
+class Screen():
+    def __init__(self, out):
+        '''
+        out is the text stream of the terminal, it must be able to write unicode
+        '''
+        self.out = out
+        self.lines = [] # the (style, character) glyph shown at every column of every line
+        self.pending = [] # what to write at the end of the frame
+        self.style = None # the style of the last written glyph
+        self.cursor = None # the (line, column) the next character is written at
+        self.bytes = 0 # the number of characters written
+
+    def put(self, line, column, glyphs):
+        '''
+        Show glyphs from a position on, only the ones that differ from what is shown are written
+        Parameters:
+            line (int): the line, counting from 0
+            column (int): the column of the first glyph, counting from 0
+            glyphs (list): (style, character) tuples
+        '''
+        while len(self.lines) <= line:
+            self.lines.append([])
+        shown = self.lines[line]
+        if len(shown) < column + len(glyphs):
+            shown.extend([None] * (column + len(glyphs) - len(shown)))
+        pending = self.pending
+        for x, new in enumerate(glyphs, column):
+            if shown[x] == new:
+                continue
+            shown[x] = new
+            if self.cursor != (line, x):
+                pending.append(MOVE.format(line + 1, x + 1))
+            style, char = new
+            if style != self.style:
+                pending.append(style)
+                self.style = style
+            pending.append(char)
+            self.cursor = (line, x + 1)
+
+    def flush(self):
+        '''
+        Write the changes of this frame in one go, returns the number of characters written
+        '''
+        if not self.pending:
+            return 0
+        data = ''.join(self.pending)
+        self.pending = []
+        self.out.write(data)
+        self.out.flush()
+        self.bytes += len(data)
+        return len(data)
+
+    def invalidate(self):
+        '''
+        Clear the terminal and forget what it showed, so everything is written again
+        '''
+        self.lines = []
+        self.pending.append(RESET + CLEAR)
+        self.style = RESET
+        self.cursor = None
+
+    def start(self):
+        '''
+        Take over the terminal
+        '''
+        self.out.write(START)
+
+    def stop(self):
+        '''
+        Give the terminal back as it was
+        '''
+        self.pending = []
+        self.out.write(STOP)
+        self.out.flush()
+
+class TerminalView():
+    def __init__(self, engine, out):
+        '''
+        engine is the TetrisEngine to draw, the view listens to its events
+        out is the text stream of the terminal
+        '''
+        self.engine = engine
+        self.screen = Screen(out)
+        self.status = '' # shown under the preview, e.g. Paused
+        self.message = '' # shown under the status
+        engine.listeners.append(self.on_event)
+        self.reset()
+
+    def reset(self):
+        '''
+        Start over with an empty board, e.g. for a new game
+        '''
+        engine = self.engine
+        self.width = engine.board_width
+        self.height = engine.board_height
+        self.cells = [[None] * self.width for row in range(self.height)] # colors of the settled squares
+        self.piece = {} # the color of each (row, column) of the active piece
+        self.status = ''
+        self.invalidate()
+
+    def invalidate(self):
+        '''
+        Draw the whole screen again at the next frame, e.g. after the terminal was resized
+        '''
+        screen = self.screen
+        screen.invalidate()
+        lines = (self.height + 1)//2
+        self.dirty = set(range(lines)) # the lines of the board to draw at the next frame
+        self.info_changed = True
+        # The border around the board, with dotted sides next to the spawn zone
+        spawn_lines = self.engine.spawn_rows//2
+        screen.put(0, 0, text_glyphs('┌' + '─'*self.width + '┐', self.width + 2))
+        for line in range(lines):
+            side = text_glyphs('┊' if line < spawn_lines else '│', 1)
+            screen.put(line + 1, 0, side)
+            screen.put(line + 1, self.width + 1, side)
+        screen.put(lines + 1, 0, text_glyphs('└' + '─'*self.width + '┘',
+                                             self.width + 2))
+
+    def start(self):
+        '''
+        Take over the terminal
+        '''
+        self.screen.start()
+        self.invalidate()
+
+    def close(self):
+        '''
+        Stop listening to the engine and give the terminal back
+        '''
+        self.engine.listeners.remove(self.on_event)
+        self.screen.stop()
+
+    def on_event(self, event, *args):
+        '''
+        Keep track of what the board looks like
+        Parameters:
+            event (str): the name of the event
+            args: the arguments belonging to the event
+        '''
+        if event in ('move', 'spawn'):
+            self.move_piece(args[0])
+        elif event == 'lock':
+            color = COLORS[args[0].key]
+            for (row, column) in self.piece:
+                self.cells[row][column] = color
+            self.piece = {}
+        elif event == 'clear':
+            line_numbers = args[0]
+            for row in line_numbers: # from the top down
+                del self.cells[row]
+                self.cells.insert(0, [None] * self.width)
+            self.dirty.update(range(line_numbers[-1]//2 + 1))
+            self.info_changed = True
+        elif event == 'garbage':
+            lines, hole = args
+            garbage = [COLORS['garbage']] * self.width
+            garbage[hole] = None
+            self.cells = self.cells[lines:] + [garbage[:] for line in range(lines)]
+            self.dirty.update(range((self.height + 1)//2))
+        elif event == 'lose':
+            self.status = 'Game over'
+            self.info_changed = True
+        elif event == 'restore':
+            self.reset()
+            for row, column, key in args[0].squares():
+                self.cells[row][column] = COLORS.get(key, COLORS['garbage'])
+            if self.engine.piece_is_active:
+                self.move_piece(self.engine.active_piece)
+            elif self.engine.game_over:
+                self.status = 'Game over'
+        elif event in ('preview', 'levelup'):
+            self.info_changed = True
+
+    def move_piece(self, piece):
+        '''
+        Draw the active piece at its new position at the next frame
+        Parameter:
+            piece (Shape): the active piece
+        '''
+        dirty = self.dirty
+        for row, column in self.piece:
+            dirty.add(row//2)
+        color = COLORS[piece.key]
+        self.piece = {cell:color for cell in piece.cells()}
+        for row, column in self.piece:
+            dirty.add(row//2)
+
+    def frame(self):
+        '''
+        Draw what changed since the last frame, returns the number of characters written
+        '''
+        if self.dirty:
+            cells = self.cells
+            piece = self.piece
+            height = self.height
+            empty = [None] * self.width
+            for line in self.dirty:
+                top = cells[2*line]
+                bottom = cells[2*line + 1] if 2*line + 1 < height else empty
+                if piece:
+                    top = [piece.get((2*line, column), color) for column, color in enumerate(top)]
+                    bottom = [piece.get((2*line + 1, column), color)
+                                for column, color in enumerate(bottom)]
+                self.screen.put(line + 1, 1, [glyph(*pair) for pair in zip(top, bottom)])
+            self.dirty.clear()
+        if self.info_changed:
+            self.draw_info()
+            self.info_changed = False
+        return self.screen.flush()
+
+    def draw_info(self):
+        '''
+        Draw the score, level, lines and upcoming pieces next to the board
+        '''
+        engine = self.engine
+        screen = self.screen
+        column = self.width + 4
+        lines = ['Score: {}'.format(engine.score),
+                 'High score: {}'.format(engine.high_score),
+                 'Level: {}'.format(engine.level),
+                 'Highest level: {}'.format(engine.high_level),
+                 'Lines: {}'.format(engine.cleared_lines),
+                 '',
+                 'Next:']
+        for line, text in enumerate(lines, 1):
+            screen.put(line, column, text_glyphs(text, INFO_WIDTH))
+        line += 1
+        for piece in engine.queue: # 2 lines for each piece and 1 in between
+            rows = [[None] * 4 for row in range(4)]
+            color = COLORS[piece.key]
+            for y, x in piece.orientation.cells:
+                rows[y][x] = color
+            for top, bottom in ((rows[0], rows[1]), (rows[2], rows[3])):
+                screen.put(line, column, [glyph(*pair) for pair in zip(top, bottom)])
+                line += 1
+            line += 1
+        for text in (self.status, self.message):
+            screen.put(line, column, text_glyphs(text, INFO_WIDTH))
+            line += 1
+
+class TerminalRoot():
+    def __init__(self, fd, clock=time.perf_counter):
+        '''
+        fd is the file descriptor of the terminal to read the keys from. This stands in for
+        the tkinter window: GameLoop schedules its wakeups with after() and after_cancel()
+        clock returns the current time in seconds
+        '''
+        self.fd = fd
+        self.clock = clock
+        self.timers = [] # heap of [due time, number, callback]
+        self.count = itertools.count()
+        self.handler = None # called with the name of every key that is pressed
+        self.running = False
+
+    def after(self, delay, callback):
+        '''
+        Call a function after a delay and return a timer that can be cancelled
+        Parameters:
+            delay (int): the delay in milliseconds
+            callback (function): the function to call
+        '''
+        timer = [self.clock() + delay/1000, next(self.count), callback]
+        heapq.heappush(self.timers, timer)
+        return timer
+
+    def after_cancel(self, timer):
+        '''
+        Cancel a timer returned by after()
+        Parameter:
+            timer (list): the timer
+        '''
+        timer[2] = None
+
+    def bind(self, handler):
+        '''
+        Pass every key press on to a function
+        Parameter:
+            handler (function): called with the name of the key, see KEY_SEQUENCES
+        '''
+        self.handler = handler
+
+    def mainloop(self):
+        '''
+        Wait for key presses and timers and handle them until destroy() is called
+        '''
+        self.running = True
+        timers = self.timers
+        while self.running:
+            while timers and timers[0][2] is None:
+                heapq.heappop(timers)
+            timeout = max(0, timers[0][0] - self.clock()) if timers else None
+            if select.select([self.fd], [], [], timeout)[0]:
+                data = os.read(self.fd, 1024).decode('utf-8', 'replace')
+                for key in parse_keys(data):
+                    self.handler(key)
+            now = self.clock()
+            while self.running and timers and timers[0][0] <= now:
+                callback = heapq.heappop(timers)[2]
+                if callback:
+                    callback()
+
+    def destroy(self):
+        '''
+        Stop the main loop
+        '''
+        self.running = False
+
+class TerminalGame():
+    def __init__(self, root, out, random_mode=False, spin=False, hover=True,
+                 board_width=10, board_height=24, spawn_rows=4, randomizer=None, preview_size=1,
+                 frame=FRAME):
+        '''
+        root is the TerminalRoot to play in
+        out is the text stream of the terminal
+        random_mode, spin, hover, board_width, board_height, spawn_rows, randomizer and
+            preview_size are the game settings, see TetrisEngine
+        frame is the time in milliseconds between two frames
+        '''
+        self.root = root
+        self.loop = GameLoop(root)
+        self.engine = TetrisEngine(random_mode=random_mode, spin=spin, hover=hover,
+                                   clock=self.loop.clock, board_width=board_width,
+                                   board_height=board_height, spawn_rows=spawn_rows,
+                                   randomizer=randomizer, preview_size=preview_size)
+        self.engine.listeners.append(self.on_event)
+        self.view = TerminalView(self.engine, out)
+        self.frame = frame
+        self.paused = False
+        self.ticking = None
+        self.spawning = None
+        root.bind(self.key)
+
+    def start(self):
+        '''
+        Take over the terminal, start the first game and draw the frames
+        '''
+        self.view.start()
+        self.new_game()
+        self.draw()
+
+    def new_game(self):
+        '''
+        Start a new game, the first piece spawns after one tick
+        '''
+        self.loop.cancel(self.ticking)
+        self.loop.cancel(self.spawning)
+        self.engine.new_game()
+        self.view.reset()
+        self.paused = False
+        self.spawning = self.loop.after(self.engine.tickrate, self.engine.spawn)
+        self.ticking = self.loop.after(self.engine.tickrate*2, self.tick)
+
+    def draw(self):
+        '''
+        Draw what changed and call itself after the frame time
+        '''
+        self.view.frame()
+        self.loop.after(self.frame, self.draw)
+
+    def key(self, name):
+        '''
+        Handle a key press
+        Parameter:
+            name (str): the name of the key, see KEY_SEQUENCES
+        '''
+        if name == 'Control-n':
+            self.new_game()
+        elif name == 'Control-l':
+            self.view.invalidate()
+        elif name == 'Escape':
+            self.pause()
+        elif name in KEY_ACTIONS and not self.paused:
+            self.engine.step(KEY_ACTIONS[name])
+
+    def pause(self):
+        '''
+        Pause the game or resume it when it is paused
+        '''
+        if self.engine.piece_is_active and not self.paused:
+            self.paused = True
+            self.loop.cancel(self.ticking)
+            self.view.status = 'Paused, Escape resumes'
+        elif self.paused:
+            self.paused = False
+            self.ticking = self.loop.after(self.engine.tickrate, self.tick)
+            self.view.status = ''
+        self.view.info_changed = True
+
+    def tick(self):
+        '''
+        Shifts the active piece down one row and calls itself after self.engine.tickrate
+        '''
+        if self.engine.piece_is_active:
+            self.engine.tick()
+        self.ticking = self.loop.after(self.engine.tickrate, self.tick)
+
+    def on_event(self, event, *args):
+        '''
+        Spawn the next piece once a piece settled, like tetris.py does
+        Parameters:
+            event (str): the name of the event
+            args: the arguments belonging to the event
+        '''
+        if event == 'settle':
+            tickrate = self.engine.tickrate
+            self.spawning = self.loop.after(CLEAR_TIME if args[0] and tickrate < CLEAR_TIME
+                                                else tickrate, self.engine.spawn)
+        elif event == 'lose':
+            self.loop.cancel(self.ticking)
+            self.view.message = 'Ctrl+N for a new game'
+
+def open_console():
+    '''
+    Returns a text stream to standard output that writes unicode whatever the locale
+    '''
+    return open(sys.stdout.fileno(), 'w', encoding='utf-8', closefd=False)
+
+def main(argv=None):
+    '''
+    Plays the game in the terminal from the command line, returns the exit code
+    Parameter:
+        argv (list): the command line arguments, defaulting to sys.argv[1:]
+    '''
+    parser = argparse.ArgumentParser(description='Play Tetris in the terminal. The keys are the '
+                                     'same as in tetris.py, Ctrl+L redraws and Ctrl+C quits')
+    parser.add_argument('options', nargs='*', metavar='flag',
+                        help='any of {}'.format(', '.join(FLAGS)))
+    parser.add_argument('--width', type=int, default=10, help='number of columns of the board')
+    parser.add_argument('--height', type=int, default=24, help='number of rows of the board')
+    parser.add_argument('--spawn-rows', type=int, default=4,
+                        help='number of rows at the top that lose the game when a piece settles in them')
+    parser.add_argument('--randomizer', metavar='NAME',
+                        help='how the pieces are picked, one of {} or sequence:<pieces>'.format(
+                                ', '.join(RANDOMIZERS)))
+    parser.add_argument('--preview', type=int, default=1, help='number of upcoming pieces to show')
+    parser.add_argument('--fps', type=int, default=1000//FRAME, help='the most frames per second')
+    args = parser.parse_args(argv)
+    for option in args.options:
+        if option not in FLAGS:
+            parser.error('unknown flag: {}'.format(option))
+    if args.width < 4:
+        parser.error('the board must be at least 4 columns wide')
+    if not 2 <= args.spawn_rows < args.height - 1:
+        parser.error('the spawn rows must be at least 2 and leave 2 rows to play in')
+    if args.preview < 1:
+        parser.error('at least 1 upcoming piece is shown')
+    if args.fps < 1:
+        parser.error('at least 1 frame per second is drawn')
+    if args.randomizer:
+        try:
+            make_randomizer(args.randomizer, random.Random())
+        except ValueError as error:
+            parser.error(str(error))
+    try:
+        import termios
+        import tty
+    except ImportError:
+        print('The termios module cannot be found, the terminal version needs a Unix terminal')
+        return 1
+    fd = sys.stdin.fileno()
+    if not os.isatty(fd):
+        print('Standard input is not a terminal')
+        return 1
+    out = open_console()
+    root = TerminalRoot(fd)
+    game = TerminalGame(root, out,
+                        random_mode='random' in args.options,
+                        spin='spin' in args.options,
+                        hover='nohover' not in args.options,
+                        board_width=args.width,
+                        board_height=args.height,
+                        spawn_rows=args.spawn_rows,
+                        randomizer=args.randomizer,
+                        preview_size=args.preview,
+                        frame=max(1, 1000//args.fps))
+    settings = termios.tcgetattr(fd)
+    tty.setcbreak(fd) # keys come in as they are pressed and are not shown, Ctrl+C still works
+    try:
+        game.start()
+        root.mainloop()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        game.view.close()
+        termios.tcsetattr(fd, termios.TCSADRAIN, settings)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
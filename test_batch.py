@@ -0,0 +1,84 @@
+# -------------------------------
+# Name: Tetris batch simulator tests
+# Author: Jasper Keijzer
+# Language: Python 3.6.9
+#
+# Plays the same random inputs on a TetrisEngine and on one board of
+# BatchTetris, fed with the pieces of the engine, and checks after every
+# input that both hold the same board, piece, score and level
+# Usage: python -m pytest test_batch.py
+# -------------------------------
+
+import random
+import pytest
+from engine import ACTIONS, TetrisEngine
+
+np = pytest.importorskip('numpy')
+from batch import KEYS, BatchTetris
+
+# How often each action of ACTIONS is picked, snapping less often to keep the games going
+WEIGHTS = (3, 3, 2, 2, 2, 1, 1, 1)
+
+def state(engine, batch):
+    '''
+    Returns what the engine and the first board of the batch should agree on, for both
+    Parameters:
+        engine (TetrisEngine): the engine
+        batch (BatchTetris): the batch simulator
+    '''
+    piece = engine.active_piece
+    engine_state = (engine.bitboard.rows, engine.score, engine.cleared_lines, engine.level,
+                    engine.pieces, engine.piece_is_active, engine.game_over, engine.tickrate)
+    batch_state = (batch.rows[0].tolist(), int(batch.score[0]), int(batch.cleared_lines[0]),
+                   int(batch.level[0]), int(batch.pieces[0]), bool(batch.piece_is_active[0]),
+                   bool(batch.game_over[0]), int(batch.tickrate[0]))
+    if engine.piece_is_active:
+        engine_state += (KEYS.index(piece.key), piece.orientation.index, piece.row,
+                         piece.column, piece.rotation_index)
+        batch_state += (int(batch.key[0]), int(batch.orientation[0]), int(batch.row[0]),
+                        int(batch.column[0]), int(batch.rotation_index[0]))
+    return engine_state, batch_state
+
+@pytest.mark.parametrize('options', [{}, {'random_mode':True, 'spin':True}, {'hover':False},
+                                     {'board_width':6, 'board_height':16, 'spawn_rows':2}])
+def test_same_as_engine(options):
+    for seed in range(2):
+        now = [0]
+        engine = TetrisEngine(seed=seed, clock=lambda: now[0]/1000, **options)
+        batch = BatchTetris(1, auto_reset=False, **options)
+        full = batch.full
+
+        def preview(idx): # the batch gets the pieces of the engine
+            if len(idx):
+                piece = engine.preview_piece
+                batch.preview_key[idx] = KEYS.index(piece.key)
+                batch.preview_orientation[idx] = piece.orientation.index
+                batch.preview_time[idx] = batch.now[idx]
+        batch.preview = preview
+        preview(np.array([0]))
+        rng = random.Random(seed)
+        for step in range(3000):
+            if engine.game_over:
+                engine.new_game()
+                batch.new_game(np.array([True]))
+            if step % 100 == 0 and not engine.piece_is_active:
+                # a stack with holes and a level further on, to clear lines and level up
+                rows = [0] * (engine.board_height//2) + [
+                    full & ~(1 << rng.randrange(engine.board_width))
+                        for _ in range(engine.board_height - engine.board_height//2)]
+                engine.bitboard.rows[:] = rows
+                engine.bitboard.recompute_tops()
+                batch.rows[0] = rows
+                engine.cleared_lines = batch.cleared_lines[0] = rng.randrange(300)
+                engine.levelup = batch.levelup[0] = rng.randrange(10)
+                engine.level = batch.level[0] = engine.cleared_lines//10
+            if rng.random() < 0.3:
+                now[0] += engine.tickrate
+                engine.tick()
+                batch.tick()
+            else:
+                action = rng.choices(range(len(ACTIONS)), WEIGHTS)[0]
+                engine.step(ACTIONS[action])
+                batch.step([action + 1])
+            engine_state, batch_state = state(engine, batch)
+            assert engine_state == batch_state, 'step {}'.format(step)
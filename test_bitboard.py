@@ -0,0 +1,73 @@
+# -------------------------------
+# Name: Tetris bitboard tests
+# Author: Jasper Keijzer
+# Language: Python 3.6.9
+#
+# Clears lines and adds garbage on random boards and checks the rows
+# and the tops of the columns against a plain list of rows
+# Usage: python -m pytest test_bitboard.py
+# -------------------------------
+
+import random
+from bitboard import BitBoard
+
+def random_board(rng, width, height):
+    '''
+    Returns a BitBoard with random squares in its lower half and some full rows
+    Parameters:
+        rng (random.Random): the random number generator
+        width (int): the number of columns of the board
+        height (int): the number of rows of the board
+    '''
+    board = BitBoard(width, height)
+    for row in range(height//2, height):
+        board.rows[row] = board.full if rng.random() < 0.3 else rng.getrandbits(width)
+    board.recompute_tops()
+    return board
+
+def expected_tops(rows, width, height):
+    '''
+    Returns the index of the highest filled row in each column, height if it is empty
+    Parameters:
+        rows (list): the row bitmasks
+        width (int): the number of columns of the board
+        height (int): the number of rows of the board
+    '''
+    return [next((row for row, bits in enumerate(rows) if bits >> x & 1), height)
+                for x in range(width)]
+
+def test_clear():
+    rng = random.Random(1)
+    for width, height in ((10, 24), (4, 8), (16, 40)):
+        for _ in range(200):
+            board = random_board(rng, width, height)
+            line_numbers = [row for row, bits in enumerate(board.rows) if bits == board.full]
+            if not line_numbers:
+                continue
+            kept = [bits for bits in board.rows if bits != board.full]
+            board.clear(line_numbers)
+            assert board.rows == [0] * len(line_numbers) + kept
+            assert board.tops == expected_tops(board.rows, width, height)
+
+def test_add_garbage():
+    rng = random.Random(2)
+    for width, height in ((10, 24), (4, 8), (16, 40)):
+        for _ in range(200):
+            board = random_board(rng, width, height)
+            lines = rng.randrange(1, height)
+            hole = rng.randrange(width)
+            rows = board.rows[lines:] + [board.full & ~(1 << hole)] * lines
+            board.add_garbage(lines, hole)
+            assert board.rows == rows
+            assert board.tops == expected_tops(board.rows, width, height)
+
+def test_place_then_clear():
+    board = BitBoard(4, 6)
+    board.rows[4:] = [0b0111, 0b1011]
+    board.recompute_tops()
+    # a vertical I piece in column 3 completes row 4, the bottom row keeps its hole
+    line_numbers = board.place((1, 1, 1, 1), 1, 3)
+    assert line_numbers == [4]
+    board.clear(line_numbers)
+    assert board.rows == [0, 0, 0b1000, 0b1000, 0b1000, 0b1011]
+    assert board.tops == [5, 5, 6, 2]
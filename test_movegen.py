@@ -0,0 +1,99 @@
+# -------------------------------
+# Name: Tetris move generation tests
+# Author: Jasper Keijzer
+# Language: Python 3.6.9
+#
+# Checks placements() against a plain search over every move of the
+# piece on random boards with overhangs, and plays the actions of every
+# placement on an engine to see that the piece settles where it says
+# Usage: python -m pytest test_movegen.py
+# -------------------------------
+
+import collections
+import random
+from engine import TetrisEngine
+from movegen import placements, spawn_state
+from pieces import ORIENTATIONS
+
+WIDTH = 10
+HEIGHT = 24
+
+def random_rows(rng):
+    '''
+    Returns the rows of a random board with overhangs and without full rows. Some stacks
+    are low enough for placements() to skip the search in the open air, others reach the top
+    Parameter:
+        rng (random.Random): the random number generator
+    '''
+    full = (1 << WIDTH) - 1
+    rows = [0] * HEIGHT
+    for row in range(rng.choice((1, 2, 5, 10, 16, 20)), HEIGHT):
+        rows[row] = rng.getrandbits(WIDTH) & rng.getrandbits(WIDTH) | rng.getrandbits(WIDTH)
+        if rows[row] == full:
+            rows[row] &= ~(1 << rng.randrange(WIDTH))
+    return rows
+
+def resting_positions(bitboard, start):
+    '''
+    Returns the (masks, row, column) of every position the piece settles in when it is
+    dropped from any state it can reach by shifting, moving down and rotating
+    Parameters:
+        bitboard (BitBoard): the board
+        start (tuple): the (orientation, row, column, rotation_index) of the piece
+    '''
+    seen = {start}
+    todo = collections.deque([start])
+    result = set()
+    while todo:
+        orientation, row, column, rotation_index = todo.popleft()
+        result.add((orientation.masks,
+                    row + bitboard.drop_distance(orientation, row, column), column))
+        moves = [(orientation, row, column-1, rotation_index),
+                 (orientation, row, column+1, rotation_index),
+                 (orientation, row+1, column, rotation_index)]
+        for rotations in (orientation.left, orientation.right):
+            if rotations:
+                new, new_rotation_index, offsets = rotations[rotation_index]
+                for y, x in offsets:
+                    if not bitboard.collides(new.masks, row+y, column+x, new.width):
+                        moves.append((new, row+y, column+x, new_rotation_index))
+                        break
+        for state in moves:
+            new, new_row, new_column, _ = state
+            if (state not in seen
+                and not bitboard.collides(new.masks, new_row, new_column, new.width)):
+                seen.add(state)
+                todo.append(state)
+    return result
+
+def test_placements():
+    rng = random.Random(7)
+    for trial in range(40):
+        rows = random_rows(rng)
+        for key in ORIENTATIONS:
+            engine = TetrisEngine(seed=trial, clock=lambda: 0.0)
+            engine.bitboard.rows[:] = rows
+            engine.bitboard.recompute_tops()
+            orientation = ORIENTATIONS[key][rng.randrange(4)]
+            start = spawn_state(orientation, WIDTH)
+            if engine.bitboard.collides(orientation.masks, start[1], start[2], orientation.width):
+                continue
+            found = placements(engine.bitboard, *start)
+            positions = [(placement.orientation.masks, placement.row, placement.column)
+                            for placement in found]
+            assert len(positions) == len(set(positions))
+            assert set(positions) == resting_positions(engine.bitboard, start)
+            for placement, position in zip(found, positions):
+                game = TetrisEngine(seed=trial, clock=lambda: 0.0)
+                game.bitboard.rows[:] = rows
+                game.bitboard.recompute_tops()
+                game.piece_is_active = True
+                game.active_piece = game.queued_piece(orientation)
+                game.active_piece.column = start[2]
+                locked = []
+                game.listeners.append(lambda event, *args: event == 'lock' and locked.append(
+                    (args[0].orientation.masks, args[0].row, args[0].column)))
+                for action in placement.actions:
+                    assert game.piece_is_active
+                    game.step(action)
+                assert locked == [position]
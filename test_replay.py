@@ -0,0 +1,95 @@
+# -------------------------------
+# Name: Tetris replay tests
+# Author: Jasper Keijzer
+# Language: Python 3.6.9
+#
+# Records games with random inputs and checks that playing the replay
+# back on a new engine goes through the same events and ends with the
+# same board and score
+# Usage: python -m pytest test_replay.py
+# -------------------------------
+
+import random
+import pytest
+from engine import ACTIONS, TetrisEngine
+from policies import flat_policy
+from replay import CODES, MAX_DELTA, SPAWN, TICK, Player, Recorder, Replay
+
+SETTINGS = [{},
+            {'random_mode':True, 'spin':True, 'hover':False},
+            {'board_width':8, 'board_height':20, 'spawn_rows':3,
+             'randomizer':'history', 'preview_size':3}]
+
+def record_game(seed, settings, steps=5000):
+    '''
+    Plays a game with the moves of flat_policy mixed with random inputs at random times and
+    returns the Recorder, the engine and the events of the engine
+    Parameters:
+        seed (int): the seed of the game and the inputs
+        settings (dict): the settings of the game, see TetrisEngine
+        steps (int): the number of inputs, fewer if the game is lost before
+    '''
+    rng = random.Random(seed)
+    now = [0.0]
+    recorder = Recorder(seed, clock=lambda: now[0], **settings)
+    engine = TetrisEngine(clock=recorder.clock, **settings)
+    engine.new_game(seed)
+    events = []
+    engine.listeners.append(lambda event, *args: events.append(event))
+    plan = []
+    for step in range(steps):
+        if engine.game_over:
+            break
+        # now and then a wait longer than a record holds
+        now[0] += rng.random()*0.3 + (MAX_DELTA/1000 + 5 if rng.random() < 0.002 else 0)
+        if not engine.piece_is_active:
+            recorder.record(SPAWN)
+            engine.spawn()
+            plan = flat_policy(engine, rng)
+        elif rng.random() < 0.1:
+            recorder.record(TICK)
+            engine.tick()
+        else:
+            # moves, rotations and the odd drop that the policy did not plan
+            action = plan.pop(0) if plan and rng.random() < 0.9 else rng.choice(ACTIONS[:5])
+            recorder.record(CODES[action])
+            engine.step(action)
+    return recorder, engine, events
+
+@pytest.mark.parametrize('settings', SETTINGS)
+def test_round_trip(settings, tmp_path):
+    for seed in range(5):
+        recorder, engine, events = record_game(seed, settings)
+        path = str(tmp_path / 'game.tetr')
+        recorder.save(path)
+        replay = Replay.load(path)
+        assert replay.seed == seed
+        assert replay.random_mode == settings.get('random_mode', False)
+        assert replay.randomizer == settings.get('randomizer',
+                                                 'random' if replay.random_mode else 'bag')
+        assert replay.preview_size == settings.get('preview_size', 1)
+        player = Player(replay)
+        played = []
+        player.engine.listeners.append(lambda event, *args: played.append(event))
+        player.play()
+        assert player.done
+        assert played == events
+        assert player.engine.bitboard.rows == engine.bitboard.rows
+        assert (player.engine.score, player.engine.pieces, player.engine.game_over) == \
+            (engine.score, engine.pieces, engine.game_over)
+
+def test_play_until():
+    recorder, engine, events = record_game(1, {}, steps=500)
+    player = Player(Replay(recorder.data()))
+    # playing in steps of a second ends up at the same game
+    until = 0
+    while not player.done:
+        until += 1000
+        player.play(until)
+        assert player.time <= until
+    assert player.engine.bitboard.rows == engine.bitboard.rows
+    assert player.engine.score == engine.score
+
+def test_not_a_replay():
+    with pytest.raises(ValueError):
+        Replay(b'TETS' + Recorder(0).data()[4:])
@@ -0,0 +1,92 @@
+# -------------------------------
+# Name: Tetris snapshot tests
+# Author: Jasper Keijzer
+# Language: Python 3.6.9
+#
+# Saves snapshots of games halfway, loads them and restores them on a
+# new engine with a clock that is further on, then checks that the game
+# goes on the same as the one the snapshot was taken of
+# Usage: python -m pytest test_snapshot.py
+# -------------------------------
+
+import random
+import pytest
+from engine import ACTIONS, TetrisEngine
+from snapshot import EMPTY, GARBAGE, Snapshot
+
+# Inputs of the games: the actions, ticks and waits of up to a second
+INPUTS = ACTIONS + ('tick', 'tick', 'wait')
+
+def play(engine, now, inputs):
+    '''
+    Plays the inputs on an engine and returns its events and its state, with the time left
+    until the garbage is due
+    Parameters:
+        engine (TetrisEngine): the engine
+        now (list): a list with the time in seconds the clock of the engine is at
+        inputs (list): (input, seconds) tuples, the seconds are used by 'wait'
+    '''
+    events = []
+    engine.listeners.append(lambda event, *args: events.append(
+        (event, engine.score, engine.pieces)))
+    for name, seconds in inputs:
+        if engine.game_over:
+            break
+        if name == 'wait':
+            now[0] += seconds
+        elif name == 'tick':
+            engine.tick()
+        else:
+            engine.step(name)
+    return events, (engine.bitboard.rows, engine.score, engine.level, engine.pieces,
+                    engine.game_over,
+                    [(lines, hole, round(due - now[0], 6)) for lines, hole, due in engine.garbage])
+
+@pytest.mark.parametrize('randomizer', [None, 'random', 'history', 'sequence:IOTZ'])
+def test_round_trip(randomizer, tmp_path):
+    for seed in range(10):
+        rng = random.Random(seed)
+        inputs = [(rng.choice(INPUTS), rng.random()) for _ in range(600)]
+        now = [0.0]
+        engine = TetrisEngine(seed=seed, clock=lambda: now[0], randomizer=randomizer,
+                              spin=True, preview_size=1 + seed % 3,
+                              board_height=16 + seed % 8, spawn_rows=2)
+        engine.new_game(seed)
+        engine.tick()
+        engine.receive_garbage(2, seed % 10, due=now[0] + 10)
+        play(engine, now, inputs[:200])
+        if engine.game_over:
+            continue
+        snapshot = engine.snapshot()
+        path = str(tmp_path / 'snapshot.json')
+        snapshot.save(path)
+        loaded = Snapshot.load(path)
+        assert loaded == snapshot
+        # the times in a snapshot are relative, so it goes on the same at any time
+        later = [now[0] + 100]
+        restored = TetrisEngine(seed=999, clock=lambda: later[0])
+        restored.restore(loaded)
+        forked = engine.fork()
+        start = now[0]
+        forked_game = play(forked, now, inputs[200:])
+        now[0] = start # the fork shares the clock of the engine
+        assert play(engine, now, inputs[200:]) == forked_game == play(restored, later, inputs[200:])
+
+def test_load_other_version(tmp_path):
+    path = tmp_path / 'snapshot.json'
+    path.write_text('{"version": 0, "snapshot": {}}')
+    with pytest.raises(ValueError):
+        Snapshot.load(str(path))
+
+def test_squares(tmp_path):
+    engine = TetrisEngine(seed=1, board_width=4, board_height=6, spawn_rows=2)
+    engine.bitboard.rows[4:] = [0b0011, 0b1101]
+    engine.bitboard.recompute_tops()
+    colors = ('....', '....', '....', '....', 'SS..', 'T' + EMPTY + GARBAGE + 'I')
+    path = str(tmp_path / 'snapshot.json')
+    engine.snapshot(colors).save(path)
+    snapshot = Snapshot.load(path)
+    assert list(snapshot.squares()) == [(4, 0, 'S'), (4, 1, 'S'), (5, 0, 'T'), (5, 2, GARBAGE),
+                                        (5, 3, 'I')]
+    assert list(snapshot._replace(colors=None).squares()) == [
+        (4, 0, GARBAGE), (4, 1, GARBAGE), (5, 0, GARBAGE), (5, 2, GARBAGE), (5, 3, GARBAGE)]
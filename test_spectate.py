@@ -0,0 +1,122 @@
+# -------------------------------
+# Name: Tetris spectator stream tests
+# Author: Jasper Keijzer
+# Language: Python 3.6.9
+#
+# Publishes games to a file and follows the stream with a Spectator,
+# which has to end up with the board, the counters and the pieces of
+# the engine, also when the queue of the publisher overflows
+# Usage: python -m pytest test_spectate.py
+# -------------------------------
+
+import random
+from engine import TetrisEngine
+from policies import POLICIES
+from spectate import KEYFRAME, KEYS, Publisher, Spectator, decode, piece_fields, read_chunks
+
+def play_piece(engine, policy, rng):
+    '''
+    Spawns a piece and moves it where the policy puts it
+    Parameters:
+        engine (TetrisEngine): the engine
+        policy (function): a policy from policies.py
+        rng (random.Random): the random number generator of the policy
+    '''
+    engine.tick() # spawns the next piece
+    for action in policy(engine, rng):
+        engine.step(action)
+        if not engine.piece_is_active:
+            break
+    if engine.piece_is_active:
+        engine.step('snap_down')
+
+def same(spectator, engine):
+    '''
+    Returns whether a spectator knows the state of an engine
+    Parameters:
+        spectator (Spectator): the spectator
+        engine (TetrisEngine): the engine
+    '''
+    preview = engine.preview_piece.orientation
+    return ((spectator.board.rows, spectator.score, spectator.level, spectator.lines,
+             spectator.pieces, spectator.lost, spectator.piece, spectator.preview) ==
+            (engine.bitboard.rows, engine.score, engine.level, engine.cleared_lines,
+             engine.pieces, engine.game_over,
+             piece_fields(engine.active_piece) if engine.piece_is_active else None,
+             (KEYS.index(preview.key), preview.index)))
+
+def follow(path):
+    '''
+    Returns a Spectator that followed the stream in a file to its end
+    Parameter:
+        path (str): the name of the file
+    '''
+    spectator = Spectator()
+    with open(path, 'rb') as file:
+        for milliseconds, data in read_chunks(file):
+            for kind, fields in decode(data):
+                spectator.apply(kind, fields)
+    return spectator
+
+def test_stream(tmp_path):
+    path = str(tmp_path / 'stream.tets')
+    engine = TetrisEngine(seed=1, board_width=8, board_height=18)
+    publisher = Publisher(engine, path)
+    rng = random.Random(1)
+    for game in range(3):
+        engine.new_game()
+        while not engine.game_over and engine.pieces < 300:
+            play_piece(engine, POLICIES['flat'], rng)
+    publisher.close()
+    assert same(follow(path), engine)
+
+def test_keyframe(tmp_path):
+    engine = TetrisEngine(seed=2)
+    publisher = Publisher(engine, str(tmp_path / 'stream.tets'))
+    rng = random.Random(2)
+    engine.new_game()
+    for piece in range(40):
+        play_piece(engine, POLICIES['flat'], rng)
+    engine.tick()
+    publisher.close()
+    assert not engine.game_over
+    kind, fields = publisher.snapshot()
+    spectator = Spectator()
+    spectator.apply(kind, fields)
+    assert same(spectator, engine)
+    # a keyframe is written as a keyframe record, a preview record and a move record
+    copy = Spectator()
+    for kind, fields in decode(spectator.keyframe()):
+        copy.apply(kind, fields)
+    assert same(copy, engine)
+
+def test_overflow(tmp_path):
+    path = str(tmp_path / 'stream.tets')
+    checked = 0
+    for seed in range(6):
+        engine = TetrisEngine(seed=seed)
+        publisher = Publisher(engine, path, size=5)
+        rng = random.Random(seed)
+        # Holding the lock keeps the writing thread from taking the frames, so the queue
+        # overflows again and again and what is in it can be checked after every spawn
+        with publisher.condition:
+            engine.new_game()
+            while not engine.game_over and engine.pieces < 300:
+                engine.tick()
+                frames = list(publisher.frames)
+                if not publisher.resync and frames[0][0] == KEYFRAME:
+                    spectator = Spectator()
+                    for kind, fields in frames:
+                        spectator.apply(kind, fields)
+                    assert same(spectator, engine), (seed, engine.pieces)
+                    checked += 1
+                for action in POLICIES['random'](engine, rng):
+                    engine.step(action)
+                    if not engine.piece_is_active:
+                        break
+                if engine.piece_is_active:
+                    engine.step('snap_down')
+        publisher.close()
+        assert same(follow(path), engine)
+        tmp_path.joinpath('stream.tets').unlink()
+    assert checked
@@ -2,7 +2,7 @@
 # Name: Tetris
 # Author: Jasper Keijzer
 # Language: Python 3.6.9
-# 
+#
 # Created: 10/04/2020
 # Inspiration & source for large amount of code:
 # TigerhawkT3
@@ -10,132 +10,226 @@
 # https://www.youtube.com/playlist?list=PLQ7bGgvf9FtGJV3P4gj1cWdBYacQo7bKz
 # -------------------------------
 
-try:
-    import tkinter as tk
-except ImportError:
-    print('The tkinter module cannot be found or is not installed')
-try:
-    from tkinter import messagebox
-except ImportError:
-    print('The tkinter/messagebox module cannot be found or is not installed')
-try:
-    from tkinter import Toplevel
-except ImportError:
-    print('The tkinter/Toplevel module cannot be found or is not installed')
-try:
-    import pygame as pg
-except ImportError:
-    audio = None
-    print('The pygame module cannot be found or is not installed\nThere will be no audio')
-else:
-    audio = True
-try:
-    from matrix_rotation import rotate_array as rot_arr
-except ImportError:
-    print('The matrix_rotation module cannot be found or is not installed'\
-        'The original code can be found on https://github.com/TigerhawkT3/matrix_rotation')
+import argparse
+import collections
+import os
 import random
+import sqlite3
 import sys
-import time
-
-class Shape():
-    def __init__(self, key, shape, piece, row, column, coords):
-        '''
-        key is the name of the shape
-        shape is a 2D array presentation with '*'
-        piece is a 2D array with references to canvas child objects
-        row is the current row of the object
-        column is the current column of the object
-        coords is a list of tuples of 4 integers (x1,y1,x2,y2) with the coordinates of the object
-        '''
-        self.key = key
-        self.shape = shape
-        self.piece = piece
-        self._row = row
-        self.column = column
-        self.coords = coords
-        self._rotation_index = 0
-        self.hover_time = self.spin_time = time.perf_counter()
-    @property
-    def row(self):
-        return self._row
-    @row.setter
-    def row(self, newrow):
-        if newrow != self._row:
-            self._row = newrow
-            self.hover_time = time.perf_counter()
-    @property
-    def rotation_index(self):
-        return self._rotation_index
-    @rotation_index.setter
-    def rotation_index(self, newvalue):
-        self._rotation_index = newvalue
-        self.spin_time = time.perf_counter()
-    @property
-    def hover(self):
-        # 0.5 is a magic number, hover for max 0.5 second
-        return time.perf_counter() - self.hover_time < 0.5
-    @property
-    def spin(self):
-        # 0.5 is a magic number, spin for max 0.5 second
-        return time.perf_counter() - self.spin_time < 0.5
+import threading
+from controls import ARR, DAS, Controls
+from engine import TetrisEngine
+from gameloop import GameLoop
+from instruments import Instruments
+from randomizers import RANDOMIZERS, make_randomizer
+from replay import CODES, EXTENSION, PAUSE, RESUME, SPAWN, TICK, Player, Recorder, Replay
+from scores import DEFAULT_PATH, ScoreStore, game_result
+from snapshot import EMPTY, GARBAGE, Snapshot
+
+# tkinter and pygame are only imported when a game is started, see load_tkinter() and
+# load_pygame(), so importing this module is cheap and works without a display
+tk = None
+messagebox = None
+Toplevel = None
+pg = None
+
+# The flags that can be given on the command line, see main()
+FLAGS = ('debug', 'random', 'nohover', 'spin', 'record', 'bot', 'profile', 'raster')
+
+# The engine action belonging to each key binding
+KEY_ACTIONS = {'Down':'down', 'Left':'left', 'Right':'right',
+               'Up':'rotate_right', 'w':'rotate_right', 'W':'rotate_right',
+               'e':'rotate_right', 'E':'rotate_right',
+               'q':'rotate_left', 'Q':'rotate_left',
+               'space':'snap_down', 's':'snap_down', 'S':'snap_down',
+               'a':'snap_left', 'A':'snap_left',
+               'd':'snap_right', 'D':'snap_right'}
+
+# Time in milliseconds between two frames when playing back a replay
+REPLAY_FRAME = 16
+# The number of mixer channels reserved for each sound effect, so no other sound can delay or
+# cut it off. Hard drops can follow each other faster than the settle sound lasts, so it gets two
+EFFECT_CHANNELS = {'settle.ogg':2, 'clear.ogg':1, 'lose.ogg':1, 'levelup.ogg':1}
+# Time in milliseconds between two updates of the profile overlay
+OVERLAY_REFRESH = 500
+# The line clear animation hides the squares a few columns at a time, one step every
+# CLEAR_FRAME milliseconds, so it takes CLEAR_TIME milliseconds on boards of any width
+CLEAR_TIME = 500
+CLEAR_FRAME = 50
+# Size in pixels of the squares of the preview piece, whatever the size of the board squares,
+# and of the squares of the pieces when more than one upcoming piece is shown
+PREVIEW_SQUARE = 30
+QUEUE_SQUARE = 15
+# Time in milliseconds between two looks at the messages of the opponent in versus mode
+VERSUS_POLL = 16
+# The color of the garbage lines the opponent sends in versus mode
+GARBAGE_COLOR = 'gray'
+# The file F5 saves the game to and F9 loads it from, in the current directory
+QUICKSAVE_PATH = 'quicksave.json'
+
+def load_tkinter():
+    '''
+    Import tkinter, return False if it is not installed
+    '''
+    global tk, messagebox, Toplevel
+    try:
+        import tkinter as tk
+        from tkinter import messagebox
+        from tkinter import Toplevel
+    except ImportError:
+        print('The tkinter module cannot be found or is not installed')
+        return False
+    return True
+
+def load_pygame():
+    '''
+    Import pygame for the audio, return False if it is not installed
+    '''
+    global pg
+    try:
+        import pygame as pg
+    except ImportError:
+        print('The pygame module cannot be found or is not installed\nThere will be no audio')
+        return False
+    return True
 
 class Tetris():
-    def __init__(self, parent, audio=None):
-        # Check for flags in the command line
-        self.debug = 'debug' in sys.argv[1:]
-        self.random = 'random' in sys.argv[1:]
-        self.spin = 'spin' in sys.argv[1:]
-        self.hover = 'nohover' not in sys.argv[1:] # defaults to true
+    def __init__(self, parent, audio=None, debug=False, random_mode=False, spin=False,
+                 hover=True, record=False, replay=None, bot=False, profile=False,
+                 board_width=10, board_height=24, spawn_rows=4, square_width=30, versus=None,
+                 stream=None, scores=None, randomizer=None, preview_size=1,
+                 quicksave=QUICKSAVE_PATH, das=DAS, arr=ARR, raster=False):
+        '''
+        parent is the tkinter window to play in
+        audio enables the music and sound effects, it requires load_pygame() to have succeeded
+        debug draws the board in the terminal as well, see terminal.py
+        random_mode, spin and hover are the game settings, see TetrisEngine
+        record saves every game as a replay
+        replay is the name of a replay file to play back instead of playing
+        bot lets a bot play the game
+        profile measures the time spent in the handlers
+        board_width, board_height and spawn_rows are the size of the board and of the
+            spawn zone in squares, see TetrisEngine. A replay brings its own
+        square_width is the size of a square of the board in pixels
+        versus is a (host, port, listen) tuple to play against an opponent, see versus.py.
+            The game starts once the opponent is connected
+        stream is where to publish the games for spectators, see spectate.make_sink()
+        scores is the name of the database that keeps the result of every game and the
+            high scores, None to keep the high scores for this session only
+        randomizer and preview_size are how the pieces are picked and how many upcoming
+            pieces are shown, see TetrisEngine
+        quicksave is the name of the file F5 saves the game to and F9 loads it from
+        das and arr are the time in milliseconds an arrow key is held before the piece keeps
+            shifting, and between two shifts after that, see Controls
+        raster paints the settled squares into a single image instead of an item per square,
+            see raster.py
+        '''
+        self.debug = debug
+        self.console = None
+        # Gravity, spawning, animations and the bot all run on the timers of the game loop,
+        # and the engine uses its game time for hover and spin
+        self.loop = GameLoop(parent)
+        # In record mode every game is saved as a replay,
+        # and a given replay file is played back instead of a game
+        self.record = record
+        self.recorder = None
+        self.quicksave = quicksave
+        self.replay = Replay.load(replay) if replay else None
+        self.player = None
+        if self.replay:
+            board_width = self.replay.board_width
+            board_height = self.replay.board_height
+            spawn_rows = self.replay.spawn_rows
+            preview_size = self.replay.preview_size
+        # The engine holds the board and the rules of the game,
+        # this class only draws it and passes on the user input
+        self.engine = TetrisEngine(random_mode=random_mode, spin=spin, hover=hover,
+                                   clock=self.loop.clock, board_width=board_width,
+                                   board_height=board_height, spawn_rows=spawn_rows,
+                                   randomizer=randomizer, preview_size=preview_size)
+        # In versus mode the opponent's garbage rises on the board, which replays do not hold
+        self.versus = None
+        if versus:
+            from versus import Versus # imported here, it brings in asyncio
+            self.record = False
+            self.versus = Versus(self.engine)
+            self.versus.start(*versus)
+        # In debug mode the board is also drawn in the terminal the game was started from
+        if debug:
+            from terminal import FRAME, TerminalView, open_console # imported here, it takes over the terminal
+            self.console = TerminalView(self.engine, open_console())
+            self.console.start()
+            self.console_frame = FRAME
+        # Spectators follow the games from a stream that a background thread writes
+        self.publisher = None
+        if stream:
+            from spectate import Publisher # imported here, it brings in sockets and threads
+            try:
+                self.publisher = Publisher(self.engine, stream)
+            except OSError as error:
+                print('Cannot stream to {}: {}'.format(stream, error))
+        # The result of every game is kept, and the high scores carry over from earlier sessions
+        # of the same player on the same board. A background thread writes them to the database
+        self.scores = None
+        self.source = 'bot' if bot else 'versus' if versus else 'player'
+        self.game_start = 0
+        if scores:
+            try:
+                self.scores = ScoreStore(scores)
+                self.engine.high_score, self.engine.high_level = self.scores.best(
+                    source=self.source, board_width=self.engine.board_width,
+                    board_height=self.engine.board_height)
+            except sqlite3.Error as error:
+                print('Cannot keep the scores in {}: {}'.format(scores, error))
+        # In bot mode the game plays itself, e.g. as a demo. The bot searches on all but one core
+        self.bot = None
+        if bot and not self.replay:
+            from bot import BeamBot # imported here, it brings in multiprocessing
+            self.bot = BeamBot(processes=max(1, (os.cpu_count() or 2) - 1))
+        # In profile mode the time spent in the handlers is measured and shown on the board,
+        # and written to profile.json and profile.csv when the window is closed
+        self.instruments = Instruments() if profile else None
+        if self.instruments:
+            for name in ('shift', 'shift_by', 'rotate', 'snap', 'tick', 'spawn', 'clear_iter'):
+                setattr(self, name, self.instruments.wrap(name, getattr(self, name),
+                                                          events=name in ('shift', 'rotate', 'snap')))
+            for name in ('settle', 'preview'):
+                setattr(self.engine, name, self.instruments.wrap(name, getattr(self.engine, name)))
+        # The arrow keys keep shifting the piece while they are held, at the pace of the
+        # game rather than that of the key repeat of the system
+        self.controls = Controls(self.loop, self.shift_by, das, arr)
         parent.title('Tetris')
         self.parent = parent
         self.audio = audio
         if self.audio: # if pygame import succeeded
-            pg.mixer.init(buffer=512)
-            try: # try importing the sound files from the current directory
-                self.sounds = {name:pg.mixer.Sound(name)
-                                    for name in ('music.ogg',
-                                                    'settle.ogg',
-                                                    'clear.ogg',
-                                                    'lose.ogg',
-                                                    'levelup.ogg')}
-            except: # if sound files are missing, disable audio
+            # A small buffer keeps the sound effects in time with the game
+            pg.mixer.pre_init(frequency=44100, size=-16, channels=2, buffer=256)
+            pg.mixer.init()
+            try: # the music is streamed from the file in the current directory while it plays
+                pg.mixer.music.load('music.ogg')
+            except (pg.error, OSError): # if the music file is missing, disable audio
                 self.audio = None
                 print('No audio found. Music and sound effects will be disabled')
             else:
-                self.audio = {'m':True, 'x':True} # if sound files are present,
+                self.audio = {'m':True, 'x':True} # if the music file is present,
                 for char in 'mMxX': # enable audio and bind keys
                     self.parent.bind(char, self.toggle_audio)
-        self.board_width = 10 # Initialize board width and height in number of squares
-        self.board_height = 24 
-        self.canvas_width = 300 # Initialize canvas width and height in number of pixels
-        self.canvas_height = 720
-        self.square_width = self.canvas_width//10
-        self.high_score = 0
-        self.high_level = 0
-        # Defining the 7 shapes as 2D arrays. Empty strings mean open spaces, non-empty strings
-        # are where the squares of the shape are
-        self.shapes = {'S':[['*', ''],
-                                    ['*', '*'],
-                                    ['', '*']],
-                            'Z':[['', '*'],
-                                    ['*', '*'],
-                                    ['*', '']],
-                            'J':[['', '*'],
-                                    ['', '*'],
-                                    ['*', '*']],
-                            'L':[['*', ''],
-                                    ['*', ''],
-                                    ['*', '*']],
-                            'O':[['*', '*'],
-                                    ['*', '*']],
-                            'I':[['*'],
-                                    ['*'],
-                                    ['*'],
-                                    ['*']],
-                            'T':[['*', '*', '*'] ,
-                                    ['', '*', '']]}
-        # Assigning colors to the shapes    
+                reserved = sum(EFFECT_CHANNELS.values())
+                pg.mixer.set_num_channels(max(reserved, pg.mixer.get_num_channels()))
+                pg.mixer.set_reserved(reserved)
+                numbers = iter(range(reserved))
+                self.channels = {name:[pg.mixer.Channel(next(numbers)) for channel in range(count)]
+                                    for name, count in EFFECT_CHANNELS.items()}
+                # The sound effects are loaded in the background, so the game can start right away
+                self.sounds = {}
+                threading.Thread(target=self.load_sounds, daemon=True).start()
+        self.board_width = self.engine.board_width # Board width and height in number of squares
+        self.board_height = self.engine.board_height
+        self.square_width = square_width
+        # Initialize canvas width and height in number of pixels
+        self.canvas_width = self.board_width*square_width
+        self.canvas_height = self.board_height*square_width
+        # Assigning colors to the shapes
         self.colors = {'S':'green',
                             'Z':'yellow',
                             'J':'turquoise',
@@ -144,57 +238,69 @@ class Tetris():
                             'I':'red',
                             'T':'violet'}
         # Binding a set of keys that the user may like the use
-        for key in ('<Down>', '<Left>', '<Right>'):
-            self.parent.bind(key, self.shift)
+        for key in ('Down', 'Left', 'Right'):
+            self.parent.bind('<KeyPress-{}>'.format(key), self.shift)
+            self.parent.bind('<KeyRelease-{}>'.format(key), self.release)
+        self.parent.bind('<FocusOut>', lambda event: self.controls.release_all())
         for key in ('<Up>', 'w', 'W', 'q', 'Q', 'e', 'E'):
             self.parent.bind(key, self.rotate)
         for key in ('<space>', 's', 'S', 'a', 'A', 'd', 'D'):
             self.parent.bind(key, self.snap)
         self.parent.bind('<Escape>', self.pause)
-        self.parent.bind('<Control-n>', self.draw_board)
-        self.parent.bind('<Control-N>', self.draw_board)
+        if not self.versus: # a versus game is one game against one opponent
+            self.parent.bind('<Control-n>', self.draw_board)
+            self.parent.bind('<Control-N>', self.draw_board)
+            self.parent.bind('<F5>', self.quick_save)
+            self.parent.bind('<F9>', self.quick_load)
         self.parent.bind('g', self.toggle_guides)
         self.parent.bind('G', self.toggle_guides)
+        self.parent.protocol('WM_DELETE_WINDOW', self.quit)
         # Set some variables to None initially, will be assigned immediately on game start
         # When a game is lost, these variables will be destroyed or reset to None
         self.canvas = None
         self.preview_canvas = None
+        self.raster = raster # replaced by the RasterBoard in make_items()
         self.ticking = None
-        self.spawning = None        
+        self.spawning = None
+        self.bot_moving = None
+        self.overlaying = None
+        self.clearing = None
+        self.versus_polling = None
+        self.console_drawing = None
         # Using stringvar to automatically update the corresponding labels
         self.score_var = tk.StringVar()
         self.high_score_var = tk.StringVar()
         self.level_var = tk.StringVar()
         self.high_level_var = tk.StringVar()
-        # High score and highest level are 0 initially and will not be reset when starting a new game
-        self.high_score_var.set('High Score:\n0')
-        self.high_level_var.set('Highest level:\n0')
+        # High score and highest level come from the earlier games and will not be reset when starting a new game
+        self.high_score_var.set('High Score:\n{}'.format(self.engine.high_score))
+        self.high_level_var.set('Highest level:\n{}'.format(self.engine.high_level))
         # Creating and gridding labels
-        self.preview_label = tk.Label(root,
+        self.preview_label = tk.Label(parent,
                                             text='Next piece:',
                                             width=15,
                                             height=3,
                                             font=('Arial', 13, 'bold'))
         self.preview_label.grid(row=0, column=1, sticky='S')
-        self.score_label = tk.Label(root,
+        self.score_label = tk.Label(parent,
                                             textvariable=self.score_var,
                                             width=15,
                                             height=3,
                                             font=('Arial', 13, 'bold'))
         self.score_label.grid(row=2, column=1)
-        self.high_score_label = tk.Label(root,
+        self.high_score_label = tk.Label(parent,
                                             textvariable=self.high_score_var,
                                             width=15,
                                             height=3,
                                             font=('Arial', 13, 'bold'))
         self.high_score_label.grid(row=3, column=1)
-        self.level_label = tk.Label(root,
+        self.level_label = tk.Label(parent,
                                             textvariable=self.level_var,
                                             width=15,
                                             height=3,
                                             font=('Arial', 13, 'bold'))
         self.level_label.grid(row=4, column=1)
-        self.high_level_label = tk.Label(root,
+        self.high_level_label = tk.Label(parent,
                                             textvariable=self.high_level_var,
                                             width=15,
                                             height=3,
@@ -202,6 +308,16 @@ class Tetris():
         self.high_level_label.grid(row=5, column=1)
         self.help_button = tk.Button(parent, text='Help', command=lambda: self.pause(help=True))
         self.help_button.grid(row=6, column=1)
+        if self.versus:
+            self.versus_var = tk.StringVar()
+            self.versus_label = tk.Label(parent,
+                                            textvariable=self.versus_var,
+                                            width=15,
+                                            height=5,
+                                            font=('Arial', 13, 'bold'))
+            self.versus_label.grid(row=7, column=1)
+        # Redraw the canvas whenever something happens in the game
+        self.engine.listeners.append(self.on_event)
         # Start the game by calling the draw_board() function
         self.draw_board()
 
@@ -211,69 +327,197 @@ class Tetris():
         Parameter:
             event (event): a keypress event, defaulting to None
         '''
-        # after_cancel any tick() and spawn() calls from a previous game
-        if self.ticking:
-            self.parent.after_cancel(self.ticking)
-        if self.spawning:
-            self.parent.after_cancel(self.spawning)
+        # cancel any tick() and spawn() calls from a previous game
+        self.loop.cancel(self.ticking)
+        self.loop.cancel(self.spawning)
+        self.loop.cancel(self.bot_moving)
+        self.loop.cancel(self.overlaying)
+        self.loop.cancel(self.clearing)
+        self.loop.cancel(self.versus_polling)
+        self.loop.cancel(self.console_drawing)
         # Set the score to 0
         self.score_var.set('Score:\n0')
         self.level_var.set('Level:\n0')
-        # Make an empty board for the 2D array representations of the shapes
-        # TODO comment field
-        self.board = [['' for column in range(self.board_width)]
-                            for row in range(self.board_height)]
-        self.field = [[None for column in range(self.board_width)]
-                            for row in range(self.board_height)]
-        # Destroy any canvas from a previous game and make a new one
+        # The canvases and their items are made for the first game and reused by every game after it
         if self.canvas:
-            self.canvas.destroy()    
-        self.canvas = tk.Canvas(root, width=self.canvas_width, height=self.canvas_height)
-        self.canvas.grid(row=0, column=0, rowspan=7) # rowspan == the number of labels+preview piece
-        self.horizontal_seperator = self.canvas.create_line(0,self.canvas_height//6,
-                                                    self.canvas_width, self.canvas_height//6, width=2)
-        self.vertical_seperator = self.canvas.create_line(self.canvas_width, 0,
-                                                    self.canvas_width, self.canvas_height, width=2)
-        # Destroy any preview_canvas from a previous game, make a new one and grid it
-        if self.preview_canvas:
-            self.preview_canvas.destroy()    
-        self.preview_canvas = tk.Canvas(root,
-                                                width=5*self.square_width,
-                                                height=5*self.square_width)
-        self.preview_canvas.grid(row=1, column=1)
-        # Set variables to their default values
-        self.score = 0
-        self.cleared_lines = 0 # number of cleared lines
-        self.level = 0 # the current level
-        self.levelup = 0 # variable to keep track of when to level up
-        self.level_tickrates = [800, 700, 600, 500, 400, # List of tickrates per level,
-                                        300, 250, 200, 150, 100, # based on the NES Tetris tickrates
-                                        80,  80,  80,  65,   65,
-                                        65,  50,  50,  50,   30,
-                                        30,  30,  30,  30,   30,
-                                        30,  30,  30,  30,   30,
-                                        15]
-        # tickrate is the amount of time in milliseconds before the piece shifts down one row    
-        self.tickrate = self.level_tickrates[self.level]
-        self.piece_is_active = False
+            self.reset_items()
+        else:
+            self.make_items()
         self.paused = False
-        self.bag = [] # Used to randomly pick a piece from a bag without replacement
-        self.preview()
+        self.levelled_up = False # whether the last line clear resulted in a level up
+        self.save_replay() # of a game that was not finished
+        self.game_start = self.loop.clock()
+        # reset the score and level and show the first preview
+        if self.replay:
+            self.player = Player(self.replay, self.engine)
+            self.replay_start = self.loop.clock()*1000
+        elif self.record:
+            seed = random.randrange(1 << 32)
+            self.recorder = Recorder(seed, self.engine.random, self.engine.spin, self.engine.hover,
+                                     self.board_width, self.board_height,
+                                     spawn_rows=self.engine.spawn_rows, clock=self.loop.clock,
+                                     randomizer=self.engine.randomizer,
+                                     preview_size=self.engine.preview_size)
+            self.engine.clock = self.recorder.clock
+            self.engine.new_game(seed)
+        else:
+            self.engine.new_game()
         # Initially grid the guidelines at the side of the board,
         # they will move with the active piece once it has spawned
+        self.move_guides(0, self.board_width)
+        self.guide_fill = 'black'
+        self.toggle_guides() # Start with guidelines off
+        if self.instruments:
+            self.update_overlay()
+        if self.console:
+            self.console.reset()
+            self.draw_console()
+        self.pausewindow = None
+        if self.player: # the replay spawns the pieces and ticks
+            self.ticking = self.loop.after(REPLAY_FRAME, self.play_replay)
+        elif self.versus: # the game starts once the opponent is there
+            self.versus_polling = self.loop.after(VERSUS_POLL, self.poll_versus)
+        else:
+            self.spawning = self.loop.after(self.engine.tickrate, self.spawn) # spawn a piece
+            self.ticking = self.loop.after(self.engine.tickrate*2, self.tick) # start ticking
+        if self.audio and self.audio['m']: # start the audio on an endless loop
+            pg.mixer.music.stop() # stop any music from a previous game
+            pg.mixer.music.play(loops=-1)
+
+    def make_items(self):
+        '''
+        Make the canvases with the items the game will need: the squares of the active piece
+        and of the preview and the guidelines. The squares of the board are made a row at a
+        time by make_row(). The game only recolors, moves, shows and hides these items
+        '''
+        self.canvas = tk.Canvas(self.parent, width=self.canvas_width, height=self.canvas_height)
+        # rowspan == the number of labels+preview piece
+        self.canvas.grid(row=0, column=0, rowspan=8 if self.versus else 7)
+        spawn_height = self.engine.spawn_rows*self.square_width # the bottom of the spawn zone
+        self.horizontal_seperator = self.canvas.create_line(0, spawn_height,
+                                                    self.canvas_width, spawn_height, width=2)
+        self.vertical_seperator = self.canvas.create_line(self.canvas_width, 0,
+                                                    self.canvas_width, self.canvas_height, width=2)
+        # Every upcoming piece gets a slot of 5 by 5 squares, the next piece at the top
+        queued = self.engine.preview_size
+        self.preview_square = PREVIEW_SQUARE if queued == 1 else QUEUE_SQUARE
+        self.preview_canvas = tk.Canvas(self.parent,
+                                                width=5*PREVIEW_SQUARE,
+                                                height=5*self.preview_square*queued)
+        self.preview_canvas.grid(row=1, column=1)
+        if self.raster:
+            from raster import RasterBoard # imported here, it brings in tkinter
+            # The settled squares are painted into one image and the active piece is a small
+            # image on top of it, so there are no items per square
+            self.raster = RasterBoard(self.canvas, self.board_width, self.board_height,
+                                      self.square_width, dict(self.colors, **{GARBAGE:GARBAGE_COLOR}))
+        # The squares of the board come in rows. The squares of row n all have the tag 'row<n>',
+        # so a whole row moves down with a single move() when lines below it are cleared.
+        # row_order holds the n of the row that is shown at each row of the board and
+        # drawn_rows the row of the board the squares of row n are drawn at. A row is only
+        # made once a square settles in it, and only rows with settled squares are kept
+        # at the right place, so the board rows above the stack cost nothing
+        self.row_squares = [None] * self.board_height
+        self.row_order = list(range(self.board_height))
+        self.drawn_rows = list(range(self.board_height))
+        # 4 is a magic number, the number of squares of a piece. The raster board shows
+        # the active piece as an image instead
+        self.squares = [self.canvas.create_rectangle(0, 0, 0, 0, width=3, state='hidden')
+                            for square in range(0 if self.raster else 4)] # the squares of the active piece
+        # The squares of the upcoming pieces, 4 for each piece in the order of the queue.
+        # When a piece spawns they all move up one slot and the squares of the spawned
+        # piece go to the last slot for the new piece, see on_preview()
+        self.preview_slots = collections.deque(
+                                [self.preview_canvas.create_rectangle(0, 0, 0, 0, width=3, tags='queue')
+                                    for square in range(4)]
+                                for piece in range(queued))
+        self.previewed = 0 # the number of slots that show a piece of this game
         self.guides = [self.canvas.create_line(0, 0, 0, self.canvas_height),
                             self.canvas.create_line(self.canvas_width,
                                                             0,
                                                             self.canvas_width,
                                                             self.canvas_height)]
-        self.guide_fill = 'black'
-        self.toggle_guides() # Start with guidelines off
-        self.pausewindow = None
-        self.spawning = self.parent.after(self.tickrate, self.spawn) # spawn a piece
-        self.ticking = self.parent.after(self.tickrate*2, self.tick) # start ticking
-        if self.audio and self.audio['m']: # start the audio on an endless loop
-            self.sounds['music.ogg'].stop() # stop any music from a previous game
-            self.sounds['music.ogg'].play(loops=-1)
+        if self.instruments:
+            self.overlay = self.canvas.create_text(4, 4, anchor='nw', font=('Courier', 8))
+
+    def reset_items(self):
+        '''
+        Hide every square, the rows of the board are moved into place once a square settles in them
+        '''
+        if self.raster:
+            self.raster.reset()
+        self.canvas.itemconfig('cell', state='hidden')
+        for square in self.squares:
+            self.canvas.itemconfig(square, state='hidden')
+        self.row_order = list(range(self.board_height))
+        self.previewed = 0
+
+    def make_row(self, n, row):
+        '''
+        Make the hidden squares of row n of the board and return them
+        Parameters:
+            n (int): the number of the row, see make_items()
+            row (int): the row of the board to draw them at
+        '''
+        size = self.square_width
+        tags = ('cell', 'row{}'.format(n))
+        self.row_squares[n] = [self.canvas.create_rectangle(column*size, row*size,
+                                                            (column+1)*size, (row+1)*size,
+                                                            width=3, state='hidden', tags=tags)
+                                    for column in range(self.board_width)]
+        self.canvas.tag_lower(tags[1], self.squares[0]) # below the active piece, guides and overlay
+        self.drawn_rows[n] = row
+        return self.row_squares[n]
+
+    def board_row(self, row):
+        '''
+        Returns the squares drawn at a row of the board, making or moving them there first
+        Parameter:
+            row (int): the row of the board
+        '''
+        n = self.row_order[row]
+        squares = self.row_squares[n]
+        if squares is None:
+            return self.make_row(n, row)
+        if self.drawn_rows[n] != row:
+            self.canvas.move('row{}'.format(n), 0, (row - self.drawn_rows[n])*self.square_width)
+            self.drawn_rows[n] = row
+        return squares
+
+    def quit(self):
+        '''
+        Save the replay of the current game in record mode, the measurements
+        in profile mode, finish the stream for spectators, write the queued
+        game results, stop the processes of the bot and close the window
+        '''
+        self.save_replay()
+        if self.bot:
+            self.bot.close()
+        if self.publisher:
+            self.publisher.close()
+        if self.console:
+            self.console.close()
+        if self.scores:
+            self.scores.close()
+        if self.instruments:
+            self.instruments.dump('profile.json')
+            self.instruments.dump('profile.csv')
+        self.parent.destroy()
+
+    def draw_console(self):
+        '''
+        Draw what changed on the board in the terminal and call itself after the frame time
+        '''
+        self.console.frame()
+        self.console_drawing = self.loop.after(self.console_frame, self.draw_console)
+
+    def update_overlay(self):
+        '''
+        Show the latest measurements on the board and call itself after OVERLAY_REFRESH
+        '''
+        self.canvas.itemconfig(self.overlay, text=self.instruments.text())
+        self.canvas.tag_raise(self.overlay) # keep it above the squares
+        self.overlaying = self.loop.after(OVERLAY_REFRESH, self.update_overlay)
 
     def toggle_guides(self, event=None):
         '''
@@ -285,6 +529,34 @@ class Tetris():
         self.canvas.itemconfig(self.guides[0], fill=self.guide_fill)
         self.canvas.itemconfig(self.guides[1], fill=self.guide_fill)
 
+    def load_sounds(self):
+        '''
+        Load the sound effects from the current directory, called on a background thread
+        '''
+        for name in EFFECT_CHANNELS:
+            try:
+                self.sounds[name] = pg.mixer.Sound(name)
+            except (pg.error, OSError):
+                print('Sound effect {} not found'.format(name))
+
+    def play_sound(self, name):
+        '''
+        Play a sound effect on a free channel of its own, if sound effects are on
+        Parameter:
+            name (str): the file name of the sound effect
+        '''
+        if not (self.audio and self.audio['x']):
+            return
+        sound = self.sounds.get(name)
+        if sound: # it may still be loading
+            channels = self.channels[name]
+            for channel in channels:
+                if not channel.get_busy():
+                    break
+            else: # every channel is busy, start over on the first
+                channel = channels[0]
+            channel.play(sound)
+
     def toggle_audio(self, event=None):
         '''
         Toggle the music or sound effects on/off
@@ -299,9 +571,9 @@ class Tetris():
         self.audio[key] = not self.audio[key] # invert value for index key
         if key == 'm':
             if not self.audio[key]: # stop the endless loop
-                self.sounds['music.ogg'].stop()
+                pg.mixer.music.stop()
             else: # restart the endless loop
-                self.sounds['music.ogg'].play(loops=-1)
+                pg.mixer.music.play(loops=-1)
 
     def pause(self, event=None, help=False):
         '''
@@ -310,11 +582,15 @@ class Tetris():
             event (event): a keypress event, defaulting to None
             help (bool): variable to determine whether to show the pause or help text, defaulting to None
         '''
-        if self.piece_is_active and not self.paused:
+        if self.player or self.versus: # replays and versus games can not be paused
+            return
+        if self.engine.piece_is_active and not self.paused:
+            if self.recorder:
+                self.recorder.record(PAUSE)
             self.paused = True # pause the game
-            self.piece_is_active = False
-            self.sounds['music.ogg'].fadeout(500)
-            self.parent.after_cancel(self.ticking) # cancel any tick() calls
+            if self.audio and self.audio['m']:
+                pg.mixer.music.fadeout(500)
+            self.loop.cancel(self.ticking) # cancel any tick() calls
             # Show a popup saying the game is paused. Resume the game when popup is closed
             # if the user clicks OK or the red X on the top right of the window
             if help:
@@ -329,6 +605,7 @@ class Tetris():
                         'Press A or D to move the piece as far left or right as possible.\n'\
                         'Press S or Space to instantly move the piece to the bottom.\n'\
                         'Press G to toggle guidelines.\n'\
+                        'Press F5 to save the game, and F9 to go back to where you saved it.\n'\
                         'Press M to toggle music, and X to toggle sound effects.\n'\
                         'Press the Escape button to pause the game.\n'\
                         'If you want to start over, press Ctrl + N for a new game.\n\n'\
@@ -344,98 +621,48 @@ class Tetris():
         elif self.paused: # resume the game
             if self.pausewindow:
                 self.pausewindow.destroy()
+            if self.recorder:
+                self.recorder.record(RESUME)
             self.paused = False
-            self.piece_is_active = True
-            self.sounds['music.ogg'].play(loops=-1)
-            self.ticking = self.parent.after(self.tickrate, self.tick)
+            if self.audio and self.audio['m']:
+                pg.mixer.music.play(loops=-1)
+            self.ticking = self.loop.after(self.engine.tickrate, self.tick)
 
-    def print_board(self):
+    def shift(self, event=None):
         '''
-        Prints the board to the console for debugging purposes
+        Shift the active piece down, left or right depending on the event, and keep
+        shifting it while the key is held, see Controls
+        Parameter:
+            event (event): a keypress event, defaulting to None
         '''
-        for row in self.board:
-            print(*(cell or ' ' for cell in row), sep='')
+        self.controls.press(KEY_ACTIONS[(event and event.keysym) or 'Down'])
 
-    def check(self, shape, row, column, length, width):
+    def release(self, event):
         '''
-        Check wheter we may rotate or move a piece or if the space is already occupied
-        or the intented space is off the board. Return True if the move is allowed
-        Parameters:
-            shape (2D list): the 2D array representation of the current piece
-            row (int): the row of the shape
-            column (int): the column of the shape
-            length (int): the (vertical) length of the shape
-            width (int): the (horizontal) width of the shape
-        '''
-        # zip returns tuples of (rowindex, row of shape)
-        for row_number, squares in zip(range(row, row+length), shape):
-            # zip returns tuples of (columnindex, square of shape)
-            for column_number, square in zip(range(column, column+width), squares):
-                if (row_number not in range(self.board_height) # if row_number is negative or too large
-                    or column_number not in range(self.board_width) # or the same with column_number
-                    or (square and self.board[row_number][column_number] == 'x')): # or the intended
-                                                                                # space is occupied by a settled piece
-                        return
-        return True
-
-    def move(self, shape, row, column, length, width):
-        '''
-        Move the piece to a given position
-        Parameters:
-            shape (2D list): the 2D array representation of the current piece
-            row (int): the row the piece should move to
-            column (int): the column the piece should move to
-            length (int): the (vertical) length of the piece
-            width (int): the (horizontal) width of the piece
-        '''
-        square_idxs = iter(range(4)) # iterator of 4 indices
-        # r = .. would reassign a local variable
-        # r[:] = .. takes all elements of the object        
-        # Removing the shape from the board by iterating over the rows
-        # and blanking the cell if it was previously occupied by the shape,
-        # otherwise (e.g. settled piece) it remains as it was
-        for r in self.board:
-            r[:] = ['' if cell=='*' else cell for cell in r]
-
-        # Put shape on the board and piece on the canvas
-        # zip returns tuples of (rowindex, row of shape)
-        for row_number, squares in zip(range(row, row+length), shape):
-            # zip returns tuples of (columnindex, square of shape)
-            for column_number, square in zip(range(column, column+width), squares):
-                if square:
-                    self.board[row_number][column_number] = square # put the square on the board
-                    square_idx = next(square_idxs)
-                    coords = (column_number * self.square_width,
-                                        row_number * self.square_width,
-                                        (column_number+1)*self.square_width,
-                                        (row_number+1)*self.square_width)
-                    self.active_piece.coords[square_idx] = coords
-                    self.canvas.coords(self.active_piece.piece[square_idx], coords)
-        # Update the properties of active_piece
-        self.active_piece.row = row
-        self.active_piece.column = column
-        self.active_piece.shape = shape
-        self.move_guides(column, column+width) # move the guidelines
-
-        if self.debug: # Print the board if the debug flag has been set
-            self.print_board()
-        return True
-
-    def check_and_move(self, shape, row, column, length, width):
-        '''
-        Checks whether the piece can move to the intended position,
-        moves there if it can and returns True if both check and move succeeded
+        Stop shifting the active piece when its key is released
+        Parameter:
+            event (event): a key release event
+        '''
+        self.controls.release(KEY_ACTIONS[event.keysym])
+
+    def shift_by(self, action, count):
+        '''
+        Shift the active piece down, left or right a number of times as a single move,
+        recording every shift in record mode
         Parameters:
-            shape (2D list): the 2D array representation of the current piece
-            row (int): the row the piece should move to
-            column (int): the column the piece should move to
-            length (int): the (vertical) length of the piece
-            width (int): the (horizontal) width of the piece
+            action (str): 'down', 'left' or 'right'
+            count (int): the number of shifts, math.inf for as far as it can
         '''
-        # If self.check is false, the function will return false without
-        # checking (and executing) self.move
-        return self.check(shape, row, column, length, width
-            ) and self.move(shape, row, column, length, width)
+        if self.paused or self.bot or self.player or not self.engine.piece_is_active:
+            return
+        # Shifts past where the piece can go do nothing, except that a blocked shift down may settle
+        count = min(count, self.engine.shift_distance(action) + (action == 'down'))
+        if not count:
+            return
+        if self.recorder:
+            for shift in range(count):
+                self.recorder.record(CODES[action])
+        self.engine.shift_by(action, count)
 
     def rotate(self, event=None):
         '''
@@ -443,330 +670,551 @@ class Tetris():
         Parameter:
             event (event): a keypress event, defaulting to None
         '''
-        # Don't rotate inactive pieces
-        if not self.piece_is_active:
-            return
-        # Don't rotate squares
-        if len(self.active_piece.shape) == len(self.active_piece.shape[0]):
-            # Notify the piece that it has 'rotated', used for easyspin delay mechanic
-            self.active_piece.rotation_index = self.active_piece.rotation_index
-            return
-        # Retrieve information about the active piece
-        row = self.active_piece.row
-        column = self.active_piece.column
-        length = len(self.active_piece.shape)
-        width = len(self.active_piece.shape[0])
-        # find the coordinates of the center of the old shape
-        x_center = column + width//2
-        y_center = row + length//2
-        
-        direction = event.keysym
-        if direction in {'q', 'Q'}:
-            # rotate left/anticlockwise
-            shape = rot_arr(self.active_piece.shape, -90)
-            # 4 is a magic number, number of sides on a rectangle
-            rotation_index = (self.active_piece.rotation_index - 1) % 4
-            rx, ry = self.active_piece.rotation[rotation_index]
-            rotation_offsets = -rx, -ry
-        elif direction in {'e', 'E', 'Up', 'w', 'W'}:
-            # rotate right/clockwise
-            shape = rot_arr(self.active_piece.shape, 90)
-            rotation_index = self.active_piece.rotation_index
-            rotation_offsets = self.active_piece.rotation[rotation_index]
-            # 4 is a magic number, number of sides on a rectangle
-            rotation_index = (rotation_index + 1) % 4
-
-        length = len(shape) # length of new shape
-        width = len(shape[0]) # width of new shapes
-        row = y_center - length//2 # row of new shape
-        column = x_center - width//2 # column of new shape
-        # correct x,y values to make the rotation feel more natural
-        x_correction, y_correction = rotation_offsets
-        row += y_correction
-        column += x_correction
-
-        # call check_and_move to see if the rotation is allowed, and execute it if it is
-        if self.check_and_move(shape, row, column, length, width):
-            # Update rotation index for next x,y correction
-            self.active_piece.rotation_index = rotation_index
-            return
-        
-        # If default check_and_move failed, try kicking the piece
-        for y,x in zip(( 0, 0,-1, 0, 0,-2, -1,-1),
-                            (-1, 1, 0,-2, 2, 0, -1, 1)):
-            if self.check_and_move(shape, row+y, column+x, length, width):
-                self.active_piece.rotation_index = rotation_index
-                return
+        if not (self.paused or self.bot or self.player):
+            self.act(KEY_ACTIONS[event.keysym])
+
+    def snap(self, event=None):
+        '''
+        Move the piece as far down, left or right as possible
+        Parameter:
+            event (event): a keypress event, defaulting to None
+        '''
+        if not (self.paused or self.bot or self.player):
+            self.act(KEY_ACTIONS[event.keysym])
+
+    def act(self, action):
+        '''
+        Perform an engine action, recording it in record mode
+        Parameter:
+            action (str): one of engine.ACTIONS
+        '''
+        if self.recorder:
+            self.recorder.record(CODES[action])
+        self.engine.step(action)
 
     def tick(self):
         '''
-        Shifts the active piece down one row and calls itself after self.tickrate
+        Shifts the active piece down one row and calls itself after self.engine.tickrate.
+        The game loop counts the tickrate from when this tick was due, so ticks do not drift
         '''
-        # If the piece is active and NOT(the spin feature is active and the piece is currently spinning)
-        if self.piece_is_active and not (self.spin and self.active_piece.spin):
-            self.shift()
-        self.ticking = self.parent.after(self.tickrate, self.tick)
-    
-    def shift(self, event=None):
+        if self.engine.piece_is_active and not self.paused:
+            if self.recorder:
+                self.recorder.record(TICK)
+            self.engine.tick()
+        self.ticking = self.loop.after(self.engine.tickrate, self.tick)
+
+    def spawn(self):
+        '''
+        Spawn the preview piece in the board and create a new preview piece
+        '''
+        if self.recorder:
+            self.recorder.record(SPAWN)
+        self.engine.spawn()
+
+    def play_replay(self):
+        '''
+        Play the records of the replay that are due and call itself after REPLAY_FRAME.
+        Tk draws the board once per frame, so when drawing falls behind,
+        the records of the skipped frames are drawn at once
+        '''
+        self.player.play(int(self.loop.clock()*1000 - self.replay_start))
+        if not self.player.done:
+            self.ticking = self.loop.after(REPLAY_FRAME, self.play_replay)
+
+    def save_replay(self):
+        '''
+        Save the replay of the current game in record mode, as replay-<seed>.tetr
+        '''
+        if self.recorder:
+            self.recorder.save('replay-{}{}'.format(self.recorder.seed, EXTENSION))
+            self.recorder = None
+
+    def quick_save(self, event=None):
+        '''
+        Save the state of the game to the quick save file, only while a piece falls, so the
+        canvas is not in the middle of a line clear
+        Parameter:
+            event (event): a keypress event, defaulting to None
+        '''
+        if self.paused or self.player or not self.engine.piece_is_active:
+            return
+        try:
+            self.engine.snapshot(self.board_colors()).save(self.quicksave)
+        except OSError as error:
+            print('Cannot save the game to {}: {}'.format(self.quicksave, error))
+
+    def quick_load(self, event=None):
         '''
-        Shift the active piece down, left or right depending on the event
+        Go back to the game in the quick save file
         Parameter:
             event (event): a keypress event, defaulting to None
         '''
-        if not self.piece_is_active:        # We do not want to move settled pieces
+        if self.paused or self.player:
             return
-        # Retrieve information about the active piece
-        row = self.active_piece.row
-        column = self.active_piece.column
-        length = len(self.active_piece.shape)
-        width = len(self.active_piece.shape[0])
-        # The function may be called by tick with no event, in which case
-        # the piece will move down, or it may be called by a button press event
-        # in which case direction is will be the name of the button
-        direction = (event and event.keysym) or 'Down'
-        if direction == 'Down':    
-            row += 1
-        elif direction == 'Left':
-            column -= 1
-        elif direction == 'Right':
-            column += 1
-
-        success = self.check_and_move(self.active_piece.shape, row, column, length, width)
-
-
-        # If we're moving down and the piece is blocked by something on the row below
-        # and NOT(the feature is on and we're hovering), then settle
-        if direction == 'Down' and not success and not (self.hover and self.active_piece.hover): 
-            self.settle()
-
-    def settle(self):
-        '''
-        Settles the current active_piece and spawns a new one after self.tickrate
-        '''
-        self.piece_is_active = False
-        # Changing the notation of the previously active piece to
-        # denote that it has now settled
-        for row in self.board:
-            row[:] = ['x' if cell=='*' else cell for cell in row]
-        # Putting square id for each piece in the field
-        for (x1,y1,x2,y2),piece in zip(self.active_piece.coords, self.active_piece.piece):
-            self.field[y1//self.square_width][x1//self.square_width] = piece
-        # line_numbers is a list of indices of any full rows
-        line_numbers = [idx for idx, row in enumerate(self.board) if all(row)]
-        if line_numbers: # if any lines are full
-            self.cleared_lines += len(line_numbers)
-            self.levelup += len(line_numbers)
-            if self.levelup >= 10:
-                if self.audio['x']:
-                    self.sounds['levelup.ogg'].play()
-                self.level = self.cleared_lines//10 # level up for every 10 lines cleared
-                self.high_level = max(self.level, self.high_level)
-                self.levelup -= 10
-                if self.level <= 30: # Don't increase tickrate past level 30
-                    self.tickrate = self.level_tickrates[self.level]
-                self.level_var.set('Level:\n{}'.format(self.level))
-                self.high_level_var.set('Highest level:\n{}'.format(self.high_level))
-            elif self.audio and self.audio['x']: # if we haven't leveled up, play clear sound instead
-                self.sounds['clear.ogg'].play() 
-            self.clear(line_numbers) # clear the lines
-            # Update the score, +1 because we start at level 0
-            self.score += (40,100,300,1200)[len(line_numbers)-1]*(self.level+1)
-            if all(not cell for row in self.board for cell in row): # If the board is empty now,
-                self.score += 1200*(self.level+1) # give a bonus score for clearing the board
-            self.high_score = max(self.score, self.high_score)        
-            self.score_var.set('Score:\n{}'.format(self.score))
-            self.high_score_var.set('High Score:\n{}'.format(self.high_score))
-        # Lose if there is any square in the top 4 rows when this function is called 
-        if any(any(row) for row in self.board[:4]):
-            self.lose()
+        try:
+            snapshot = Snapshot.load(self.quicksave)
+        except (OSError, ValueError, KeyError, TypeError) as error:
+            print('Cannot load the game from {}: {}'.format(self.quicksave, error))
             return
-        if self.audio and self.audio['x'] and not line_numbers: # if audio is on and we didn't clear lines
-            self.sounds['settle.ogg'].play() # or lose the game, play the settle sound
-        # Spawn in a new piece after self.tickrate, or if a line has been cleared and the tickrate
-        # is shorter than the line-clearing animation, wait for the animation to finish
-        # 500 is a magic number, board_width times the animation delay in clear_iter()
-        self.spawning = self.parent.after(500 if line_numbers and self.tickrate<500
-                                            else self.tickrate, self.spawn)
-    
-    def preview(self):
-        '''
-        Shows a preview of the next piece that will be spawned
-        '''
-        self.preview_canvas.delete(tk.ALL) # Delete the previous preview
-        if not self.bag: # if the bag is empty or there is no bag
-            if self.random: # If the random flag has been set, randomly pick a piece
-                self.bag.append(random.choice('SZJLOIT')) # WITHOUT replacement
-            else:
-                self.bag = random.sample('SZJLOIT', 7) # Put the names of the 7 pieces in random order
-        key = self.bag.pop() # Randomly pick a piece from a bag WITH replacement
-        shape = rot_arr(self.shapes[key], random.choice((0,90,180,270))) # randomly rotate the shape
-        self.preview_piece = Shape(key, shape, [], 0, 0, [])
-
-        # enumerate returns tuples of (y_coordinate, row of shape)
-        for y, row in enumerate(shape):
-            # enumerate returns tuples of (x_coordinate, cell in row of shape)
-            for x, cell in enumerate(row):
-                if cell:
-                    self.preview_piece.coords.append((self.square_width*x+self.square_width//2,
-                                                                self.square_width*y+self.square_width//2,
-                                                                self.square_width*(x+1)+self.square_width//2,
-                                                                self.square_width*(y+1)+self.square_width//2))
-                    self.preview_piece.piece.append(
-                        self.preview_canvas.create_rectangle(self.preview_piece.coords[-1],
-                                                                fill=self.colors[key],
-                                                                width=3)
-                                                            )
-
-        self.preview_piece.rotation_index = 0
-        # cycle of coordinates to move the piece slightly each time it rotates
-        # to make the rotation feel more natural
-        if 3 in (len(shape), len(shape[0])): # 2x3 or 3x2 shape
-            self.preview_piece.rotation = [(0,0),
-                                                    (1, 0),
-                                                    (-1, 1),
-                                                    (0, -1)]
-        else: # I shape
-            self.preview_piece.rotation = [(1,-1),
-                                                    (0, 1),
-                                                    (0,0),
-                                                    (-1, 0)]    
-        if len(shape) < len(shape[0]):
-            self.preview_piece.rotation_index += 1
-            if len(shape[0]) == 4: # increased row for horizontal I piece
-                self.preview_piece.row = 1
+        if ((snapshot.board_width, snapshot.board_height, snapshot.preview_size)
+                != (self.board_width, self.board_height, self.engine.preview_size)):
+            print('The game in {} is played on another board'.format(self.quicksave))
+            return
+        self.restore(snapshot)
 
-    def move_guides(self, left, right):
+    def restore(self, snapshot):
         '''
-        Move the guidelines to the left- and rightmost column of the piece
+        Go on from a snapshot of a game, see TetrisEngine.restore(). In record mode the replay
+        of the game so far is saved, as a replay cannot jump to another state
+        Parameter:
+            snapshot (Snapshot): the state of the game
+        '''
+        self.loop.cancel(self.ticking)
+        self.loop.cancel(self.spawning)
+        self.loop.cancel(self.bot_moving)
+        self.loop.cancel(self.clearing)
+        self.save_replay()
+        self.engine.clock = self.loop.clock
+        self.engine.restore(snapshot) # on_restore() draws the board
+        if self.engine.game_over:
+            return
+        if self.engine.piece_is_active:
+            self.ticking = self.loop.after(self.engine.tickrate, self.tick)
+            if self.bot:
+                self.plan_bot()
+        else:
+            self.spawning = self.loop.after(self.engine.tickrate, self.spawn)
+            self.ticking = self.loop.after(self.engine.tickrate*2, self.tick)
+
+    def board_colors(self):
+        '''
+        Returns the key of the piece each square of the board came from, as the
+        colors of a Snapshot, read from the fill of the squares on the canvas
+        '''
+        if self.raster:
+            return self.raster.keys()
+        keys = {color:key for key, color in self.colors.items()}
+        keys[GARBAGE_COLOR] = GARBAGE
+        colors = []
+        for row, mask in enumerate(self.engine.bitboard.rows):
+            if not mask:
+                colors.append(EMPTY*self.board_width)
+                continue
+            squares = self.board_row(row)
+            colors.append(''.join(keys[self.canvas.itemcget(square, 'fill')] if mask >> column & 1
+                                      else EMPTY for column, square in enumerate(squares)))
+        return tuple(colors)
+
+    def on_event(self, event, *args):
+        '''
+        Called by the engine on every game event, passes it on to the on_<event> method
         Parameters:
-            left (int): the index of the leftmost column of the piece
-            right (int): the index of the rightmost column of the piece
+            event (str): the name of the event
+            args: the arguments belonging to the event
         '''
-        left *= self.square_width
-        right *= self.square_width
-        self.canvas.coords(self.guides[0], left, 0, left, self.canvas_height)
-        self.canvas.coords(self.guides[1], right, 0, right, self.canvas_height)
+        getattr(self, 'on_' + event)(*args)
 
-    def spawn(self):
+    def piece_coords(self, piece):
         '''
-        Spawn the preview piece in the board and create a new preview piece
+        Returns a list of (x1,y1,x2,y2) canvas coordinates of the squares of a piece
+        Parameter:
+            piece (Shape): a piece on the board
         '''
-        self.piece_is_active = True
-        self.active_piece = self.preview_piece
-        width = len(self.active_piece.shape[0]) # width of the shape
-        start_column = (10-width)//2 # start the shape in the middle of the board
-        self.active_piece.coords = []
-        self.active_piece.piece = []
-        self.active_piece.row = self.preview_piece.row
-        self.active_piece.column = start_column
-        self.preview()
-        # enumerate returns tuples of (y_coordinate, row of shape)
-        for y, row in enumerate(self.active_piece.shape):
-            # Spawn in the shape
-            self.board[y][start_column:start_column+width] = self.active_piece.shape[y]
-            # enumerate returns tuples of (x_coordinate, cell in row of shape)
-            for x, cell in enumerate(row, start=start_column):
-                if cell:
-                    self.active_piece.coords.append((self.square_width*x,
-                                                                self.square_width*(y+self.active_piece.row),
-                                                                self.square_width*(x+1),
-                                                                self.square_width*(y+self.active_piece.row+1)))
-                    self.active_piece.piece.append(
-                        self.canvas.create_rectangle(self.active_piece.coords[-1],
-                                                                fill=self.colors[self.active_piece.key],
-                                                                width=3))
-        self.move_guides(start_column, start_column+width) # update the guidelines
-        if self.debug: # print the board to the console if the debug flag was set
-            self.print_board()
-
-    def lose(self):
+        return [(column * self.square_width,
+                    row * self.square_width,
+                    (column+1) * self.square_width,
+                    (row+1) * self.square_width) for row, column in piece.cells()]
+
+    def on_preview(self, piece):
         '''
-        Ends the current game and clears the board
+        Shows a piece that was added to the end of the queue of pieces that will be spawned
+        Parameter:
+            piece (Shape): the new piece
         '''
-        self.piece_is_active = False
-        if self.audio and self.audio['x']:
-            self.sounds['lose.ogg'].play()
-        if self.audio and self.audio['m']:
-            self.sounds['music.ogg'].stop() # stop the musics endless loop
-        self.parent.after_cancel(self.ticking) # cancel any tick() calls
-        self.parent.after_cancel(self.spawning) # cancel any spawn() calls
-        self.clear_iter(range(len(self.board))) # clear the entire board
+        size = self.preview_square
+        slot = 5*size
+        if self.previewed == len(self.preview_slots): # a piece spawned, move the queue up
+            self.preview_canvas.move('queue', 0, -slot)
+            self.preview_slots.rotate(-1)
+            self.previewed -= 1
+        left = (5*PREVIEW_SQUARE - 4*size)//2
+        top = size//2 + slot*self.previewed
+        for square, (y, x) in zip(self.preview_slots[self.previewed], piece.orientation.cells):
+            self.preview_canvas.coords(square, size*x+left,
+                                                size*y+top,
+                                                size*(x+1)+left,
+                                                size*(y+1)+top)
+            self.preview_canvas.itemconfig(square, fill=self.colors[piece.key])
+        self.previewed += 1
 
-    def snap(self, event=None):
+    def on_spawn(self, piece):
         '''
-        Move the piece as far down, left or right as possible
+        Show the squares of a newly spawned piece on the canvas
         Parameter:
-            event (event): a keypress event, defaulting to None
+            piece (Shape): the spawned piece
+        '''
+        self.show_piece(piece)
+        if self.bot:
+            self.plan_bot()
+
+    def show_piece(self, piece):
+        '''
+        Show the squares of the active piece on the canvas
+        Parameter:
+            piece (Shape): the active piece
+        '''
+        if self.raster:
+            self.raster.show_piece(piece)
+        for square, coords in zip(self.squares, self.piece_coords(piece)):
+            self.canvas.coords(square, coords)
+            self.canvas.itemconfig(square, fill=self.colors[piece.key], state='normal')
+        self.move_guides(piece.column, piece.column+piece.orientation.width) # update the guidelines
+
+    def plan_bot(self):
+        '''
+        Let the bot decide where the active piece goes and start moving it there
         '''
-        down = {'space', 's', 'S'}
-        left = {'a', 'A'}
-        right = {'d', 'D'}
-        if not self.piece_is_active: # We do not want to move settled pieces
+        # Leave half of the tick for drawing the board
+        placement = self.bot.decide(self.engine, self.engine.tickrate/2000)
+        actions = placement.actions if placement else ['snap_down']
+        # Spread the actions over one tick, so the piece gets there before gravity gets in the way
+        # 100 is a magic number, the delay between the actions at low levels
+        delay = max(1, min(100, self.engine.tickrate//(len(actions)+1)))
+        self.bot_moving = self.loop.after(delay, self.play_bot, actions, delay)
+
+    def play_bot(self, actions, delay):
+        '''
+        Perform the next action the bot decided on and call itself after the given delay
+        Parameters:
+            actions (list): the actions that are left, ending with 'snap_down'
+            delay (int): the time in milliseconds between the actions
+        '''
+        if not self.engine.piece_is_active:
             return
-        # Retrieve information about the active piece
-        row = self.active_piece.row
-        column = self.active_piece.column
-        length = len(self.active_piece.shape)
-        width = len(self.active_piece.shape[0])
-
-        direction = event.keysym
-        while True:
-            # Keep checking for possible moves in the given direction until the 
-            # piece hits a wall or a settled piece, break the loop when that happens
-            if self.check(self.active_piece.shape,
-                                    row+(direction in down),
-                                    column+(direction in right) - (direction in left),
-                                    length, width):
-                row += direction in down
-                column += (direction in right) - (direction in left)
-            else:
-                break
-        # Move to the last checked position
-        self.move(self.active_piece.shape, row, column, length, width)
-        if direction in down: # Settle the piece if the user snapped down
-            self.settle()
+        if not self.paused:
+            self.act(actions.pop(0))
+        if actions and self.engine.piece_is_active:
+            self.bot_moving = self.loop.after(delay, self.play_bot, actions, delay)
+
+    def on_move(self, piece):
+        '''
+        Move the squares of the active piece to its new position on the canvas
+        Parameter:
+            piece (Shape): the active piece
+        '''
+        if self.raster:
+            self.raster.show_piece(piece)
+        for square, coords in zip(self.squares, self.piece_coords(piece)):
+            self.canvas.coords(square, coords)
+        self.move_guides(piece.column, piece.column+piece.orientation.width) # move the guidelines
 
-    def clear(self, line_numbers):
+    def on_lock(self, piece):
         '''
-        Clear the given line
+        Show the board squares under a settled piece and hide the squares of the active piece
         Parameter:
-            line_numbers (list): a list of int indices of full rows
+            piece (Shape): the settled piece
+        '''
+        if self.raster:
+            self.raster.lock(piece)
+            return
+        color = self.colors[piece.key]
+        for square, (row, column) in zip(self.squares, piece.cells()):
+            self.canvas.itemconfig(square, state='hidden')
+            self.canvas.itemconfig(self.board_row(row)[column], fill=color, state='normal')
+
+    def on_levelup(self, level):
         '''
-        for idx in line_numbers:\
-            # Remove the full row from the board and create an empty one on top
-            self.board.pop(idx)
-            self.board.insert(0, ['' for column in range(self.board_width)])
+        Update the level labels and play the level up sound
+        Parameter:
+            level (int): the new level
+        '''
+        self.levelled_up = True
+        self.play_sound('levelup.ogg')
+        self.level_var.set('Level:\n{}'.format(level))
+        self.high_level_var.set('Highest level:\n{}'.format(self.engine.high_level))
+
+    def on_clear(self, line_numbers):
+        '''
+        Animate the cleared lines and update the score labels
+        Parameter:
+            line_numbers (list): a list of int indices of the cleared rows
+        '''
+        # if we haven't leveled up, play clear sound instead
+        if not self.levelled_up:
+            self.play_sound('clear.ogg')
+        self.levelled_up = False
         self.clear_iter(line_numbers)
+        self.score_var.set('Score:\n{}'.format(self.engine.score))
+        self.high_score_var.set('High Score:\n{}'.format(self.engine.high_score))
+
+    def on_settle(self, line_numbers):
+        '''
+        Play the settle sound and spawn a new piece after self.engine.tickrate
+        Parameter:
+            line_numbers (list): a list of int indices of the cleared rows
+        '''
+        if not line_numbers: # if we didn't clear lines or lose the game, play the settle sound
+            self.play_sound('settle.ogg')
+        # Spawn in a new piece after self.engine.tickrate, or if a line has been cleared and the tickrate
+        # is shorter than the line-clearing animation, wait for the animation to finish
+        if self.player: # the replay spawns the pieces
+            return
+        tickrate = self.engine.tickrate
+        self.spawning = self.loop.after(CLEAR_TIME if line_numbers and tickrate<CLEAR_TIME
+                                            else tickrate, self.spawn)
+
+    def on_attack(self, lines):
+        '''
+        Garbage lines are sent to the opponent in versus mode, see Versus
+        Parameter:
+            lines (int): the number of garbage lines
+        '''
+
+    def on_garbage(self, lines, hole):
+        '''
+        Move the rows of the board up and show the garbage lines that rose at the bottom
+        Parameters:
+            lines (int): the number of garbage lines
+            hole (int): the column that is open in every garbage line
+        '''
+        if self.raster:
+            self.raster.garbage(lines, hole)
+            return
+        # The rows that went off the top come back as the garbage lines at the bottom
+        self.row_order = self.row_order[lines:] + self.row_order[:lines]
+        rows = self.engine.bitboard.rows
+        for row in range(min(self.engine.bitboard.tops), self.board_height - lines):
+            if rows[row]:
+                self.board_row(row) # moves it up
+        for row in range(self.board_height - lines, self.board_height):
+            for column, square in enumerate(self.board_row(row)):
+                if column == hole:
+                    self.canvas.itemconfig(square, state='hidden')
+                else:
+                    self.canvas.itemconfig(square, fill=GARBAGE_COLOR, state='normal')
+
+    def on_restore(self, snapshot):
+        '''
+        Draw the whole board of a restored game in one pass: hide every square, then
+        show the settled squares row by row, the active piece and the queue
+        Parameter:
+            snapshot (Snapshot): the restored state
+        '''
+        self.reset_items()
+        self.paused = False
+        self.levelled_up = False
+        if self.raster:
+            self.raster.load(snapshot)
+        else:
+            fills = dict(self.colors, **{GARBAGE:GARBAGE_COLOR})
+            for row, column, key in snapshot.squares():
+                self.canvas.itemconfig(self.board_row(row)[column], fill=fills[key], state='normal')
+        engine = self.engine
+        if engine.piece_is_active:
+            self.show_piece(engine.active_piece)
+        for piece in engine.queue:
+            self.on_preview(piece)
+        self.score_var.set('Score:\n{}'.format(engine.score))
+        self.high_score_var.set('High Score:\n{}'.format(engine.high_score))
+        self.level_var.set('Level:\n{}'.format(engine.level))
+        self.high_level_var.set('Highest level:\n{}'.format(engine.high_level))
+
+    def poll_versus(self):
+        '''
+        Handle the messages of the opponent, start the game once the opponent is connected
+        and show how it is doing. Calls itself after VERSUS_POLL until the game is over
+        '''
+        versus = self.versus
+        waiting = versus.state == 'waiting'
+        versus.poll()
+        if waiting and versus.state == 'playing':
+            self.spawning = self.loop.after(self.engine.tickrate, self.spawn)
+            self.ticking = self.loop.after(self.engine.tickrate*2, self.tick)
+        elif versus.state in ('won', 'closed') and not self.engine.game_over:
+            # The opponent lost or left, so this game stops where it is
+            self.loop.cancel(self.ticking)
+            self.loop.cancel(self.spawning)
+            self.loop.cancel(self.bot_moving)
+            self.paused = True # no more moves
+        status = versus.status()
+        if status != self.versus_var.get():
+            self.versus_var.set(status)
+        if versus.state in ('waiting', 'playing'):
+            self.versus_polling = self.loop.after(VERSUS_POLL, self.poll_versus)
+
+    def on_lose(self):
+        '''
+        Ends the current game and clears the board
+        '''
+        self.play_sound('lose.ogg')
+        if self.audio and self.audio['m']:
+            pg.mixer.music.stop() # stop the musics endless loop
+        self.loop.cancel(self.ticking) # cancel any tick() calls
+        self.loop.cancel(self.spawning) # cancel any spawn() calls
+        for square in self.squares:
+            self.canvas.itemconfig(square, state='hidden')
+        self.clear_iter(range(self.board_height)) # clear the entire board
+        if self.scores and not self.player: # a replayed game was kept when it was played
+            self.scores.add(game_result(self.engine, self.loop.clock() - self.game_start,
+                                        self.recorder.seed if self.recorder else None,
+                                        self.source))
+        self.save_replay()
+        if self.console: # show how late the game loop woke up
+            self.console.message = 'Late {mean_lateness:.1f} ms, max {max_lateness:.0f}'.format(
+                                        **self.loop.report())
+            self.console.info_changed = True
+        if self.bot and not self.versus: # keep the demo going
+            self.spawning = self.loop.after(3000, self.draw_board)
+
+    def move_guides(self, left, right):
+        '''
+        Move the guidelines to the left- and rightmost column of the piece
+        Parameters:
+            left (int): the index of the leftmost column of the piece
+            right (int): the index of the rightmost column of the piece
+        '''
+        left *= self.square_width
+        right *= self.square_width
+        self.canvas.coords(self.guides[0], left, 0, left, self.canvas_height)
+        self.canvas.coords(self.guides[1], right, 0, right, self.canvas_height)
 
     def clear_iter(self, line_numbers, current_column=0):
         '''
         Provides an animation to clear full lines
         Parameters:
             line_numbers: indices of the lines to clear
-            current_column: current column of the current line to clear
-        '''
-        for row in line_numbers:
-            if row%2:
-                cc = current_column
-            else: # Reverse animation in even rows
-                cc = self.board_width - current_column - 1
-            square = self.field[row][cc]
-            self.field[row][cc] = None
-            self.canvas.delete(square)
-        if current_column < self.board_width-1:
-            # withouth lambda the function would be called immediately, because the
-            # after() function needs to evaluate what it will call after the given amount of time
-            self.parent.after(50, lambda: self.clear_iter(line_numbers, current_column+1))
+            current_column: first column of the lines to clear in this step
+        '''
+        width = self.board_width
+        step = -(-width*CLEAR_FRAME//CLEAR_TIME) # columns per step, rounded up
+        columns = range(current_column, min(current_column + step, width))
+        if self.raster: # the same columns, painted empty a range of them at a time
+            self.raster.hide([row for row in line_numbers if row%2], columns.start, columns.stop)
+            self.raster.hide([row for row in line_numbers if not row%2],
+                             width - columns.stop, width - columns.start)
         else:
-            for idx, row in enumerate(self.field):
-                offset = sum(row_number > idx for row_number in line_numbers)*self.square_width
-                for square in row:
-                    if square:
-                        self.canvas.move(square, 0, offset)
             for row in line_numbers:
-                self.field.pop(row)
-                self.field.insert(0, [None for column in range(self.board_width)])
+                squares = self.row_squares[self.row_order[row]]
+                if squares is None: # nothing ever settled in this row
+                    continue
+                for column in columns:
+                    if not row%2: # Reverse animation in even rows
+                        column = width - column - 1
+                    self.canvas.itemconfig(squares[column], state='hidden')
+        if current_column + step < width:
+            self.clearing = self.loop.after(CLEAR_FRAME, self.clear_iter,
+                                            line_numbers, current_column + step)
+        elif self.raster:
+            self.raster.clear(line_numbers)
+        else:
+            # The cleared rows go back to the top and the rows above them move down,
+            # each with a single move() of its tag. The rows below the last cleared
+            # row stay where they are, and empty rows are only moved once they are used
+            last = line_numbers[-1]
+            cleared = set(line_numbers)
+            order = ([self.row_order[row] for row in line_numbers]
+                        + [n for row, n in enumerate(self.row_order[:last+1]) if row not in cleared])
+            self.row_order[:last+1] = order
+            rows = self.engine.bitboard.rows
+            for row, n in enumerate(order):
+                if rows[row] and self.drawn_rows[n] != row:
+                    self.canvas.move('row{}'.format(n), 0, (row - self.drawn_rows[n])*self.square_width)
+                    self.drawn_rows[n] = row
+
+def main(argv=None):
+    '''
+    Starts the game from the command line, returns the exit code
+    Parameter:
+        argv (list): the command line arguments, defaulting to sys.argv[1:]
+    '''
+    parser = argparse.ArgumentParser(description='Play Tetris')
+    parser.add_argument('options', nargs='*', metavar='flag',
+                        help='any of {} and a replay file to play back'.format(', '.join(FLAGS)))
+    parser.add_argument('--width', type=int, default=10, help='number of columns of the board')
+    parser.add_argument('--height', type=int, default=24, help='number of rows of the board')
+    parser.add_argument('--spawn-rows', type=int, default=4,
+                        help='number of rows at the top that lose the game when a piece settles in them')
+    parser.add_argument('--cell', type=int, default=30, help='size of a square in pixels')
+    parser.add_argument('--stream', metavar='TARGET',
+                        help='publish the games for spectators to a file, unix:<path> or broadcast:<path>')
+    parser.add_argument('--scores', metavar='PATH', default=DEFAULT_PATH,
+                        help="keep the results and high scores in this database, '' for this session only")
+    parser.add_argument('--randomizer', metavar='NAME',
+                        help='how the pieces are picked, one of {} or sequence:<pieces>'.format(
+                                ', '.join(RANDOMIZERS)))
+    parser.add_argument('--preview', type=int, default=1, help='number of upcoming pieces to show')
+    parser.add_argument('--quicksave', metavar='PATH', default=QUICKSAVE_PATH,
+                        help='the file F5 saves the game to and F9 loads it from')
+    parser.add_argument('--das', type=int, default=DAS, metavar='MS',
+                        help='time an arrow key is held before the piece keeps shifting')
+    parser.add_argument('--arr', type=int, default=ARR, metavar='MS',
+                        help='time between two shifts while an arrow key is held, 0 for all the way')
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--listen', type=int, metavar='PORT',
+                       help='play versus an opponent that connects to this port')
+    group.add_argument('--connect', metavar='HOST:PORT', help='play versus an opponent that listens')
+    args = parser.parse_args(argv)
+    if args.width < 4: # the I piece lies 4 squares wide
+        parser.error('the board must be at least 4 columns wide')
+    if not 2 <= args.spawn_rows < args.height - 1: # room to spawn and room to play
+        parser.error('the spawn rows must be at least 2 and leave 2 rows to play in')
+    if args.cell < 1:
+        parser.error('the squares must be at least 1 pixel')
+    if args.preview < 1:
+        parser.error('at least 1 upcoming piece is shown')
+    if args.das < 0 or args.arr < 0:
+        parser.error('the DAS and ARR cannot be negative')
+    if args.randomizer:
+        try:
+            make_randomizer(args.randomizer, random.Random())
+        except ValueError as error:
+            parser.error(str(error))
+    replays = [option for option in args.options if option.endswith(EXTENSION)]
+    for option in args.options:
+        if option not in FLAGS and option not in replays:
+            parser.error('unknown flag: {}'.format(option))
+    if len(replays) > 1:
+        parser.error('only one replay can be played back at a time')
+    versus = None
+    if args.listen is not None:
+        versus = ('0.0.0.0', args.listen, True)
+    elif args.connect:
+        host, _, port = args.connect.rpartition(':')
+        try:
+            port = int(port)
+        except ValueError:
+            port = None
+        if not host or port is None or not 0 < port < 65536:
+            parser.error('--connect needs HOST:PORT')
+        versus = (host, port, False)
+    if not load_tkinter():
+        return 1
+    audio = load_pygame()
+    root = tk.Tk()
+    Tetris(root, audio,
+           debug='debug' in args.options,
+           random_mode='random' in args.options,
+           spin='spin' in args.options,
+           hover='nohover' not in args.options, # defaults to true
+           record='record' in args.options,
+           replay=replays[0] if replays else None,
+           bot='bot' in args.options,
+           profile='profile' in args.options,
+           board_width=args.width,
+           board_height=args.height,
+           spawn_rows=args.spawn_rows,
+           square_width=args.cell,
+           versus=versus,
+           stream=args.stream,
+           scores=args.scores or None,
+           randomizer=args.randomizer,
+           preview_size=args.preview,
+           quicksave=args.quicksave,
+           das=args.das,
+           arr=args.arr,
+           raster='raster' in args.options)
+    root.mainloop()
+    return 0
 
-root = tk.Tk()
-tetris = Tetris(root, audio)
-root.mainloop()
\ No newline at end of file
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,422 @@
+# -------------------------------
+# Name: Tetris versus
+# Author: Jasper Keijzer
+# Language: Python 3.6.9
+#
+# Two players over TCP, on a LAN or as two processes on one computer.
+# Each side runs its own engine and only tells the other what changed,
+# a few bytes per piece: where it settled and which of its rows were
+# cleared, the garbage lines it sends and the garbage lines that rose on
+# its board. From these the other side keeps a copy of the opponent's
+# board. The side that receives garbage decides when it rises, at the
+# first piece it settles without clearing lines once the garbage is due,
+# and reports that, so neither side ever has to rewind its game. Garbage
+# is due GARBAGE_DELAY after it was sent as far as the measured latency
+# tells, so a slow link does not change when it lands
+# Usage: python versus.py --listen 5000
+#        python versus.py --connect 127.0.0.1:5000
+# -------------------------------
+
+import argparse
+import asyncio
+import collections
+import random
+import struct
+import sys
+import threading
+from bitboard import BitBoard
+from engine import TetrisEngine
+from instruments import Histogram
+from pieces import ORIENTATIONS
+from policies import POLICY_SEED
+from sweep import load_policy
+
+KEYS = 'SZJLOIT'
+VERSION = 1
+# Every message is a byte with its kind followed by the fields of that kind
+HELLO, PIECE, ATTACK, GARBAGE, LOSE, PING, PONG = range(7)
+MESSAGES = {HELLO:struct.Struct('<BHHH'),   # version, board width, board height, spawn rows
+            # index in KEYS, orientation index, row, column, cleared rows: bit y is set
+            # if row+y was cleared
+            PIECE:struct.Struct('<BBHHB'),
+            ATTACK:struct.Struct('<BH'),    # garbage lines sent, hole column
+            GARBAGE:struct.Struct('<BH'),   # garbage lines that rose, hole column
+            LOSE:struct.Struct('<'),
+            PING:struct.Struct('<d'),       # send time in milliseconds
+            PONG:struct.Struct('<d')}       # the send time of the ping
+# Time in milliseconds between two pings
+PING_INTERVAL = 250
+# Time in milliseconds from sending garbage until it may rise on the board of the opponent
+GARBAGE_DELAY = 500
+# Time in milliseconds between two looks at the inbox while waiting for the opponent
+WAIT_POLL = 10
+# The hole columns of the garbage are picked with the seed of the game xor this, so they
+# are not drawn from the same numbers as the pieces, see also policies.POLICY_SEED
+GARBAGE_SEED = 0xBF58476D1CE4E5B9
+
+class Connection(asyncio.Protocol):
+    '''
+    Splits the incoming bytes into messages for a Versus and sends its messages
+    '''
+    def __init__(self, versus):
+        self.versus = versus
+        self.transport = None
+        self.buffer = bytearray()
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.versus.connected(self)
+
+    def data_received(self, data):
+        buffer = self.buffer
+        buffer += data
+        start = 0
+        while start < len(buffer):
+            kind = buffer[start]
+            message = MESSAGES.get(kind)
+            if message is None: # not a Tetris opponent
+                self.transport.close()
+                return
+            end = start + 1 + message.size
+            if end > len(buffer): # the rest of the message did not arrive yet
+                break
+            self.versus.received(kind, message.unpack_from(buffer, start + 1))
+            start = end
+        del buffer[:start]
+
+    def connection_lost(self, exc):
+        self.versus.disconnected()
+
+    def send(self, kind, *fields):
+        '''
+        Send a message
+        Parameters:
+            kind (int): the kind of message, e.g. PIECE
+            fields: the fields of that kind of message
+        '''
+        self.transport.write(bytes((kind,)) + MESSAGES[kind].pack(*fields))
+
+class Versus():
+    def __init__(self, engine, seed=None):
+        '''
+        engine is the TetrisEngine of this side. Versus listens to its events to tell the
+            opponent, and passes the garbage of the opponent on to it in poll()
+        seed is the seed for the hole columns of the garbage this side sends
+        '''
+        self.engine = engine
+        engine.listeners.append(self.on_event)
+        self.rng = random.Random(seed)
+        self.loop = None # the asyncio event loop the connection runs on
+        self.connection = None
+        self.opened = None # resolved when the opponent connects to a listening game
+        self.pinging = None # the task of ping()
+        # Messages for the thread of the engine, see poll(). The connection runs on the
+        # asyncio event loop, which is a thread of its own next to a tkinter game
+        self.inbox = collections.deque()
+        self.state = 'waiting' # then 'playing' and at the end 'won', 'lost' or 'closed'
+        # The board of the opponent, kept up to date from its messages
+        self.opponent = BitBoard(engine.board_width, engine.board_height)
+        self.opponent_pieces = 0
+        self.opponent_lines = 0
+        self.desyncs = 0 # pieces of the opponent that cleared other rows on the copy of its board
+        self.sent = collections.Counter() # lines sent and received, and bytes sent
+        # Round trip times of the pings in microseconds, the smoothed one way latency
+        # and the jitter (the smoothed change between round trips) in milliseconds
+        self.round_trips = Histogram()
+        self.latency = None
+        self.jitter = 0.0
+        self.last_round_trip = None
+
+    def start(self, host, port, listen=False):
+        '''
+        Connect to the opponent on an asyncio event loop in a thread of its own,
+        for games that run on another loop, e.g. tkinter
+        Parameters:
+            host (str): the address to connect to or to listen on
+            port (int): the port
+            listen (bool): wait for the opponent to connect instead of connecting to it
+        '''
+        loop = asyncio.new_event_loop()
+        def run():
+            asyncio.set_event_loop(loop)
+            try:
+                loop.run_until_complete(self.open(host, port, listen))
+            except OSError as error:
+                print('Cannot reach the opponent: {}'.format(error))
+                self.inbox.append((None, ()))
+                return
+            loop.run_forever()
+        threading.Thread(target=run, daemon=True).start()
+
+    async def open(self, host, port, listen=False):
+        '''
+        Connect to the opponent and keep pinging it while connected
+        Parameters:
+            host (str): the address to connect to or to listen on
+            port (int): the port
+            listen (bool): wait for the opponent to connect instead of connecting to it
+        '''
+        self.loop = asyncio.get_event_loop()
+        if listen:
+            self.opened = self.loop.create_future()
+            server = await self.loop.create_server(lambda: Connection(self), host, port)
+            await self.opened
+            server.close() # one opponent is enough
+        else:
+            await self.loop.create_connection(lambda: Connection(self), host, port)
+        self.pinging = self.loop.create_task(self.ping())
+
+    async def ping(self):
+        '''
+        Send a ping every PING_INTERVAL milliseconds while connected
+        '''
+        while self.connection:
+            self.connection.send(PING, self.loop.time()*1000)
+            await asyncio.sleep(PING_INTERVAL/1000)
+
+    def connected(self, connection):
+        '''
+        Called on the event loop when a connection is made, a second opponent is turned away
+        '''
+        if self.connection:
+            connection.transport.close()
+            return
+        self.connection = connection
+        engine = self.engine
+        connection.send(HELLO, VERSION, engine.board_width, engine.board_height, engine.spawn_rows)
+        if self.opened and not self.opened.done():
+            self.opened.set_result(None)
+
+    def disconnected(self):
+        '''
+        Called on the event loop when the connection is lost
+        '''
+        self.connection = None
+        self.inbox.append((None, ()))
+
+    def received(self, kind, fields):
+        '''
+        Called on the event loop for every message. Pings are answered right away
+        so the round trips do not include the time until the next poll()
+        Parameters:
+            kind (int): the kind of message
+            fields (tuple): its fields
+        '''
+        if kind == PING:
+            self.connection.send(PONG, *fields)
+        elif kind == PONG:
+            round_trip = self.loop.time()*1000 - fields[0]
+            self.round_trips.add(int(round_trip*1000))
+            if self.latency is None:
+                self.latency = round_trip/2
+            else: # smoothed like the round trip time of TCP and the jitter of RTP
+                self.latency += (round_trip/2 - self.latency)/8
+                self.jitter += (abs(round_trip - self.last_round_trip) - self.jitter)/16
+            self.last_round_trip = round_trip
+        else:
+            self.inbox.append((kind, fields))
+
+    def send(self, kind, *fields):
+        '''
+        Send a message to the opponent from the thread of the engine
+        Parameters:
+            kind (int): the kind of message, e.g. PIECE
+            fields: the fields of that kind of message
+        '''
+        connection = self.connection
+        if connection:
+            data = bytes((kind,)) + MESSAGES[kind].pack(*fields)
+            self.loop.call_soon_threadsafe(connection.transport.write, data)
+            self.sent['bytes'] += len(data)
+
+    def close(self):
+        '''
+        Close the connection, after the messages that were sent
+        '''
+        connection = self.connection
+        if connection:
+            self.loop.call_soon_threadsafe(connection.transport.close)
+
+    def poll(self):
+        '''
+        Handle the messages of the opponent, call this from the thread of the engine
+        '''
+        engine = self.engine
+        inbox = self.inbox
+        while inbox:
+            kind, fields = inbox.popleft()
+            if kind == PIECE:
+                key, index, row, column, cleared = fields
+                orientation = ORIENTATIONS[KEYS[key]][index]
+                line_numbers = self.opponent.place(orientation.masks, row, column)
+                if sum(1 << (line - row) for line in line_numbers) != cleared:
+                    self.desyncs += 1
+                if line_numbers:
+                    self.opponent.clear(line_numbers)
+                self.opponent_pieces += 1
+                self.opponent_lines += len(line_numbers)
+            elif kind == ATTACK:
+                lines, hole = fields
+                # Due GARBAGE_DELAY after the opponent sent it, which was about the latency ago
+                delay = max(0, GARBAGE_DELAY - (self.latency or 0))
+                engine.receive_garbage(lines, hole, engine.clock() + delay/1000)
+                self.sent['received'] += lines
+            elif kind == GARBAGE:
+                self.opponent.add_garbage(*fields)
+            elif kind == LOSE:
+                if self.state == 'playing':
+                    self.state = 'won'
+            elif kind == HELLO:
+                version, width, height, spawn_rows = fields
+                if (version, width, height, spawn_rows) != (VERSION, engine.board_width,
+                                                           engine.board_height, engine.spawn_rows):
+                    print('The opponent plays version {} on a {}x{} board with {} spawn rows'.format(
+                            version, width, height, spawn_rows))
+                    self.state = 'closed'
+                    self.close()
+                elif self.state == 'waiting':
+                    self.state = 'playing'
+            elif kind is None: # the connection was lost
+                if self.state in ('waiting', 'playing'):
+                    self.state = 'closed'
+
+    def on_event(self, event, *args):
+        '''
+        Tell the opponent about the events of the engine that change the board
+        Parameters:
+            event (str): the name of the event
+            args: the arguments belonging to the event
+        '''
+        if self.state != 'playing':
+            return
+        engine = self.engine
+        if event == 'lock': # the rows the piece completed are still on the board
+            piece = args[0]
+            rows = engine.bitboard.rows
+            full = engine.bitboard.full
+            orientation = piece.orientation
+            cleared = sum(1 << y for y in range(orientation.height) if rows[piece.row + y] == full)
+            self.send(PIECE, KEYS.index(orientation.key), orientation.index,
+                      piece.row, piece.column, cleared)
+        elif event == 'attack':
+            lines = args[0]
+            self.send(ATTACK, lines, self.rng.randrange(engine.board_width))
+            self.sent['sent'] += lines
+        elif event == 'garbage':
+            self.send(GARBAGE, *args)
+        elif event == 'lose':
+            self.send(LOSE)
+            self.state = 'lost'
+
+    def pending(self):
+        '''
+        Returns the number of garbage lines that are waiting to rise
+        '''
+        return sum(lines for lines, hole, due in self.engine.garbage)
+
+    def status(self):
+        '''
+        Returns a few lines of text on the opponent and the connection
+        '''
+        if self.state == 'waiting':
+            return 'Waiting for\nthe opponent'
+        if self.state == 'closed':
+            return 'The opponent\nleft'
+        lines = ['You win!' if self.state == 'won' else 'Opponent:',
+                 '{} lines, {} high'.format(self.opponent_lines,
+                                            self.opponent.height - min(self.opponent.tops)),
+                 'Garbage: {}'.format(self.pending())]
+        if self.latency is not None:
+            lines.append('Ping: {:.0f}±{:.0f} ms'.format(self.latency*2, self.jitter))
+        return '\n'.join(lines)
+
+    def report(self):
+        '''
+        Returns a dict with the lines and bytes sent, the garbage received and the latency
+        '''
+        round_trips = self.round_trips.summary()
+        pieces = self.engine.pieces
+        return {'state':self.state,
+                'pieces':pieces,
+                'lines':self.engine.cleared_lines,
+                'opponent_pieces':self.opponent_pieces,
+                'opponent_lines':self.opponent_lines,
+                'garbage_sent':self.sent['sent'],
+                'garbage_received':self.sent['received'],
+                'bytes_per_piece':self.sent['bytes']/pieces if pieces else 0,
+                'latency_ms':self.latency or 0,
+                'jitter_ms':self.jitter,
+                'round_trip_p50_ms':round_trips['p50_ms'],
+                'round_trip_p99_ms':round_trips['p99_ms'],
+                'desyncs':self.desyncs}
+
+async def play(versus, policy, seed, piece_time):
+    '''
+    Play a headless versus game with a policy on a new engine, one piece every
+    piece_time seconds, until one of the players loses or the connection is lost
+    Parameters:
+        versus (Versus): the versus game, connected on the running event loop
+        policy (function): a policy from policies.py
+        seed (int): the seed of the game, the policy draws from seed ^ POLICY_SEED
+        piece_time (float): the number of seconds per piece
+    '''
+    engine = versus.engine
+    rng = random.Random(seed ^ POLICY_SEED)
+    while versus.state == 'waiting':
+        versus.poll()
+        await asyncio.sleep(WAIT_POLL/1000)
+    while versus.state == 'playing':
+        engine.tick() # spawns the next piece
+        for action in policy(engine, rng):
+            engine.step(action)
+            if not engine.piece_is_active:
+                break
+        if engine.piece_is_active:
+            engine.step('snap_down')
+        await asyncio.sleep(piece_time)
+        versus.poll()
+
+def main(argv=None):
+    '''
+    Plays a headless versus game from the command line against another process
+    Parameter:
+        argv (list): the command line arguments, defaulting to sys.argv[1:]
+    '''
+    parser = argparse.ArgumentParser(description='Play a headless Tetris versus game over TCP')
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument('--listen', type=int, metavar='PORT',
+                       help='wait for the opponent on this port')
+    group.add_argument('--connect', metavar='HOST:PORT', help='connect to a waiting opponent')
+    parser.add_argument('--policy', default='flat', help='a policy from policies.py or module:function')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the pieces, the policy and the garbage')
+    parser.add_argument('--piece-ms', type=int, default=100, help='milliseconds per piece')
+    parser.add_argument('--width', type=int, default=10, help='number of columns of the board')
+    parser.add_argument('--height', type=int, default=24, help='number of rows of the board')
+    args = parser.parse_args(argv)
+    if args.listen is not None:
+        host, port = '0.0.0.0', args.listen
+    else:
+        host, _, port = args.connect.rpartition(':')
+        try:
+            port = int(port)
+        except ValueError:
+            port = None
+        if not host or port is None or not 0 < port < 65536:
+            parser.error('--connect needs HOST:PORT')
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    engine = TetrisEngine(seed=args.seed, clock=loop.time,
+                          board_width=args.width, board_height=args.height)
+    versus = Versus(engine, args.seed ^ GARBAGE_SEED)
+    loop.run_until_complete(versus.open(host, port, args.listen is not None))
+    loop.run_until_complete(play(versus, load_policy(args.policy), args.seed, args.piece_ms/1000))
+    versus.close()
+    versus.pinging.cancel()
+    loop.run_until_complete(asyncio.sleep(0.1)) # let the last messages go out
+    loop.close()
+    for name, value in versus.report().items():
+        print('{:>18}: {}'.format(name, round(value, 3) if isinstance(value, float) else value))
+    return 0 if versus.state == 'won' else 1
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))